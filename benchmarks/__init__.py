@@ -0,0 +1 @@
+"""Offline benchmarks and load tests against local stand-ins for the upstream APIs."""
@@ -0,0 +1,249 @@
+"""
+Local stand-in for the xAI (OpenAI-compatible) and Langflow APIs.
+
+One HTTP server answers both:
+
+    POST /v1/chat/completions                    chat completions, optionally streamed as SSE
+    POST /lf/<langflow id>/api/v1/run/<endpoint> flow runs, streamed as NDJSON with ?stream=true
+    GET  /stats                                  request counters
+
+Latency, 429 injection and streaming speed are configurable, so the client
+stack (pooling, rate limiting, retries, coalescing, streaming) can be
+exercised offline:
+
+    python -m benchmarks.fake_servers --port 8089 --latency 0.3 --rate-limit-ratio 0.05
+    XAI_BASE_URL=http://127.0.0.1:8089/v1 LANGFLOW_BASE_URL=http://127.0.0.1:8089 streamlit run main.py
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+_FLOW_PATH = re.compile(r"^(?:/lf/[^/]+)?/api/v1/run/[^/]+$")
+
+_REPLY = (
+    "Thank you for your report. The responsible ministry has been notified and "
+    "will review the issue, publish an update and follow up with the affected community."
+)
+
+
+@dataclass
+class FakeConfig:
+    """
+    Behaviour of the fake APIs.
+
+    Attributes:
+        latency (float): Seconds before the first byte of every response.
+        jitter (float): Extra random latency, uniformly up to this many seconds.
+        rate_limit_ratio (float): Fraction of requests answered with a 429.
+        retry_after (float | None): Retry-After sent with 429s, in seconds.
+        chunk_delay (float): Seconds between streamed chunks.
+        reply_words (int): Length of every reply in words.
+    """
+
+    latency: float = 0.1
+    jitter: float = 0.0
+    rate_limit_ratio: float = 0.0
+    retry_after: Optional[float] = 1.0
+    chunk_delay: float = 0.005
+    reply_words: int = 40
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is expected, not an error
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class FakeServer:
+    """
+    Fake xAI and Langflow APIs served from a background thread.
+
+    Use as a context manager; ``url`` is the server root, ``xai_url`` the
+    OpenAI-compatible base URL.
+    """
+
+    def __init__(self, config: Optional[FakeConfig] = None, host="127.0.0.1", port=0):
+        self.config = config or FakeConfig()
+        self.counts = {"chat": 0, "flow": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self._server = _QuietServer((host, port), _make_handler(self))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def xai_url(self) -> str:
+        return f"{self.url}/v1"
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve(self) -> None:
+        """Serve in the calling thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def reply_chunks(self) -> list:
+        words = (_REPLY.split() * (self.config.reply_words // len(_REPLY.split()) + 1))[: self.config.reply_words]
+        return [word + " " for word in words]
+
+
+def _make_handler(server: FakeServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if urlparse(self.path).path == "/stats":
+                self._send_json(200, server.counts)
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            request = json.loads(body or b"{}")
+            config = server.config
+            time.sleep(config.latency + random.uniform(0, config.jitter))
+
+            if random.random() < config.rate_limit_ratio:
+                server.count("rate_limited")
+                headers = {"Retry-After": f"{config.retry_after:g}"} if config.retry_after is not None else {}
+                self._send_json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}}, headers)
+            elif url.path == "/v1/chat/completions":
+                server.count("chat")
+                if request.get("stream"):
+                    self._stream_chat(request)
+                else:
+                    self._send_json(200, self._completion(request))
+            elif _FLOW_PATH.match(url.path):
+                server.count("flow")
+                if parse_qs(url.query).get("stream") == ["true"]:
+                    self._stream_flow()
+                else:
+                    self._send_json(200, _flow_response("".join(server.reply_chunks()).strip()))
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def _completion(self, request: dict) -> dict:
+            text = "".join(server.reply_chunks()).strip()
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 20, "completion_tokens": len(text.split()), "total_tokens": 20 + len(text.split())},
+            }
+
+        def _stream_chat(self, request: dict) -> None:
+            self._start_chunked("text/event-stream")
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            for chunk in server.reply_chunks():
+                event = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(event)}\n\n")
+                time.sleep(server.config.chunk_delay)
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("")
+
+        def _stream_flow(self) -> None:
+            self._start_chunked("application/x-ndjson")
+            chunks = server.reply_chunks()
+            for chunk in chunks:
+                self._write_chunk(json.dumps({"event": "token", "data": {"chunk": chunk}}) + "\n")
+                time.sleep(server.config.chunk_delay)
+            result = _flow_response("".join(chunks).strip())
+            self._write_chunk(json.dumps({"event": "end", "data": {"result": result}}) + "\n")
+            self._write_chunk("")
+
+        def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _start_chunked(self, content_type: str) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+        def _write_chunk(self, text: str) -> None:
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def _flow_response(text: str) -> dict:
+    return {"outputs": [{"outputs": [{"results": {"message": {"text": text}}}]}]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve fake xAI and Langflow APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=FakeConfig.latency)
+    parser.add_argument("--jitter", type=float, default=FakeConfig.jitter)
+    parser.add_argument("--rate-limit-ratio", type=float, default=FakeConfig.rate_limit_ratio)
+    parser.add_argument("--retry-after", type=float, default=FakeConfig.retry_after)
+    parser.add_argument("--chunk-delay", type=float, default=FakeConfig.chunk_delay)
+    parser.add_argument("--reply-words", type=int, default=FakeConfig.reply_words)
+    args = parser.parse_args(argv)
+
+    config = FakeConfig(args.latency, args.jitter, args.rate_limit_ratio, args.retry_after, args.chunk_delay, args.reply_words)
+    server = FakeServer(config, args.host, args.port)
+    print(f"Fake APIs on {server.url} (xAI base URL {server.xai_url}); press Ctrl+C to stop")
+    server.serve()
+
+
+if __name__ == "__main__":
+    main()
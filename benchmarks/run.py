@@ -0,0 +1,337 @@
+"""
+Load-test harness for the client stack, run against the fake APIs.
+
+    python -m benchmarks.run [--scenario flow summarize ...] [--requests 200] [--concurrency 16]
+                             [--latency 0.1] [--rate-limit-ratio 0.05] [--hot] [--json results.json]
+                             [--baseline baseline.json --tolerance 0.25]
+
+Each scenario runs in a fresh interpreter with its own fake server, so peak
+RSS is per scenario and no warm state leaks between them. The response
+cache and FAQ index are disabled unless ``--cache`` is given, and every
+request carries distinct input unless ``--hot`` is given (identical inputs
+exercise single-flight coalescing instead). Rate limits default to far
+above the offered load so the numbers measure the client, not the bucket.
+
+Reports p50/p95/p99 latency (and time to first chunk for streaming
+scenarios), throughput and peak RSS. With ``--baseline`` the run exits
+non-zero if any scenario's p95 or throughput is worse than the baseline by
+more than ``--tolerance``, for use in CI.
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.fake_servers import FakeConfig, FakeServer
+
+SCENARIOS = ("encode", "extract", "summarize", "insights", "summarize_stream", "flow", "flow_stream")
+
+SAMPLE_TEXT = (
+    "The drainage channel along the market road has been blocked for three weeks. "
+    "Rainwater now floods the shops and the clinic entrance every afternoon, and "
+    "residents report mosquitoes breeding in the stagnant water."
+)
+SAMPLE_QUESTION = "What initiatives exist for reducing unemployment among young graduates?"
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, in MiB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(sorted_values: list, q: float) -> Optional[float]:
+    """Linearly interpolated ``q``-th percentile (0-100) of sorted values."""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _synthetic_image(path: Optional[str]):
+    if path:
+        return path
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    import io
+
+    # Smooth noise upscaled to photo size, so it compresses like a photo and
+    # downscaling and recompression do real work
+    image = Image.effect_noise((750, 500), 48).resize((3000, 2000), Image.BILINEAR)
+    image = Image.merge("RGB", (image, image.transpose(Image.FLIP_LEFT_RIGHT), image.transpose(Image.FLIP_TOP_BOTTOM)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def build_scenario(name: str, hot: bool, image_path: Optional[str]) -> Optional[Callable]:
+    """
+    Build the function one request of a scenario runs.
+
+    Args:
+        name (str): Scenario name from ``SCENARIOS``.
+        hot (bool): Send identical input on every request.
+        image_path (str | None): Image for the encode scenario.
+
+    Returns:
+        Callable | None: ``fn(i)`` returning None, or a generator for streaming
+        scenarios; None if the scenario cannot run here.
+    """
+    # Imported after the environment points the clients at the fake server
+    from helpers import api_utils
+    from helpers.flow_utils import ENDPOINT, FlowStream, run_flow_with_backoff
+    from helpers.image_utils import encode_image
+
+    def text(i: int) -> str:
+        return SAMPLE_TEXT if hot else f"{SAMPLE_TEXT} (report {i})"
+
+    def question(i: int) -> str:
+        return SAMPLE_QUESTION if hot else f"{SAMPLE_QUESTION} (inquiry {i})"
+
+    if name == "encode":
+        image = _synthetic_image(image_path)
+        if image is None:
+            return None
+        return lambda i: encode_image(image)
+    if name == "extract":
+        # The fake server does not decode images, so a random payload of a typical size will do
+        image_base64 = base64.b64encode(os.urandom(150_000)).decode("ascii")
+        return lambda i: api_utils.extract_text_from_image(image_base64 if hot else f"{image_base64[:-8]}{i:08d}")
+    if name == "summarize":
+        return lambda i: api_utils.summarize_text(text(i))
+    if name == "insights":
+        return lambda i: api_utils.generate_insights(text(i))
+    if name == "summarize_stream":
+        return lambda i: api_utils.stream_summarize_text(text(i))
+    if name == "flow":
+        return lambda i: run_flow_with_backoff(question(i), ENDPOINT, "bench-token")
+    if name == "flow_stream":
+        return lambda i: iter(FlowStream(question(i), ENDPOINT, "bench-token"))
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def run_scenario(name: str, fn: Callable, requests: int, concurrency: int) -> dict:
+    """
+    Drive a scenario at fixed concurrency and summarize the results.
+
+    Args:
+        name (str): Scenario name.
+        fn (Callable): ``fn(i)`` performing request ``i``; a returned iterator is consumed.
+        requests (int): Number of requests.
+        concurrency (int): Requests in flight at once.
+
+    Returns:
+        dict: Counts, latency percentiles in milliseconds, throughput and peak RSS.
+    """
+    latencies, first_chunks, errors = [], [], Counter()
+    errors_lock = threading.Lock()
+
+    def one(i: int) -> None:
+        start = time.perf_counter()
+        try:
+            result = fn(i)
+            if hasattr(result, "__next__"):
+                next(result, None)
+                first_chunks.append(time.perf_counter() - start)
+                for _ in result:
+                    pass
+        except Exception as e:
+            with errors_lock:
+                errors[type(e).__name__] += 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    first_chunks.sort()
+    summary = {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": dict(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource else None,
+    }
+    for q in (50, 95, 99):
+        value = percentile(latencies, q)
+        summary[f"p{q}_ms"] = round(value * 1000, 1) if value is not None else None
+    if first_chunks:
+        summary["first_chunk_p50_ms"] = round(percentile(first_chunks, 50) * 1000, 1)
+        summary["first_chunk_p95_ms"] = round(percentile(first_chunks, 95) * 1000, 1)
+    if latencies:
+        summary["mean_ms"] = round(statistics.fmean(latencies) * 1000, 1)
+    return summary
+
+
+def configure_environment(server: FakeServer, workdir: str, rps: float, cache: bool) -> None:
+    """Point the clients at the fake server and isolate caches, before helpers are imported."""
+    os.environ.update({
+        "XAI_BASE_URL": server.xai_url,
+        "LANGFLOW_BASE_URL": server.url,
+        "XAI_API_KEY": "bench",
+        "ENGAGEGOV_CACHE_PATH": os.path.join(workdir, "responses.sqlite3"),
+        "ENGAGEGOV_FAQ_DIR": os.path.join(workdir, "faq"),
+        "ENGAGEGOV_FAQ_LEARN": "1" if cache else "0",
+        "ENGAGEGOV_XAI_RPS": str(rps),
+        "ENGAGEGOV_XAI_BURST": str(rps),
+        "ENGAGEGOV_LANGFLOW_RPS": str(rps),
+        "ENGAGEGOV_LANGFLOW_BURST": str(rps),
+    })
+    if not cache:
+        os.environ["ENGAGEGOV_CACHE_TTL"] = "0"
+        os.environ["ENGAGEGOV_FAQ_THRESHOLD"] = "2"  # Above any cosine similarity
+    os.environ.pop("ENGAGEGOV_RATE_LIMIT_PATH", None)
+
+
+def run_in_process(args) -> list:
+    """Run the selected scenarios in this interpreter against one fake server."""
+    config = FakeConfig(args.latency, args.jitter, args.rate_limit_ratio, args.retry_after, args.chunk_delay)
+    results = []
+    with FakeServer(config) as server, tempfile.TemporaryDirectory() as workdir:
+        configure_environment(server, workdir, args.rps, args.cache)
+        for name in args.scenario:
+            fn = build_scenario(name, args.hot, args.image)
+            if fn is None:
+                print(f"Skipping {name}: needs Pillow or --image", file=sys.stderr)
+                continue
+            for i in range(args.warmup):
+                _drain(fn(args.requests + i))
+            before = dict(server.counts)
+            summary = run_scenario(name, fn, args.requests, args.concurrency)
+            summary["upstream_calls"] = server.counts["chat"] + server.counts["flow"] - before["chat"] - before["flow"]
+            summary["rate_limited"] = server.counts["rate_limited"] - before["rate_limited"]
+            results.append(summary)
+    return results
+
+
+def _drain(result) -> None:
+    if hasattr(result, "__next__"):
+        for _ in result:
+            pass
+
+
+def run_isolated(args) -> list:
+    """Run each scenario in a fresh interpreter and collect the results."""
+    results = []
+    for name in args.scenario:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            output = f.name
+        command = [
+            sys.executable, "-m", "benchmarks.run", "--in-process", "--scenario", name, "--json", output,
+            "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--warmup", str(args.warmup),
+            "--latency", str(args.latency), "--jitter", str(args.jitter),
+            "--rate-limit-ratio", str(args.rate_limit_ratio), "--retry-after", str(args.retry_after),
+            "--chunk-delay", str(args.chunk_delay), "--rps", str(args.rps), "--quiet",
+        ]
+        command += ["--hot"] * args.hot + ["--cache"] * args.cache + (["--image", args.image] if args.image else [])
+        try:
+            subprocess.run(command, check=True)
+            with open(output, encoding="utf-8") as f:
+                results.extend(json.load(f)["results"])
+        finally:
+            os.unlink(output)
+    return results
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """
+    Find scenarios that regressed against a baseline.
+
+    Args:
+        results (list): Scenario summaries from this run.
+        baseline (list): Scenario summaries from an earlier run.
+        tolerance (float): Allowed relative slowdown, e.g. 0.25 for 25%.
+
+    Returns:
+        list: One message per regression.
+    """
+    previous = {summary["scenario"]: summary for summary in baseline}
+    regressions = []
+    for summary in results:
+        before = previous.get(summary["scenario"])
+        if not before:
+            continue
+        if before.get("p95_ms") and summary.get("p95_ms") and summary["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{summary['scenario']}: p95 {before['p95_ms']} -> {summary['p95_ms']} ms")
+        if before.get("throughput_rps") and (summary.get("throughput_rps") or 0) < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{summary['scenario']}: throughput {before['throughput_rps']} -> {summary['throughput_rps']} req/s")
+    return regressions
+
+
+def print_table(results: list) -> None:
+    columns = ("scenario", "ok", "p50_ms", "p95_ms", "p99_ms", "first_chunk_p50_ms", "throughput_rps", "upstream_calls", "rate_limited", "peak_rss_mb")
+    print("  ".join(f"{column:>18}" for column in columns))
+    for summary in results:
+        print("  ".join(f"{str(summary.get(column, '-')):>18}" for column in columns))
+        if summary["errors"]:
+            print(f"{'':>18}  errors: {summary['errors']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the client stack against fake upstream APIs.")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=2, help="Uncounted requests before each scenario")
+    parser.add_argument("--latency", type=float, default=FakeConfig.latency, help="Fake server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=FakeConfig.jitter)
+    parser.add_argument("--rate-limit-ratio", type=float, default=FakeConfig.rate_limit_ratio, help="Fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=FakeConfig.retry_after)
+    parser.add_argument("--chunk-delay", type=float, default=FakeConfig.chunk_delay)
+    parser.add_argument("--rps", type=float, default=10_000, help="Client-side rate limit for both services")
+    parser.add_argument("--hot", action="store_true", help="Send identical input on every request")
+    parser.add_argument("--cache", action="store_true", help="Leave the response cache and FAQ index on")
+    parser.add_argument("--image", help="Image for the encode scenario (default: a synthetic 3000x2000 JPEG)")
+    parser.add_argument("--in-process", action="store_true", help="Run all scenarios in this interpreter")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--quiet", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    results = run_in_process(args) if args.in_process else run_isolated(args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline", "quiet")}, "results": results}, f, indent=2)
+    if args.quiet:
+        return
+    print_table(results)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for message in regressions:
+            print(f"Regression: {message}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
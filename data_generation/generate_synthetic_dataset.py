@@ -1,57 +1,188 @@
-from langchain.prompts import PromptTemplate
-from langchain.llms import OpenAI
+"""
+Generate a labelled (query, ministry) dataset for the ministry router.
+
+Requests fan out concurrently across ministries, results are appended to a
+JSONL file as they arrive (same shape as data/synthetic_dataset.jsonl), and
+near-duplicate queries are dropped with MinHash. The output file is the
+checkpoint: re-running the command tops each ministry up to the requested
+count instead of starting over.
+
+Run from the repository root:
+    python -m data_generation.generate_synthetic_dataset --per-ministry 4000 -o data/synthetic_dataset.jsonl
+"""
+import argparse
 import json
+import os
+import random
+import re
+import sys
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-# Define ministries and their functions
-ministries = {
-    "Ministry of Finance": "Manages public finances, national budget, taxation, fiscal policy, and economic growth initiatives. Oversees state revenues and expenditures.",
-    "Ministry of Health": "Oversees public health services, hospitals, health education, disease prevention, and health policy implementation.",
-    "Ministry of Education": "Responsible for developing and managing the education system, including schools, universities, curriculum standards, and educational policies.",
-    "Ministry of Defense": "Manages national defense, armed forces, military policy, and often disaster response capabilities.",
-    "Ministry of Foreign Affairs": "Handles international relations, diplomacy, treaties, and representation in foreign countries and international organizations.",
-    "Ministry of Interior (or Home Affairs)": "Responsible for internal security, law enforcement, immigration, civil defense, and local governance.",
-    "Ministry of Justice": "Oversees the judicial system, legal policies, correctional facilities, and law reform initiatives.",
-    "Ministry of Agriculture": "Focuses on agricultural development, food security, rural development, and support for farmers.",
-    "Ministry of Environment": "Manages environmental conservation, climate change policy, wildlife protection, and sustainable development.",
-    "Ministry of Transport": "Oversees transportation infrastructure (roads, railways, airports, ports) and transportation safety regulations.",
-    "Ministry of Labor (or Employment)": "Focuses on employment policies, labor rights, workplace safety, and skill development.",
-    "Ministry of Energy": "Manages energy resources, policies, and sustainability efforts, including renewable energy initiatives.",
-    "Ministry of Industry and Trade": "Promotes industrial growth, international trade, export/import regulations, and support for businesses.",
-    "Ministry of Housing (or Urban Development)": "Addresses urban planning, housing development, and public infrastructure in cities and rural areas.",
-    "Ministry of Culture": "Promotes cultural heritage, arts, and national identity. Manages museums, cultural festivals, and historical preservation.",
-    "Ministry of Tourism": "Develops tourism policies, promotes the country as a travel destination, and oversees tourism infrastructure.",
-    "Ministry of Social Welfare": "Provides social services, welfare programs, poverty alleviation, and support for marginalized groups.",
-    "Ministry of Science and Technology": "Promotes scientific research, technological development, and innovation in various sectors.",
-    "Ministry of Telecommunications/IT": "Manages communication infrastructure, internet policies, and IT development strategies.",
-    "Ministry of Youth and Sports": "Focuses on youth development programs and the promotion of sports and physical activities.",
-    "Ministry of Public Works": "Manages public infrastructure projects such as roads, bridges, and government buildings.",
-    "Ministry of Immigration (or Citizenship)": "Oversees immigration, citizenship, and residency policies.",
-    "Ministry of Defense Production": "Oversees the production and procurement of military equipment and supplies (where relevant).",
-    "Ministry of Water Resources": "Manages water resources, irrigation systems, and water conservation efforts.",
-}
-
-# Initialize the LLM
-llm = OpenAI(model="text-davinci-003")
+from helpers.api_utils import TEXT_MODEL
+from helpers.clients import classify_grok_error, get_grok_client
+from helpers.dedup import NearDuplicateFilter
+from helpers.rate_limit import call_with_retry
+from ministry_pages.registry import MINISTRIES as ministries
 
 # Define the prompt template
-prompt_template = PromptTemplate(
-    input_variables=["ministry", "function"],
-    template="Generate 5 unique user queries related to the {ministry} and its functions. {function}",
+PROMPT_TEMPLATE = (
+    "Generate {count} unique user queries related to the {ministry} and its functions. {function}\n"
+    "Write them as {persona} would. Return one query per line, with no numbering or extra text."
 )
 
-# Generate synthetic data
-synthetic_data = []
-for ministry, function in ministries.items():
-    prompt = prompt_template.format(ministry=ministry, function=function)
-    response = llm(prompt)
-    queries = response.split("\n")  # Split the LLM's response into individual queries
-    for query in queries:
-        query = query.strip()
+# Varying who is asking keeps repeated requests from returning the same queries
+PERSONAS = [
+    "a farmer", "a university student", "a retiree", "a small business owner", "a parent",
+    "a civil servant", "a journalist", "a nurse", "a recent immigrant", "an unemployed graduate",
+    "a taxi driver", "a teacher", "a person with a disability", "a landlord", "a tourist",
+]
+
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*\u2022]|\d+[.)]|\(\d+\))\s*")
+
+
+def parse_queries(text: str) -> list:
+    """Split a model response into queries, dropping list markers and quotes."""
+    queries = []
+    for line in text.splitlines():
+        query = _LIST_MARKER_RE.sub("", line).strip().strip('"').strip()
         if query:  # Avoid empty lines
-            synthetic_data.append({"query": query, "ministry": ministry})
+            queries.append(query)
+    return queries
+
+
+def request_queries(ministry: str, function: str, count: int, temperature=1.0) -> list:
+    """
+    Ask the model for a batch of queries about one ministry.
+
+    Args:
+        ministry (str): Ministry name.
+        function (str): Description of the ministry's remit.
+        count (int): Number of queries to request.
+        temperature (float): Sampling temperature.
+
+    Returns:
+        list: Parsed queries.
+    """
+    prompt = PROMPT_TEMPLATE.format(count=count, ministry=ministry, function=function, persona=random.choice(PERSONAS))
+    response = call_with_retry(
+        lambda: get_grok_client().chat.completions.create(
+            model=TEXT_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=40 * count,
+            n=1
+        ),
+        "xai",
+        classify=classify_grok_error,
+    )
+    return parse_queries(response.choices[0].message.content)
+
+
+def load_checkpoint(output_path: str, dedup: NearDuplicateFilter) -> Counter:
+    """
+    Count the queries already generated per ministry and seed the dedup filter with them.
+
+    Args:
+        output_path (str): JSONL output of a previous run.
+        dedup (NearDuplicateFilter): Filter to seed.
+
+    Returns:
+        Counter: Queries per ministry.
+    """
+    counts = Counter()
+    if not os.path.exists(output_path):
+        return counts
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            dedup.add(record["query"])
+            counts[record["ministry"]] += 1
+    return counts
+
+
+def generate(output_path: str, per_ministry: int, batch_size=25, workers=8, selected=None) -> Counter:
+    """
+    Generate queries until every ministry has ``per_ministry`` unique ones.
+
+    Each ministry gets at most three times the requests it would need
+    without duplicates, so a model that keeps repeating itself cannot loop
+    forever.
+
+    Args:
+        output_path (str): JSONL file to append to.
+        per_ministry (int): Target number of queries per ministry.
+        batch_size (int): Queries requested per API call.
+        workers (int): Concurrent API calls.
+        selected (list | None): Ministries to generate for; all by default.
+
+    Returns:
+        Counter: Final number of queries per ministry.
+    """
+    selected = selected or list(ministries)
+    dedup = NearDuplicateFilter()
+    counts = load_checkpoint(output_path, dedup)
+    budget = {m: 3 * -(-max(0, per_ministry - counts[m]) // batch_size) for m in selected}
+    inflight = Counter()
+    futures = {}
+    reported = sum(counts.values())
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, open(output_path, "a", encoding="utf-8") as output:
+
+        def top_up(ministry: str):
+            while counts[ministry] + inflight[ministry] * batch_size < per_ministry and budget[ministry] > 0:
+                future = pool.submit(request_queries, ministry, ministries[ministry], batch_size)
+                futures[future] = ministry
+                inflight[ministry] += 1
+                budget[ministry] -= 1
+
+        for ministry in selected:
+            top_up(ministry)
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                ministry = futures.pop(future)
+                inflight[ministry] -= 1
+                try:
+                    queries = future.result()
+                except Exception as e:
+                    print(f"{ministry}: request failed: {e}", file=sys.stderr)
+                    queries = []
+                for query in queries:
+                    if counts[ministry] >= per_ministry:
+                        break
+                    if dedup.add(query):
+                        output.write(json.dumps({"query": query, "ministry": ministry}, ensure_ascii=False) + "\n")
+                        counts[ministry] += 1
+                output.flush()
+                top_up(ministry)
+            total = sum(counts.values())
+            if total - reported >= 1000:
+                print(f"{total} queries generated", file=sys.stderr)
+                reported = total
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic (query, ministry) dataset.")
+    parser.add_argument("-o", "--output", default=os.path.join("data", "synthetic_dataset.jsonl"))
+    parser.add_argument("--per-ministry", type=int, default=5, help="Unique queries to generate per ministry")
+    parser.add_argument("--batch-size", type=int, default=25, help="Queries requested per API call")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent API calls")
+    parser.add_argument("--ministry", action="append", choices=list(ministries), help="Limit to these ministries")
+    args = parser.parse_args(argv)
+
+    counts = generate(args.output, args.per_ministry, args.batch_size, args.workers, args.ministry)
+    short = [m for m in (args.ministry or ministries) if counts[m] < args.per_ministry]
+    print(f"Synthetic dataset saved to '{args.output}' ({sum(counts.values())} queries).")
+    if short:
+        print(f"Fell short of the target for: {', '.join(short)}", file=sys.stderr)
 
-# Save the dataset as labeled JSON
-with open("synthetic_dataset.json", "w") as f:
-    json.dump(synthetic_data, f, indent=4)
 
-print("Synthetic dataset saved as 'synthetic_dataset.json'.")
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,222 @@
-from dotenv import load_dotenv
-from openai import OpenAI
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 
-# Load environment variables from .env file
-load_dotenv()
-
-# Load both API keys from the .env file
-grok_api_key = os.getenv("XAI_API_KEY")
-openai_api_key = os.getenv("OPENAI_API_KEY")
+from helpers.cache import get_cache
+from helpers.clients import classify_grok_error, get_grok_client
+from helpers.image_utils import image_media_type
+from helpers.metrics import StageRecord, add_usage, annotate, bind, timed, timed_stream
+from helpers.rate_limit import call_with_retry
+from helpers.singleflight import FlightAbandoned, SingleFlight
+from helpers.text_budget import (
+    MAX_REDUCE_PASSES,
+    chunk_budget,
+    insights_budget,
+    plan_reduce,
+    plan_summary,
+    target_words,
+)
 
-# Configure the OpenAI client for xAI's Grok API
-api_key = os.getenv("XAI_API_KEY")
-client = OpenAI(
-    api_key=api_key,
-    base_url="https://api.x.ai/v1",
+# Models and prompts used by the helpers below; they are part of the cache key.
+# ``{words}`` is filled with a length that fits the request's max_tokens (see ``length_prompt``).
+VISION_MODEL = "grok-vision-beta"
+TEXT_MODEL = "grok-beta"
+OCR_PROMPT = "Extract and give me the text in the image provided, and nothing else no intro"
+SUMMARY_PROMPT = "Summarize the following text in at most {words} words:\n\n"
+INSIGHTS_PROMPT = "Based on the following summary, generate actionable insights in at most {words} words:\n\n"
+CHUNK_PROMPT = (
+    "Summarize the following part of a longer document in at most {words} words, "
+    "keeping names, places, dates and figures:\n\n"
+)
+REDUCE_PROMPT = (
+    "Combine the following summaries of consecutive parts of one document into a single summary "
+    "of at most {words} words:\n\n"
 )
 
+# Chunks of a long document summarized at once by one sync caller
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("ENGAGEGOV_SUMMARY_MAP_CONCURRENCY", 4))
+
+# Identical completions in flight at once, keyed by cache key; shared with the async pipeline
+flights = SingleFlight()
+
+
+def cache_key(model: str, prompt: str, payload: str, temperature=0.7, max_tokens=500) -> str:
+    """
+    Build the response-cache key for a completion request.
+
+    Args:
+        model (str): Grok model name.
+        prompt (str): Instruction part of the request.
+        payload (str): Input the instruction is applied to (text or base64 image).
+        temperature (float): Sampling temperature.
+        max_tokens (int): Maximum length of the completion.
+
+    Returns:
+        str: Cache key.
+    """
+    return get_cache().make_key(model, prompt, {"temperature": temperature, "max_tokens": max_tokens}, payload)
+
+def length_prompt(prompt: str, max_tokens: int) -> str:
+    """Fill a prompt's ``{words}`` with a length that fits within ``max_tokens``."""
+    return prompt.format(words=target_words(max_tokens))
+
+def image_messages(image_base64: str) -> list:
+    """Build the chat messages asking the vision model to transcribe an image."""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": OCR_PROMPT
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{image_media_type(image_base64)};base64,{image_base64}"
+                    }
+                }
+            ]
+        }
+    ]
+
+def text_messages(prompt: str, text: str) -> list:
+    """Build the chat messages applying a text prompt to some input."""
+    return [
+        {
+            "role": "user",
+            "content": f"{prompt}{text}"
+        }
+    ]
+
+def _complete(model: str, prompt: str, payload: str, messages: list, temperature=0.7, max_tokens=500) -> str:
+    """
+    Run a chat completion, serving repeated requests from the response cache.
+
+    Concurrent identical requests are coalesced: one caller makes the
+    request and the others wait for its result. A reply cut off at
+    ``max_tokens`` is returned but not cached, so it is not served again.
+
+    Args:
+        model (str): Grok model name.
+        prompt (str): Instruction part of the request.
+        payload (str): Input the instruction is applied to (text or base64 image).
+        messages (list): Chat messages to send on a cache miss.
+        temperature (float): Sampling temperature.
+        max_tokens (int): Maximum length of the completion.
+
+    Returns:
+        str: Completion text.
+    """
+    cache = get_cache()
+    key = cache_key(model, prompt, payload, temperature, max_tokens)
+    cached = cache.get(key)
+    if cached is not None:
+        annotate(cache_hit=True)
+        return cached
+    led = False
+
+    def fetch() -> str:
+        nonlocal led
+        led = True
+        # A flight for this key may have finished between the lookup above and joining
+        cached = cache.get(key)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
+        response = call_with_retry(
+            lambda: get_grok_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                n=1
+            ),
+            "xai",
+            classify=classify_grok_error,
+        )
+        add_usage(model, response.usage)
+        choice = response.choices[0]
+        content = choice.message.content.strip()
+        if choice.finish_reason != "length":
+            cache.set(key, content)
+        return content
+
+    content = flights.do(key, fetch)
+    annotate(coalesced=not led)
+    return content
+
+def _stream_complete(
+    model: str, prompt: str, payload: str, messages: list, temperature=0.7, max_tokens=500, record: Optional[StageRecord] = None
+) -> Iterator[str]:
+    """
+    Streaming variant of ``_complete``, yielding text chunks as they arrive.
+
+    A cached response is yielded as a single chunk. The assembled text is
+    cached once the stream finishes, so an interrupted stream is not cached,
+    and neither is one cut off at ``max_tokens``.
+    Callers arriving while an identical request is in flight receive its
+    full text as a single chunk when it completes. Cache hits, coalescing
+    and retries are noted on ``record`` when one is given.
+    """
+    record = record or StageRecord("stream")
+    cache = get_cache()
+    key = cache_key(model, prompt, payload, temperature, max_tokens)
+    while True:
+        cached = cache.get(key)
+        if cached is not None:
+            record.cache_hit = True
+            yield cached
+            return
+        flight = flights.join(key)
+        if flight.leader:
+            break
+        try:
+            text = flight.wait()
+        except FlightAbandoned:
+            continue
+        record.coalesced = True
+        yield text
+        return
+
+    try:
+        with bind(record):
+            stream = call_with_retry(
+                lambda: get_grok_client().chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    n=1,
+                    stream=True
+                ),
+                "xai",
+                classify=classify_grok_error,
+            )
+        record.model = model
+        parts, finish_reason = [], None
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if not parts:
+                delta = delta.lstrip()
+            parts.append(delta)
+            yield delta
+        text = "".join(parts).strip()
+        if finish_reason != "length":
+            cache.set(key, text)
+        flight.resolve(text)
+    except Exception as e:
+        flight.fail(e)
+        raise
+    finally:
+        # Closing the generator early leaves followers to make their own request
+        flight.fail(FlightAbandoned(key))
+
 def extract_text_from_image(image_base64: str) -> str:
     """
     Extract text from an image using Grok Vision API.
@@ -26,54 +227,70 @@ def extract_text_from_image(image_base64: str) -> str:
     Returns:
         str: Extracted text from the image.
     """
-    response = client.chat.completions.create(
-        model="grok-vision-beta",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "Extract and give me the text in the image provided, and nothing else no intro"
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_base64}"
-                        }
-                    }
-                ]
-            }
-        ],
-        temperature=0.7,
-        max_tokens=1000,
-        n=1
-    )
-    return response.choices[0].message.content.strip()
+    with timed("extract"):
+        return _complete(VISION_MODEL, OCR_PROMPT, image_base64, image_messages(image_base64), max_tokens=1000)
+
+def _summarize_chunk(chunk: str) -> str:
+    max_tokens = chunk_budget(chunk)
+    prompt = length_prompt(CHUNK_PROMPT, max_tokens)
+    with timed("summarize_chunk"):
+        return _complete(TEXT_MODEL, prompt, chunk, text_messages(prompt, chunk), max_tokens=max_tokens)
+
+def summary_request(text: str) -> tuple:
+    """
+    Prepare the final summary request for a text, summarizing its chunks first if it is too long.
+
+    The text is normalized (see ``text_budget.normalize_ocr_text``). Text
+    over the prompt budget is split into chunks that are summarized
+    concurrently; the partial summaries, in order, become the input of the
+    final request.
+
+    Args:
+        text (str): Extracted text.
+
+    Returns:
+        tuple: ``(prompt, payload, max_tokens)`` for the final completion.
+    """
+    plan = plan_summary(text)
+    prompt, payload, chunks = SUMMARY_PROMPT, plan.text, plan.chunks
+    for _ in range(MAX_REDUCE_PASSES):
+        if not chunks:
+            break
+        with ThreadPoolExecutor(min(len(chunks), SUMMARY_MAP_CONCURRENCY)) as executor:
+            partials = list(executor.map(_summarize_chunk, chunks))
+        prompt = REDUCE_PROMPT
+        payload, chunks = plan_reduce(partials)
+    return length_prompt(prompt, plan.max_tokens), payload, plan.max_tokens
+
+def insights_request(summary: str) -> tuple:
+    """
+    Prepare the insights request for a summary.
+
+    Args:
+        summary (str): Summary of the text.
+
+    Returns:
+        tuple: ``(prompt, max_tokens)`` for the completion.
+    """
+    max_tokens = insights_budget(summary)
+    return length_prompt(INSIGHTS_PROMPT, max_tokens), max_tokens
 
 def summarize_text(text: str) -> str:
     """
     Summarize extracted text using Grok API.
 
+    Long text is summarized in chunks first, and the summary's length
+    limit grows with the text's (see ``summary_request``).
+
     Args:
         text (str): Extracted text.
 
     Returns:
         str: Summary of the text.
     """
-    response = client.chat.completions.create(
-        model="grok-beta",
-        messages=[
-            {
-                "role": "user",
-                "content": f"Summarize the following text:\n\n{text}"
-            }
-        ],
-        temperature=0.7,
-        max_tokens=500,
-        n=1
-    )
-    return response.choices[0].message.content.strip()
+    with timed("summarize"):
+        prompt, payload, max_tokens = summary_request(text)
+        return _complete(TEXT_MODEL, prompt, payload, text_messages(prompt, payload), max_tokens=max_tokens)
 
 def generate_insights(summary: str) -> str:
     """
@@ -85,16 +302,46 @@ def generate_insights(summary: str) -> str:
     Returns:
         str: Actionable insights derived from the summary.
     """
-    response = client.chat.completions.create(
-        model="grok-beta",
-        messages=[
-            {
-                "role": "user",
-                "content": f"Based on the following summary, generate actionable insights:\n\n{summary}"
-            }
-        ],
-        temperature=0.7,
-        max_tokens=500,
-        n=1
+    prompt, max_tokens = insights_request(summary)
+    with timed("insights"):
+        return _complete(TEXT_MODEL, prompt, summary, text_messages(prompt, summary), max_tokens=max_tokens)
+
+def stream_summarize_text(text: str) -> Iterator[str]:
+    """
+    Summarize extracted text using Grok API, streaming the summary.
+
+    Args:
+        text (str): Extracted text.
+
+    Yields:
+        str: Chunks of the summary, suitable for ``st.write_stream``.
+    """
+    def summary_stream(record: StageRecord) -> Iterator[str]:
+        # Chunks of a long text are summarized in full; only the final summary streams
+        prompt, payload, max_tokens = summary_request(text)
+        yield from _stream_complete(TEXT_MODEL, prompt, payload, text_messages(prompt, payload), max_tokens=max_tokens, record=record)
+
+    yield from timed_stream("summarize_stream", summary_stream)
+
+def stream_generate_insights(summary: str) -> Iterator[str]:
+    """
+    Generate actionable insights from a summary using Grok API, streaming the result.
+
+    Args:
+        summary (str): Summary of the text.
+
+    Yields:
+        str: Chunks of the insights, suitable for ``st.write_stream``.
+    """
+    prompt, max_tokens = insights_request(summary)
+    yield from timed_stream(
+        "insights_stream",
+        lambda record: _stream_complete(
+            TEXT_MODEL,
+            prompt,
+            summary,
+            text_messages(prompt, summary),
+            max_tokens=max_tokens,
+            record=record,
+        ),
     )
-    return response.choices[0].message.content.strip()
\ No newline at end of file
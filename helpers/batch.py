@@ -0,0 +1,228 @@
+"""
+Bulk processing of image and text reports.
+
+Usage:
+    python -m helpers.batch INPUT -o results.jsonl [--workers 16] [--concurrency 8] [--rate 5]
+
+INPUT is either a directory (images are OCR'd, summarized and analysed;
+``.txt`` files are summarized and analysed) or a JSONL file shaped like
+data/synthetic_dataset.jsonl, where each line has a ``query`` and/or an
+``image`` path relative to the file. Results are appended to the output file
+as they finish, and re-running the same command skips items that already
+succeeded, so an interrupted run picks up where it stopped.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Iterator, Optional
+
+from helpers.image_utils import encode_image
+from helpers.pipeline import (
+    agenerate_insights,
+    asummarize_text,
+    aprocess_report,
+    run_sync,
+    set_max_concurrency,
+)
+from helpers.rate_limit import BREAKER_RESET, CircuitOpenError, RetryableError
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+TEXT_EXTENSIONS = (".txt",)
+
+
+def iter_items(source: str) -> Iterator[dict]:
+    """
+    Yield work items from a directory or a JSONL file.
+
+    Args:
+        source (str): Directory or JSONL path.
+
+    Yields:
+        dict: Items with an ``id`` plus an ``image`` path and/or ``query`` text.
+    """
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                item_id = os.path.relpath(path, source)
+                extension = os.path.splitext(name)[1].lower()
+                if extension in IMAGE_EXTENSIONS:
+                    yield {"id": item_id, "image": path}
+                elif extension in TEXT_EXTENSIONS:
+                    with open(path, encoding="utf-8") as f:
+                        yield {"id": item_id, "query": f.read()}
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", f"{os.path.basename(source)}:{line_number}")
+            if item.get("image"):
+                item["image"] = os.path.join(base_dir, item["image"])
+            yield item
+
+
+def load_completed(output_path: str) -> set:
+    """
+    Read the ids of items already processed successfully.
+
+    Args:
+        output_path (str): JSONL output file of a previous run.
+
+    Returns:
+        set: Ids to skip.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written line from an interrupted run
+            if "error" not in record:
+                completed.add(record["id"])
+    return completed
+
+
+class RatePacer:
+    """Spaces out item starts so that at most ``rate`` begin per second."""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def process_item(item: dict) -> dict:
+    """
+    Run the report pipeline for one item.
+
+    Args:
+        item (dict): Work item from ``iter_items``.
+
+    Returns:
+        dict: The item (without the image path) plus its stage outputs.
+    """
+    result = {key: value for key, value in item.items() if key != "image"}
+    if item.get("image"):
+        image_base64 = await asyncio.to_thread(encode_image, item["image"])
+        async for event in aprocess_report(image_base64):
+            result[event.stage] = event.text
+    elif item.get("query"):
+        result["summary"] = await asummarize_text(item["query"])
+        result["insights"] = await agenerate_insights(result["summary"])
+    else:
+        raise ValueError("item has neither an image nor a query")
+    return result
+
+
+async def run_batch(source: str, output_path: str, workers=16, rate=None, retries=5) -> dict:
+    """
+    Process every pending item in ``source`` through a bounded worker pool.
+
+    Args:
+        source (str): Directory or JSONL path.
+        output_path (str): JSONL file results are appended to.
+        workers (int): Number of concurrent worker tasks.
+        rate (float | None): Maximum items started per second.
+        retries (int): Attempts per item while the API stays rate limited or
+            unavailable after the per-request retries of ``call_with_retry``.
+
+    Returns:
+        dict: Counts of processed, failed and skipped items.
+    """
+    completed = load_completed(output_path)
+    pacer = RatePacer(rate)
+    items: "asyncio.Queue" = asyncio.Queue(maxsize=workers * 2)
+    counts = {"processed": 0, "failed": 0, "skipped": 0}
+    started = time.monotonic()
+
+    with open(output_path, "a", encoding="utf-8") as output:
+
+        def write(record: dict):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            done = counts["processed"] + counts["failed"]
+            if done % 100 == 0:
+                elapsed = time.monotonic() - started
+                print(f"{done} items in {elapsed:.0f}s ({done / elapsed:.1f}/s)", file=sys.stderr)
+
+        async def worker():
+            while True:
+                item = await items.get()
+                if item is None:
+                    return
+                error = "upstream unavailable"
+                for attempt in range(retries):
+                    await pacer.wait()
+                    try:
+                        record = await process_item(item)
+                        counts["processed"] += 1
+                        break
+                    except CircuitOpenError as e:
+                        error = str(e)
+                        await asyncio.sleep(BREAKER_RESET)  # Wait out the breaker before trying again
+                    except RetryableError as e:
+                        error = str(e)
+                        await asyncio.sleep(min(2 ** attempt, 60))
+                    except Exception as e:
+                        record = {"id": item["id"], "error": str(e)}
+                        counts["failed"] += 1
+                        break
+                else:
+                    record = {"id": item["id"], "error": error}
+                    counts["failed"] += 1
+                write(record)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        for item in iter_items(source):
+            if item["id"] in completed:
+                counts["skipped"] += 1
+                continue
+            await items.put(item)
+        for _ in tasks:
+            await items.put(None)
+        await asyncio.gather(*tasks)
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-process image and text reports.")
+    parser.add_argument("source", help="Directory of images/.txt files, or a JSONL file")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to append results to")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent items in progress")
+    parser.add_argument("--concurrency", type=int, default=None, help="Cap on concurrent API requests")
+    parser.add_argument("--rate", type=float, default=None, help="Maximum items started per second")
+    parser.add_argument("--retries", type=int, default=5, help="Attempts per item when the API stays unavailable")
+    args = parser.parse_args(argv)
+
+    if args.concurrency:
+        set_max_concurrency(args.concurrency)
+    counts = run_sync(run_batch(args.source, args.output, args.workers, args.rate, args.retries))
+    print(
+        f"Processed {counts['processed']}, failed {counts['failed']}, skipped {counts['skipped']}.",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+# Cache configuration, overridable from the environment
+CACHE_PATH = os.getenv("ENGAGEGOV_CACHE_PATH", os.path.join(".cache", "responses.sqlite3"))
+CACHE_TTL = float(os.getenv("ENGAGEGOV_CACHE_TTL", 7 * 24 * 3600))
+CACHE_MEMORY_ITEMS = int(os.getenv("ENGAGEGOV_CACHE_MEMORY_ITEMS", 256))
+CACHE_DISK_ITEMS = int(os.getenv("ENGAGEGOV_CACHE_DISK_ITEMS", 50_000))
+
+
+class ResponseCache:
+    """
+    Two-tier, content-addressed cache for model responses.
+
+    Entries live in an in-memory LRU and in a SQLite table on disk. Both tiers
+    honour the same TTL; the disk tier is trimmed to ``max_disk_items`` by
+    evicting the least recently used rows.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = CACHE_PATH,
+        ttl: float = CACHE_TTL,
+        max_memory_items: int = CACHE_MEMORY_ITEMS,
+        max_disk_items: int = CACHE_DISK_ITEMS,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: dict, payload: Union[str, bytes]) -> str:
+        """
+        Build a cache key from the request that produced a response.
+
+        Args:
+            model (str): Model name.
+            prompt (str): Instruction sent alongside the payload.
+            params (dict): Sampling parameters (temperature, max_tokens, ...).
+            payload (str | bytes): Image bytes, base64 string or input text.
+
+        Returns:
+            str: Hex digest identifying the request.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        payload_digest = hashlib.sha256(payload).hexdigest()
+        header = json.dumps([model, prompt, params], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{header}\0{payload_digest}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response.
+
+        Args:
+            key (str): Key produced by ``make_key``.
+
+        Returns:
+            str | None: The cached response, or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = row
+                    if now - created_at <= self.ttl:
+                        self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                        self._remember(key, created_at, value)
+                        self.hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """
+        Store a response in both tiers.
+
+        Args:
+            key (str): Key produced by ``make_key``.
+            value (str): Response text.
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                self._writes += 1
+                # Trimming needs a table scan, so only do it every few writes
+                if self._writes % 64 == 0:
+                    self._evict_disk(now)
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers and reset the counters."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+            self.hits = self.memory_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Report hit/miss counters and tier sizes.
+
+        Returns:
+            dict: Counters, hit ratio and entry counts.
+        """
+        with self._lock:
+            disk_items = 0
+            if self._db is not None:
+                disk_items = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_items": disk_items,
+            }
+
+    def _remember(self, key: str, created_at: float, value: str) -> None:
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        overflow = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_disk_items
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """
+    Return the process-wide response cache, creating it on first use.
+
+    Returns:
+        ResponseCache: Shared cache instance.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
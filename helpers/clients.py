@@ -0,0 +1,145 @@
+"""
+Shared, pooled clients for the xAI (Grok) and Langflow backends.
+
+Each factory builds its client once per process; every Streamlit session,
+the async pipeline and the batch CLI reuse the same keep-alive pools.
+openai, httpx and requests are imported by the factories, so importing this
+module (and everything built on it) stays cheap until a client is needed.
+"""
+import functools
+import os
+from typing import TYPE_CHECKING, Optional
+
+from dotenv import load_dotenv
+
+from helpers.rate_limit import RetryableError, parse_retry_after
+
+if TYPE_CHECKING:
+    import requests
+    from openai import AsyncOpenAI, OpenAI
+
+# Load environment variables from .env file
+load_dotenv()
+
+XAI_BASE_URL = os.getenv("XAI_BASE_URL", "https://api.x.ai/v1")
+LANGFLOW_BASE_URL = os.getenv("LANGFLOW_BASE_URL", "https://api.langflow.astra.datastax.com")
+
+# Connection pool and timeout settings, in connections and seconds
+POOL_SIZE = int(os.getenv("ENGAGEGOV_POOL_SIZE", 20))
+CONNECT_TIMEOUT = float(os.getenv("ENGAGEGOV_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("ENGAGEGOV_READ_TIMEOUT", 120))
+
+# (connect, read) tuple in the form requests expects
+LANGFLOW_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+
+def http2_available() -> bool:
+    """Return True if the optional ``h2`` package is installed, enabling HTTP/2 in httpx."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _httpx_options() -> dict:
+    # Built from openai's own defaults so they match whichever httpx package its clients use
+    from openai import DEFAULT_CONNECTION_LIMITS, DEFAULT_TIMEOUT
+
+    return {
+        "http2": http2_available(),
+        "limits": type(DEFAULT_CONNECTION_LIMITS)(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        "timeout": type(DEFAULT_TIMEOUT)(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def get_grok_client() -> "OpenAI":
+    """
+    Return the process-wide client for xAI's Grok API.
+
+    Returns:
+        OpenAI: Client backed by a pooled keep-alive HTTP connection pool.
+    """
+    from openai import DefaultHttpxClient, OpenAI
+
+    return OpenAI(
+        api_key=os.getenv("XAI_API_KEY"),
+        base_url=XAI_BASE_URL,
+        http_client=DefaultHttpxClient(**_httpx_options()),
+        max_retries=0,  # Retries go through helpers.rate_limit
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_grok_client() -> "AsyncOpenAI":
+    """
+    Return the process-wide async client for xAI's Grok API.
+
+    The underlying connection pool is bound to the event loop it is first
+    used on, which is the shared loop in ``helpers.pipeline``.
+
+    Returns:
+        AsyncOpenAI: Client backed by a pooled keep-alive HTTP connection pool.
+    """
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    return AsyncOpenAI(
+        api_key=os.getenv("XAI_API_KEY"),
+        base_url=XAI_BASE_URL,
+        http_client=DefaultAsyncHttpxClient(**_httpx_options()),
+        max_retries=0,  # Retries go through helpers.rate_limit
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_langflow_session() -> "requests.Session":
+    """
+    Return the process-wide HTTP session for the Langflow API.
+
+    requests has no session-level timeout, so callers pass ``LANGFLOW_TIMEOUT``.
+
+    Returns:
+        requests.Session: Session with a keep-alive pool of ``POOL_SIZE`` connections.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def classify_grok_error(error: Exception) -> Optional[RetryableError]:
+    """
+    Map a Grok client exception to a RetryableError, or None if it should not be retried.
+
+    Args:
+        error (Exception): Exception raised by the OpenAI client.
+
+    Returns:
+        RetryableError | None: Error to retry with.
+    """
+    # The client raised this, so openai is already imported
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+
+    if isinstance(error, RateLimitError):
+        retry_after = parse_retry_after(error.response.headers.get("retry-after"))
+        return RetryableError(str(error), retry_after, rate_limited=True)
+    if isinstance(error, InternalServerError):
+        return RetryableError(str(error), parse_retry_after(error.response.headers.get("retry-after")))
+    if isinstance(error, APIConnectionError):  # Includes timeouts
+        return RetryableError(str(error))
+    return None
+
+
+def reset_clients() -> None:
+    """Close every shared client so the next call builds fresh ones."""
+    for factory in (get_grok_client, get_langflow_session):
+        if factory.cache_info().currsize:
+            factory().close()
+        factory.cache_clear()
+    # The async pool can only be closed from its own loop; just drop it
+    get_async_grok_client.cache_clear()
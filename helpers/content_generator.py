@@ -1,28 +1,63 @@
-from dotenv import load_dotenv
-from openai import OpenAI
-from textwrap import dedent
+import argparse
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from textwrap import dedent
+from typing import Iterator, NamedTuple, Optional
+
+from helpers.api_utils import cache_key, flights
+from helpers.cache import get_cache
+from helpers.clients import classify_grok_error, get_grok_client
+from helpers.metrics import add_usage, annotate, timed
+from helpers.rate_limit import call_with_retry
+
+CONTENT_MODEL = "grok-beta"
+SYSTEM_PROMPT = "You are an experienced content writer."
 
+# Prompts generated at once by a batch; the shared "xai" rate limiter still applies
+CONTENT_WORKERS = int(os.getenv("ENGAGEGOV_CONTENT_WORKERS", 8))
+
+
+class ContentResult(NamedTuple):
+   """
+   Outcome of one prompt of a batch.
 
-load_dotenv()
+   Attributes:
+       index (int): Position of the prompt in the batch.
+       prompt (str): The prompt.
+       content (str | None): Generated content, or None if generation failed.
+       error (Exception | None): Why generation failed.
+   """
+
+   index: int
+   prompt: str
+   content: Optional[str]
+   error: Optional[Exception] = None
+
+
+def format_prompt(prompt: str, tone="professional") -> str:
+   """Build the user message asking for content on a prompt in a tone."""
+   return dedent(f""" \
+       Based on the promt below generate dynamic content, let it be in the tone specified
+       and optimize the content for SEO using the keywords if specified.
+       Prompt: {prompt}
+       Tone: {tone}
 
 
-# Configure the OpenAI client for xAI's Grok API
-api_key = os.getenv("XAI_API_KEY")
-client = OpenAI(
-   api_key=api_key,
-   base_url="https://api.x.ai/v1",
-)
+       """)
 
 
 def generate_content(prompt: str, tone="professional", temperature=0.7, max_tokens=500) -> str:
    """
    Generate dynamic content using the xAI Grok API.
 
+   Results are cached on (prompt, tone, temperature, max_tokens), and
+   identical requests in flight at once are made only once. A reply cut
+   off at ``max_tokens`` is returned but not cached.
+
 
    Parameters:
        prompt (str): The input text to guide the content generation.
-       model (str): The Grok model to use (default: "grok-beta").
        tone (str): Desired tone (e.g., "professional", "casual", "persuasive").
        temperature (float): Creativity level (0.0 to 1.0).
        max_tokens (int): Maximum length of the generated text.
@@ -30,27 +65,166 @@ def generate_content(prompt: str, tone="professional", temperature=0.7, max_toke
 
    Returns:
        str: Generated content.
+
+   Raises:
+       CircuitOpenError, RetryableError: If the API is unavailable or keeps failing.
+       openai.OpenAIError: If the API rejects the request.
    """
-   formatted_prompt = dedent(f""" \
-       Based on the promt below generate dynamic content, let it be in the tone specified
-       and optimize the content for SEO using the keywords if specified.
-       Prompt: {prompt}
-       Tone: {tone}
+   formatted_prompt = format_prompt(prompt, tone)
+   messages = [
+       {"role": "system", "content": SYSTEM_PROMPT},
+       {"role": "user", "content": formatted_prompt},
+   ]
+   cache = get_cache()
+   key = cache_key(CONTENT_MODEL, SYSTEM_PROMPT, formatted_prompt, temperature, max_tokens)
 
+   with timed("generate_content"):
+       cached = cache.get(key)
+       if cached is not None:
+           annotate(cache_hit=True)
+           return cached
+       led = False
 
-       """)
+       def fetch() -> str:
+           nonlocal led
+           led = True
+           # A flight for this key may have finished between the lookup above and joining
+           cached = cache.get(key)
+           if cached is not None:
+               annotate(cache_hit=True)
+               return cached
+           response = call_with_retry(
+               lambda: get_grok_client().chat.completions.create(
+                   model=CONTENT_MODEL,
+                   messages=messages,
+                   temperature=temperature,
+                   max_tokens=max_tokens,
+                   n=1
+               ),
+               "xai",
+               classify=classify_grok_error,
+           )
+           add_usage(CONTENT_MODEL, response.usage)
+           choice = response.choices[0]
+           content = choice.message.content.strip()
+           if choice.finish_reason != "length":
+               cache.set(key, content)
+           return content
+
+       content = flights.do(key, fetch)
+       annotate(coalesced=not led)
+       return content
+
+
+def iter_contents(prompts: list, tone="professional", temperature=0.7, max_tokens=500,
+                  max_workers=CONTENT_WORKERS) -> Iterator[ContentResult]:
+   """
+   Generate content for many prompts concurrently, yielding each result as it completes.
+
+   A failed prompt is yielded with its exception instead of stopping the batch.
+
+
+   Parameters:
+       prompts (list): Prompts to generate content for.
+       tone (str): Desired tone for every prompt.
+       temperature (float): Creativity level (0.0 to 1.0).
+       max_tokens (int): Maximum length of each generated text.
+       max_workers (int): Prompts in flight at once.
+
+
+   Yields:
+       ContentResult: One per prompt, in completion order.
+   """
+   if not prompts:
+       return
+   with ThreadPoolExecutor(min(len(prompts), max_workers)) as executor:
+       futures = {
+           executor.submit(generate_content, prompt, tone, temperature, max_tokens): (index, prompt)
+           for index, prompt in enumerate(prompts)
+       }
+       try:
+           for future in as_completed(futures):
+               index, prompt = futures[future]
+               error = future.exception()
+               yield ContentResult(index, prompt, None if error else future.result(), error)
+       finally:
+           # A caller that stops early does not wait for prompts that have not started
+           for future in futures:
+               future.cancel()
+
+
+def generate_contents(prompts: list, tone="professional", temperature=0.7, max_tokens=500,
+                      max_workers=CONTENT_WORKERS, output_path: Optional[str] = None,
+                      return_exceptions=False) -> list:
+   """
+   Generate content for many prompts concurrently.
+
+   With ``output_path``, every result is appended to that JSONL file as
+   soon as it completes, as ``{"index", "prompt", "tone", "content"}`` or
+   ``{"index", "prompt", "tone", "error", "error_type"}``, so a long batch
+   can be followed while it runs and its finished items survive a crash.
 
+
+   Parameters:
+       prompts (list): Prompts to generate content for.
+       tone (str): Desired tone for every prompt.
+       temperature (float): Creativity level (0.0 to 1.0).
+       max_tokens (int): Maximum length of each generated text.
+       max_workers (int): Prompts in flight at once.
+       output_path (str | None): JSONL file to append results to.
+       return_exceptions (bool): Put the exception of a failed prompt in its
+           slot instead of raising it.
+
+
+   Returns:
+       list: Generated content per prompt, in input order.
+
+   Raises:
+       Exception: The first failure, unless ``return_exceptions`` is set;
+       prompts not yet started are cancelled.
+   """
+   results = [None] * len(prompts)
+   output = open(output_path, "a", encoding="utf-8") if output_path else None
+   stream = iter_contents(prompts, tone, temperature, max_tokens, max_workers)
    try:
-       response = client.chat.completions.create(
-           model="grok-beta",
-           messages=[
-               {"role": "system", "content": "You are an experienced content writer."},
-               {"role": "user", "content": formatted_prompt},
-           ],
-           temperature=temperature,
-           max_tokens=max_tokens,
-           n=1
-       )
-       return response.choices[0].message.content.strip()
-   except Exception as e:
-       return f"Error: {e}"
+       for result in stream:
+           if output:
+               record = {"index": result.index, "prompt": result.prompt, "tone": tone}
+               if result.error is None:
+                   record["content"] = result.content
+               else:
+                   record.update(error=str(result.error), error_type=type(result.error).__name__)
+               output.write(json.dumps(record, ensure_ascii=False) + "\n")
+               output.flush()
+           if result.error is not None and not return_exceptions:
+               raise result.error
+           results[result.index] = result.error if result.error is not None else result.content
+   finally:
+       stream.close()
+       if output:
+           output.close()
+   return results
+
+
+def main(argv=None):
+   parser = argparse.ArgumentParser(description="Generate content for a file of prompts, one per line.")
+   parser.add_argument("prompts", help="Text file with one prompt per line.")
+   parser.add_argument("--output", required=True, help="JSONL file results are appended to as they complete.")
+   parser.add_argument("--tone", default="professional")
+   parser.add_argument("--temperature", type=float, default=0.7)
+   parser.add_argument("--max-tokens", type=int, default=500)
+   parser.add_argument("--workers", type=int, default=CONTENT_WORKERS)
+   args = parser.parse_args(argv)
+
+   with open(args.prompts, encoding="utf-8") as f:
+       prompts = [line.strip() for line in f if line.strip()]
+   results = generate_contents(
+       prompts, args.tone, args.temperature, args.max_tokens, args.workers, args.output, return_exceptions=True
+   )
+   failed = sum(isinstance(result, Exception) for result in results)
+   print(f"{len(results) - failed} generated, {failed} failed; results appended to {args.output}")
+   return 1 if failed else 0
+
+
+if __name__ == "__main__":
+   raise SystemExit(main())
@@ -0,0 +1,93 @@
+"""
+Exact and near-duplicate detection for short texts using MinHash + LSH.
+"""
+import re
+import zlib
+from typing import Optional
+
+import numpy as np
+
+_WORD_RE = re.compile(r"[\w']+")
+
+# Mersenne prime used for the universal hash family
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize(text: str) -> str:
+    """Lowercase a text and reduce it to its words separated by single spaces."""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def shingles(text: str, size=5) -> set:
+    """Character shingles of the normalized text (the whole text if it is shorter)."""
+    text = normalize(text)
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class NearDuplicateFilter:
+    """
+    Streaming filter that accepts a text only if nothing similar was seen before.
+
+    Each text gets a MinHash signature of ``num_perm`` values split into
+    ``bands`` LSH bands; texts sharing a band are compared by estimated
+    Jaccard similarity of their character shingles.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=64, bands=8, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._exact: set = set()
+        self._buckets: list = [dict() for _ in range(bands)]
+        self._signatures: list = []
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of a text, or None if it has no words."""
+        grams = shingles(text)
+        if not grams:
+            return None
+        hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        # (a * x + b) mod p, with x < 2**32 and a, b < 2**61; wraparound is fine for hashing
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def add(self, text: str) -> bool:
+        """
+        Record a text if it is new.
+
+        Args:
+            text (str): Text to check.
+
+        Returns:
+            bool: True if the text was added, False if it duplicates a previous one.
+        """
+        key = normalize(text)
+        if not key or key in self._exact:
+            return False
+        signature = self.signature(text)
+        rows = self.num_perm // self.bands
+        band_keys = [signature[i * rows:(i + 1) * rows].tobytes() for i in range(self.bands)]
+        candidates = set()
+        for band, band_key in zip(self._buckets, band_keys):
+            candidates.update(band.get(band_key, ()))
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                return False
+
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        self._exact.add(key)
+        for band, band_key in zip(self._buckets, band_keys):
+            band.setdefault(band_key, []).append(index)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._signatures)
@@ -0,0 +1,377 @@
+"""
+Local FAQ index that answers repeat inquiries without calling Langflow.
+
+Queries are embedded with signed feature hashing (word unigrams, bigrams and
+character trigrams) into unit vectors stored in a memory-mapped NumPy matrix,
+with the matching answers in a JSONL file alongside. Lookups are one
+matrix-vector product over the mapped rows, which stays in the low
+milliseconds up to hundreds of thousands of entries, so no coarse ANN
+structure is needed.
+
+Lexical similarity cannot tell "Is the office open?" from "Is the office
+closed?", or 2024 from 2025. A stored answer is therefore only served when
+its query also has the same key terms in the same order (everything but
+filler words, so numbers, names, places and negations must all match).
+The index is curated with ``rebuild``; learning from live answers is
+opt-in with ``ENGAGEGOV_FAQ_LEARN=1``.
+
+    python -m helpers.faq_index rebuild data/faq.jsonl history.jsonl
+    python -m helpers.faq_index search "What initiatives exist for reducing unemployment?"
+
+Source files hold ``{"query", "response"}`` records (or ``"messages"``, a
+list of answer texts).
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writes are serialized within one process only
+    fcntl = None
+
+from helpers.router import tokenize
+
+FAQ_DIR = os.getenv("ENGAGEGOV_FAQ_DIR", os.path.join(".cache", "faq"))
+EMBEDDING_DIM = 1024
+
+# Cosine similarity above which a stored answer is served instead of calling the flow
+FAQ_THRESHOLD = float(os.getenv("ENGAGEGOV_FAQ_THRESHOLD", 0.9))
+
+# Add every answered inquiry to the index; off by default so only curated answers are served
+FAQ_LEARN = os.getenv("ENGAGEGOV_FAQ_LEARN", "0") == "1"
+
+# Words two queries may differ in and still ask the same thing; negations are deliberately absent
+_FILLER_WORDS = frozenset(
+    "a an the is are was were be been am do does did of in on at for by with about "
+    "please can could would will should i i'm me my we our us you your it its this that these "
+    "those there here any some and or so just tell know want like get".split()
+)
+_WORD_RE = re.compile(r"[\w']+")
+
+# New entries closer than this to an existing one replace it instead of being added
+_DUPLICATE_THRESHOLD = 0.98
+
+
+def key_terms(text: str) -> tuple:
+    """Words of a query that change its meaning, in order: everything except ``_FILLER_WORDS``."""
+    return tuple(word for word in _WORD_RE.findall(text.lower()) if word not in _FILLER_WORDS)
+
+
+class FAQHit(NamedTuple):
+    """Stored answer matching a query."""
+
+    query: str
+    messages: list
+    score: float
+
+
+def _features(text: str) -> list:
+    tokens = tokenize(text)
+    trigrams = [
+        f"#{word[i:i + 3]}"
+        for word in tokens
+        if " " not in word
+        for i in range(max(1, len(word) - 2))
+    ]
+    return [(token, 1.0) for token in tokens] + [(gram, 0.5) for gram in trigrams]
+
+
+def embed(texts: Iterable[str], dim=EMBEDDING_DIM) -> np.ndarray:
+    """
+    Embed texts into L2-normalized vectors with signed feature hashing.
+
+    Args:
+        texts (Iterable[str]): Texts to embed.
+        dim (int): Embedding dimension.
+
+    Returns:
+        np.ndarray: ``(n, dim)`` float32 matrix.
+    """
+    texts = list(texts)
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        features = _features(text)
+        if not features:
+            continue
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f, _ in features), dtype=np.uint32, count=len(features))
+        weights = np.fromiter((w for _, w in features), dtype=np.float32, count=len(features))
+        signs = np.where(hashes & 1, 1.0, -1.0).astype(np.float32)
+        np.add.at(vectors[row], (hashes >> 1) % dim, signs * weights)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class FAQIndex:
+    """
+    Append-only embedding index persisted in ``directory``.
+
+    ``vectors.npy`` is a memory-mapped matrix grown by doubling;
+    ``entries.jsonl`` holds one ``{"query", "messages"}`` record per row and is
+    the source of truth for how many rows are valid.
+
+    Writers in several processes (the app and external job workers) take an
+    exclusive lock on the directory and reload whatever another process
+    wrote since, so they never overwrite each other's rows.
+    """
+
+    def __init__(self, directory=FAQ_DIR, dim=EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(directory, "vectors.npy")
+        self._entries_path = os.path.join(directory, "entries.jsonl")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._entries: list = []
+        self._vectors: Optional[np.memmap] = None
+        self._file_state = None
+        self._load()
+
+    def _current_file_state(self) -> Optional[tuple]:
+        # The entries file changes on every write; the vectors file is replaced when it grows
+        try:
+            entries, vectors = os.stat(self._entries_path), os.stat(self._vectors_path)
+        except FileNotFoundError:
+            return None
+        return entries.st_ino, entries.st_size, entries.st_mtime_ns, vectors.st_ino
+
+    def _load(self) -> None:
+        state = self._current_file_state()
+        if state == self._file_state and (state is None or self._vectors is not None):
+            return
+        self._vectors = None
+        self._entries = []
+        if state is not None:
+            with open(self._entries_path, encoding="utf-8") as f:
+                self._entries = [json.loads(line) for line in f if line.strip()]
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            if self._vectors.shape[0] < len(self._entries):
+                raise ValueError(f"FAQ index in {self.directory} is corrupt; run the rebuild command")
+        self._file_state = state
+
+    @contextmanager
+    def _write_lock(self):
+        """Hold the index exclusively, across processes where supported, with its state reloaded."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._lock_path, "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._load()
+                    yield
+                    self._file_state = self._current_file_state()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def search(self, query: str, k=1) -> list:
+        """
+        Find the stored entries most similar to a query.
+
+        Args:
+            query (str): Query text.
+            k (int): Number of results.
+
+        Returns:
+            list: Up to ``k`` FAQHit results, best first.
+        """
+        with self._lock:
+            # A stat per lookup picks up a rebuild or entries added by other processes
+            self._load()
+            count = len(self._entries)
+            if not count:
+                return []
+            scores = self._vectors[:count] @ embed([query], self.dim)[0]
+            k = min(k, count)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [
+                FAQHit(self._entries[i]["query"], self._entries[i]["messages"], float(scores[i]))
+                for i in best
+            ]
+
+    def lookup(self, query: str, threshold=FAQ_THRESHOLD, candidates=3) -> Optional[FAQHit]:
+        """
+        Return the best stored answer to the same question, if any.
+
+        Args:
+            query (str): Query text.
+            threshold (float): Minimum cosine similarity.
+            candidates (int): Nearest entries checked for matching key terms.
+
+        Returns:
+            FAQHit | None: The most similar entry whose similarity reaches
+            ``threshold`` and whose key terms are the query's.
+        """
+        terms = key_terms(query)
+        for hit in self.search(query, candidates):
+            if hit.score < threshold:
+                break
+            if key_terms(hit.query) == terms:
+                return hit
+        return None
+
+    def add(self, query: str, messages: list) -> None:
+        """
+        Insert an answered query, replacing an existing entry for the same question.
+
+        Args:
+            query (str): Query text.
+            messages (list): Answer texts.
+        """
+        vector = embed([query], self.dim)[0]
+        with self._write_lock():
+            count = len(self._entries)
+            if count:
+                scores = self._vectors[:count] @ vector
+                best = int(scores.argmax())
+                same_question = key_terms(self._entries[best]["query"]) == key_terms(query)
+                if scores[best] >= _DUPLICATE_THRESHOLD and same_question:
+                    self._entries[best] = {"query": query, "messages": messages}
+                    self._vectors[best] = vector
+                    self._write_entries()
+                    return
+            self._ensure_capacity(count + 1)
+            self._vectors[count] = vector
+            self._vectors.flush()
+            self._entries.append({"query": query, "messages": messages})
+            with open(self._entries_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"query": query, "messages": messages}, ensure_ascii=False) + "\n")
+
+    def extend(self, records: list) -> None:
+        """
+        Append many ``(query, messages)`` pairs without duplicate checks.
+
+        Args:
+            records (list): Pairs to append, e.g. from ``read_records``.
+        """
+        if not records:
+            return
+        vectors = embed((query for query, _ in records), self.dim)
+        with self._write_lock():
+            count = len(self._entries)
+            self._ensure_capacity(count + len(records))
+            self._vectors[count:count + len(records)] = vectors
+            self._vectors.flush()
+            with open(self._entries_path, "a", encoding="utf-8") as f:
+                for query, messages in records:
+                    entry = {"query": query, "messages": messages}
+                    self._entries.append(entry)
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if self._vectors is not None and self._vectors.shape[0] >= rows:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        capacity = max(1024, 2 * (self._vectors.shape[0] if self._vectors is not None else 0), rows)
+        tmp_path = self._vectors_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+        if self._vectors is not None:
+            grown[: len(self._entries)] = self._vectors[: len(self._entries)]
+        grown.flush()
+        del grown
+        self._vectors = None
+        os.replace(tmp_path, self._vectors_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+
+    def _write_entries(self) -> None:
+        tmp_path = self._entries_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self._entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self._entries_path)
+        self._vectors.flush()
+
+
+_index: Optional[FAQIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> FAQIndex:
+    """Return the process-wide FAQ index, opening it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FAQIndex()
+        return _index
+
+
+def read_records(paths: Iterable[str]) -> Iterable[tuple]:
+    """
+    Yield ``(query, messages)`` pairs from JSONL source files.
+
+    Records need a ``query`` plus either ``messages`` (list of answer texts)
+    or ``response`` (a single answer text); others are skipped.
+    """
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                messages = record.get("messages") or ([record["response"]] if record.get("response") else None)
+                if record.get("query") and messages:
+                    yield record["query"], messages
+
+
+def rebuild(paths: list, directory=FAQ_DIR) -> FAQIndex:
+    """
+    Build a fresh index from source files, replacing the existing one.
+
+    Args:
+        paths (list): JSONL files of query/answer records, in priority order
+            (later records win over earlier ones with the same wording).
+        directory (str): Index directory.
+
+    Returns:
+        FAQIndex: The new index.
+    """
+    global _index
+    staging = directory.rstrip(os.sep) + ".rebuild"
+    shutil.rmtree(staging, ignore_errors=True)
+    records = {}
+    for query, messages in read_records(paths):
+        records[" ".join(tokenize(query))] = (query, messages)
+    index = FAQIndex(staging)
+    index.extend(list(records.values()))
+    index._vectors = None
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(staging, directory)
+    with _index_lock:
+        _index = FAQIndex(directory)
+        return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local FAQ index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = commands.add_parser("rebuild", help="Rebuild the index from JSONL query/answer files")
+    rebuild_parser.add_argument("sources", nargs="+")
+    search_parser = commands.add_parser("search", help="Show the closest stored answers for a query")
+    search_parser.add_argument("query")
+    search_parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        index = rebuild(args.sources)
+        print(f"FAQ index rebuilt with {len(index)} entries in {FAQ_DIR}")
+    else:
+        for hit in get_index().search(args.query, args.k):
+            print(f"{hit.score:.3f}  {hit.query}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import json
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from helpers.clients import LANGFLOW_BASE_URL, LANGFLOW_TIMEOUT, get_langflow_session
+from helpers.metrics import StageRecord, annotate, bind, timed, timed_stream
+from helpers.rate_limit import CircuitOpenError, RetryableError, call_with_retry, classify_status
+from helpers.singleflight import FlightAbandoned, SingleFlight
+
+# Langflow deployment serving the general inquiry flow
+BASE_API_URL = LANGFLOW_BASE_URL
+LANGFLOW_ID = "a76d6046-9bc2-4704-b2d5-67d042b61b8d"
+FLOW_ID = "f9bf7aa5-05a2-432e-ae2f-2bb4dfd0fc4a"
+APPLICATION_TOKEN = os.getenv("APP_TOKEN")
+ENDPOINT = "engagegov"
+
+# Identical flow runs in flight at once, shared by the blocking and streaming runners
+flights = SingleFlight()
+
+
+class FlowError(Exception):
+    """Raised when the Langflow API cannot be reached or keeps failing."""
+
+
+def run_flow_with_backoff(message: str, endpoint: str, application_token: Optional[str], retries=5) -> dict:
+    """
+    Run the Langflow flow for a message, retrying on rate limits and errors.
+
+    Queries matching a stored answer in the local FAQ index are answered
+    from it without calling the API; answered queries are added to it.
+    Requests share the process-wide "langflow" rate limiter and circuit
+    breaker, honour Retry-After on 429s and back off with jitter otherwise.
+    Callers asking the same question (ignoring case and spacing) while it
+    is in flight wait for that run instead of starting their own.
+
+    Args:
+        message (str): Citizen's report or inquiry.
+        endpoint (str): Flow endpoint name.
+        application_token (str | None): Langflow application token.
+        retries (int): Maximum number of attempts.
+
+    Returns:
+        dict: Raw JSON response from the flow.
+
+    Raises:
+        FlowError: If every attempt fails.
+    """
+    with timed("flow"):
+        hit = _faq_lookup(message)
+        if hit is not None:
+            annotate(cache_hit=True)
+            return faq_response(hit)
+
+        api_url, payload, headers = _flow_request(message, endpoint, application_token)
+        session = get_langflow_session()
+        led = False
+
+        def post() -> dict:
+            response = _post(session, api_url, payload, headers)
+            return response.json()
+
+        def run() -> dict:
+            nonlocal led
+            led = True
+            with _flow_errors():
+                response = call_with_retry(post, "langflow", retries)
+            _learn(message, response)
+            return response
+
+        response = flights.do(flight_key(message, endpoint, application_token), run)
+        annotate(coalesced=not led)
+        return response
+
+
+class FlowStream:
+    """
+    Streaming run of the Langflow flow.
+
+    Iterating yields the reply's text chunks as the flow emits them, which
+    suits ``st.write_stream``. Once iteration finishes, ``result`` holds the
+    final response in the same shape ``run_flow_with_backoff`` returns, so
+    ``parse_flow_response`` works on it unchanged. If the flow emits no
+    token events, the whole reply is yielded as one chunk at the end.
+    While an identical run is in flight, iterating waits for it and yields
+    its whole reply as one chunk.
+    """
+
+    def __init__(self, message: str, endpoint: str, application_token: Optional[str], retries=5):
+        self.message = message
+        self.endpoint = endpoint
+        self.application_token = application_token
+        self.retries = retries
+        self.result: Optional[dict] = None
+
+    def __iter__(self) -> Iterator[str]:
+        return timed_stream("flow_stream", self._run)
+
+    def _run(self, record: StageRecord) -> Iterator[str]:
+        hit = _faq_lookup(self.message)
+        if hit is not None:
+            record.cache_hit = True
+            self.result = faq_response(hit)
+            yield parse_flow_response(self.result)
+            return
+
+        key = flight_key(self.message, self.endpoint, self.application_token)
+        while True:
+            flight = flights.join(key)
+            if flight.leader:
+                break
+            try:
+                self.result = flight.wait()
+            except FlightAbandoned:
+                continue
+            record.coalesced = True
+            yield parse_flow_response(self.result)
+            return
+
+        try:
+            yield from self._stream(record)
+            _learn(self.message, self.result)
+            flight.resolve(self.result)
+        except Exception as e:
+            flight.fail(e)
+            raise
+        finally:
+            flight.fail(FlightAbandoned(key))
+
+    def _stream(self, record: StageRecord) -> Iterator[str]:
+        api_url, payload, headers = _flow_request(self.message, self.endpoint, self.application_token)
+        session = get_langflow_session()
+        streamed = False
+        with _flow_errors():
+            # Only opening the stream is retried; a stream that breaks midway is an error
+            with bind(record):
+                response = call_with_retry(
+                    lambda: _post(session, api_url, payload, headers, params={"stream": "true"}, stream=True),
+                    "langflow",
+                    self.retries,
+                )
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.strip():
+                        continue
+                    event = json.loads(line)
+                    data = event.get("data") or {}
+                    if event.get("event") == "token" and data.get("chunk"):
+                        streamed = True
+                        yield data["chunk"]
+                    elif event.get("event") == "end":
+                        self.result = data.get("result")
+                    elif event.get("event") == "error":
+                        raise FlowError(f"API error: {data.get('error') or data}")
+        if not streamed and self.result:
+            yield parse_flow_response(self.result)
+
+
+def flight_key(message: str, endpoint: str, application_token: Optional[str]) -> tuple:
+    """Identity of a flow run for coalescing: the message ignoring case and spacing."""
+    return endpoint, application_token, " ".join(message.casefold().split())
+
+
+def flow_messages(response: Optional[dict]) -> list:
+    """Texts of the chat messages in a flow response."""
+    if not response:
+        return []
+    return [
+        output.get("results", {}).get("message", {}).get("text", "")
+        for item in response.get("outputs", [])
+        for output in item.get("outputs", [])
+    ]
+
+
+def faq_response(hit) -> dict:
+    """
+    Wrap a stored FAQ answer in the shape of a flow response.
+
+    Args:
+        hit (FAQHit): Match from the FAQ index.
+
+    Returns:
+        dict: Flow-shaped response, with the match under ``"faq"``.
+    """
+    return {
+        "outputs": [{"outputs": [{"results": {"message": {"text": text}}} for text in hit.messages]}],
+        "faq": {"query": hit.query, "score": hit.score},
+    }
+
+
+# The FAQ index pulls in NumPy, so it is imported on first use rather than at startup
+def _faq_lookup(message: str):
+    from helpers.faq_index import get_index
+
+    return get_index().lookup(message)
+
+
+def _learn(message: str, response: Optional[dict]) -> None:
+    from helpers.faq_index import FAQ_LEARN, get_index
+
+    messages = [text for text in flow_messages(response) if text]
+    if FAQ_LEARN and messages:
+        get_index().add(message, messages)
+
+
+def _flow_request(message: str, endpoint: str, application_token: Optional[str]) -> tuple:
+    api_url = f"{BASE_API_URL}/lf/{LANGFLOW_ID}/api/v1/run/{endpoint}"
+    payload = {"input_value": message, "output_type": "chat", "input_type": "chat"}
+    headers = {
+        "Authorization": f"Bearer {application_token}",
+        "Content-Type": "application/json",
+    }
+    return api_url, payload, headers
+
+
+def _post(session, api_url: str, payload: dict, headers: dict, **kwargs):
+    from requests.exceptions import ConnectionError, Timeout
+
+    try:
+        response = session.post(api_url, json=payload, headers=headers, timeout=LANGFLOW_TIMEOUT, **kwargs)
+    except (ConnectionError, Timeout) as e:
+        raise RetryableError(str(e)) from e
+    error = classify_status(response.status_code, response.headers)
+    if error is not None:
+        response.close()
+        raise error
+    response.raise_for_status()
+    return response
+
+
+@contextmanager
+def _flow_errors():
+    """Translate transport and retry failures into FlowError."""
+    from requests.exceptions import ConnectionError, RequestException
+
+    try:
+        yield
+    except CircuitOpenError as e:
+        raise FlowError(f"API temporarily unavailable: {e}") from e
+    except RetryableError as e:
+        if isinstance(e.__cause__, ConnectionError):
+            raise FlowError("Network error: Unable to reach the API. Please check your connection.") from e
+        raise FlowError(f"API error: {e}") from e
+    except RequestException as e:
+        raise FlowError(f"API error: {e}") from e
+    except ValueError as e:  # Malformed JSON body or stream event
+        raise FlowError(f"API error: invalid response ({e})") from e
+
+
+def parse_flow_response(response: Optional[dict]) -> str:
+    """
+    Flatten the chat messages of a flow response into display text.
+
+    Args:
+        response (dict | None): Raw JSON response from the flow.
+
+    Returns:
+        str: One bullet per output message, or a placeholder if there are none.
+    """
+    if not response:
+        return "No valid response received."
+    return "\n\n".join(f"- {text}" for text in flow_messages(response)) or "No outputs received from the API."
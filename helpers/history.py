@@ -0,0 +1,185 @@
+"""
+Persistent query-response history.
+
+Records live in SQLite, keyed by the Streamlit session that created them, and
+are read back a page at a time so rendering cost does not grow with the
+length of a session.
+
+    python -m helpers.history export history.jsonl
+
+writes every answered record as ``{"query", "messages", "ministry"}`` JSONL,
+e.g. to rebuild the FAQ index from past answers. ``messages`` are the raw
+texts of the flow reply, not the bulleted display text; records without
+any, such as those showing a "No outputs" placeholder or stored before raw
+messages were kept, are skipped.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, NamedTuple, Optional
+
+HISTORY_PATH = os.getenv("ENGAGEGOV_HISTORY_PATH", os.path.join(".cache", "history.sqlite3"))
+
+# Records kept in memory per session, and on disk overall
+HISTORY_WINDOW = int(os.getenv("ENGAGEGOV_HISTORY_WINDOW", 20))
+HISTORY_MAX_ROWS = int(os.getenv("ENGAGEGOV_HISTORY_MAX_ROWS", 200_000))
+
+
+class HistoryRecord(NamedTuple):
+    """One answered query."""
+
+    id: int
+    session_id: str
+    query: str
+    response: str
+    ministry: Optional[str]
+    created_at: float
+    messages: Optional[list] = None
+
+
+class HistoryStore:
+    """SQLite-backed history shared by all sessions in a process."""
+
+    def __init__(self, path=HISTORY_PATH, max_rows=HISTORY_MAX_ROWS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+            "query TEXT NOT NULL, response TEXT NOT NULL, ministry TEXT, created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS history_session ON history (session_id, id)")
+        # Raw flow messages, added after the table was first released
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(history)")}
+        if "messages" not in columns:
+            self._db.execute("ALTER TABLE history ADD COLUMN messages TEXT")
+
+    def add(
+        self,
+        session_id: str,
+        query: str,
+        response: str,
+        ministry: Optional[str] = None,
+        messages: Optional[list] = None,
+    ) -> HistoryRecord:
+        """
+        Append a record.
+
+        Args:
+            session_id (str): Session the query came from.
+            query (str): Citizen's query.
+            response (str): Displayed answer.
+            ministry (str | None): Ministry the query was routed to.
+            messages (list | None): Raw message texts of the flow reply the answer was made from.
+
+        Returns:
+            HistoryRecord: The stored record.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO history (session_id, query, response, ministry, created_at, messages) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, query, response, ministry, now, _dump(messages)),
+            )
+            self._writes += 1
+            if self._writes % 256 == 0:
+                self._db.execute(
+                    "DELETE FROM history WHERE id <= (SELECT MAX(id) FROM history) - ?", (self.max_rows,)
+                )
+        return HistoryRecord(cursor.lastrowid, session_id, query, response, ministry, now, messages)
+
+    def count(self, session_id: str) -> int:
+        """Number of records for a session."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM history WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+    def page(self, session_id: str, page: int, page_size: int) -> list:
+        """
+        Read one page of a session's history, newest first.
+
+        Args:
+            session_id (str): Session to read.
+            page (int): Zero-based page number.
+            page_size (int): Records per page.
+
+        Returns:
+            list: HistoryRecord items.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, session_id, query, response, ministry, created_at, messages FROM history "
+                "WHERE session_id = ? ORDER BY id DESC LIMIT ? OFFSET ?",
+                (session_id, page_size, page * page_size),
+            ).fetchall()
+        return [_record(row) for row in rows]
+
+    def iter_records(self) -> Iterator[HistoryRecord]:
+        """Yield every stored record, oldest first."""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT id, session_id, query, response, ministry, created_at, messages FROM history "
+                    "WHERE id > ? ORDER BY id LIMIT 1000",
+                    (last_id,),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _record(row)
+            last_id = rows[-1][0]
+
+
+def _dump(messages: Optional[list]) -> Optional[str]:
+    return json.dumps(messages, ensure_ascii=False) if messages is not None else None
+
+
+def _record(row: tuple) -> HistoryRecord:
+    return HistoryRecord(*row[:6], json.loads(row[6]) if row[6] is not None else None)
+
+
+_store: Optional[HistoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> HistoryStore:
+    """Return the process-wide history store, opening it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = HistoryStore()
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the query-response history.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write every record to a JSONL file")
+    export_parser.add_argument("output")
+    args = parser.parse_args(argv)
+
+    count = skipped = 0
+    with open(args.output, "w", encoding="utf-8") as f:
+        for record in get_store().iter_records():
+            messages = [text for text in record.messages or () if text]
+            if not messages:
+                skipped += 1
+                continue
+            f.write(json.dumps({"query": record.query, "messages": messages, "ministry": record.ministry}, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"Exported {count} records to {args.output}, skipped {skipped} without a flow reply")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""
+Near-duplicate detection for report images with perceptual hashes.
+
+The same pothole photographed by different people, or a photo re-uploaded
+after recompression, has different bytes but nearly the same picture.
+Every photo report is stored with a 64-bit pHash (low frequencies of a
+DCT) and dHash (horizontal gradients) per page. A new report whose pages
+are all within a small Hamming distance of a stored report's pages, on
+both hashes, and whose extracted text is the same (``same_text``), is that
+incident again, and the incident's count is bumped. This gives ministries
+a duplicate count per incident:
+
+    python -m helpers.image_index top [--limit 20]
+    python -m helpers.image_index stats
+
+Hashes alone are not enough: forms printed from one template but filled
+in by different people are only a few bits apart. So a match is confirmed
+on text that has already been extracted from the new upload. Its numbers
+and capitalized words (names, places, amounts) must be identical, and the
+rest nearly so. Only photos are indexed, not PDFs or scans. A match only
+links the upload to the incident; the upload is shown its own results.
+
+The one result reused is the extraction, and only before OCR when reuse
+cannot leak anything: every page must be a near-exact hash match
+(``REUSE_PHASH_THRESHOLD``, ``REUSE_DHASH_THRESHOLD``) of an incident whose
+text is a few words with no numbers, such as a road sign or a pothole
+photo (``reusable_text``). The vision call is then skipped. Text-heavy
+photos such as forms are always read afresh.
+
+Matching is a vectorized XOR and popcount over the first-page hashes of
+every stored report, held in memory and refreshed from SQLite, so workers
+in other processes see each other's reports.
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from difflib import SequenceMatcher
+from typing import Iterator, NamedTuple, Optional
+
+import numpy as np
+
+from helpers.image_utils import load_pil
+from helpers.metrics import annotate, timed
+
+IMAGE_INDEX_PATH = os.getenv("ENGAGEGOV_IMAGE_INDEX_PATH", os.path.join(".cache", "image_index.sqlite3"))
+
+# Largest Hamming distance, out of 64 bits, at which two pages count as the same picture
+PHASH_THRESHOLD = int(os.getenv("ENGAGEGOV_PHASH_THRESHOLD", 10))
+DHASH_THRESHOLD = int(os.getenv("ENGAGEGOV_DHASH_THRESHOLD", 12))
+
+# Similarity of the extracted words, once numbers and capitalized words agree, for the same incident
+TEXT_THRESHOLD = float(os.getenv("ENGAGEGOV_IMAGE_TEXT_THRESHOLD", 0.9))
+
+# Stricter distances, and a word limit, for reusing an earlier extraction instead of running OCR
+REUSE_PHASH_THRESHOLD = int(os.getenv("ENGAGEGOV_REUSE_PHASH_THRESHOLD", 2))
+REUSE_DHASH_THRESHOLD = int(os.getenv("ENGAGEGOV_REUSE_DHASH_THRESHOLD", 3))
+REUSE_MAX_WORDS = int(os.getenv("ENGAGEGOV_REUSE_MAX_WORDS", 12))
+
+_WORD = re.compile(r"\w+")
+
+_HASH_SIZE = 8
+_DCT_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int(np.packbits(bits.ravel()).view(">u8")[0])
+
+
+def phash(image) -> int:
+    """
+    64-bit perceptual hash: signs of the 8x8 lowest DCT frequencies against their median.
+
+    Args:
+        image (PIL.Image.Image): Any image.
+
+    Returns:
+        int: The hash.
+    """
+    Image = load_pil()[0]
+    pixels = np.asarray(image.convert("L").resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE]
+    # The DC term only reflects overall brightness, so it does not set the median
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+def dhash(image) -> int:
+    """
+    64-bit difference hash: whether each pixel of a 9x8 thumbnail is darker than its right neighbour.
+
+    Args:
+        image (PIL.Image.Image): Any image.
+
+    Returns:
+        int: The hash.
+    """
+    Image = load_pil()[0]
+    pixels = np.asarray(image.convert("L").resize((_HASH_SIZE + 1, _HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def hash_image(image_base64: str) -> tuple:
+    """
+    pHash and dHash of a Base64 encoded image.
+
+    Returns:
+        tuple: ``(phash, dhash)``.
+    """
+    Image = load_pil()[0]
+    with Image.open(io.BytesIO(base64.b64decode(image_base64))) as image:
+        # Decode JPEGs at reduced scale; the hashes only look at a 32x32 thumbnail
+        image.draft("L", (4 * _DCT_SIZE, 4 * _DCT_SIZE))
+        return phash(image), dhash(image)
+
+
+def hamming(hashes: np.ndarray, value: int) -> np.ndarray:
+    """Bit distance between each of an array of uint64 hashes and one hash."""
+    diff = np.bitwise_xor(hashes, np.uint64(value))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff)
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _details(words: list) -> set:
+    # Numbers and capitalized words: names, places, dates, amounts, reference numbers
+    return {word.casefold() for word in words if word[0].isupper() or any(c.isdigit() for c in word)}
+
+
+def same_text(text: str, other: str) -> bool:
+    """
+    Whether two OCR extractions read as the same document.
+
+    Both must have the same numbers and capitalized words, and their words
+    must be at least ``TEXT_THRESHOLD`` similar in order. Two pictures
+    without text match.
+
+    Args:
+        text (str): Extracted text of one upload.
+        other (str): Extracted text of another.
+
+    Returns:
+        bool: True if they are the same.
+    """
+    words, other_words = _WORD.findall(text), _WORD.findall(other)
+    if not words or not other_words:
+        return not words and not other_words
+    if _details(words) != _details(other_words):
+        return False
+    matcher = SequenceMatcher(None, [w.casefold() for w in words], [w.casefold() for w in other_words], autojunk=False)
+    return matcher.ratio() >= TEXT_THRESHOLD
+
+
+def reusable_text(text: str) -> bool:
+    """Whether an extraction is sparse enough to hand to another upload: a few words and no numbers."""
+    words = _WORD.findall(text)
+    return len(words) <= REUSE_MAX_WORDS and not any(c.isdigit() for c in text)
+
+
+class Incident(NamedTuple):
+    """A stored report and how often it has been submitted."""
+
+    id: int
+    pages: int
+    result: dict
+    reports: int
+    created_at: float
+    updated_at: float
+
+
+class ImageIndex:
+    """SQLite-backed perceptual-hash index of processed reports."""
+
+    def __init__(self, path=IMAGE_INDEX_PATH, phash_threshold=PHASH_THRESHOLD, dhash_threshold=DHASH_THRESHOLD):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.phash_threshold = phash_threshold
+        self.dhash_threshold = dhash_threshold
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS incidents ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, pages INTEGER NOT NULL, result TEXT NOT NULL, "
+            "reports INTEGER NOT NULL DEFAULT 1, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "incident_id INTEGER NOT NULL, page INTEGER NOT NULL, phash TEXT NOT NULL, dhash TEXT NOT NULL, "
+            "PRIMARY KEY (incident_id, page))"
+        )
+        # First-page hashes of every incident, grown by doubling
+        self._size = 0
+        self._last_id = 0
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._pages = np.zeros(0, dtype=np.int32)
+        self._phashes = np.zeros(0, dtype=np.uint64)
+        self._dhashes = np.zeros(0, dtype=np.uint64)
+
+    def _refresh(self) -> None:
+        # Pick up incidents added since the last refresh, by this or another process
+        rows = self._db.execute(
+            "SELECT i.id, i.pages, p.phash, p.dhash FROM incidents i JOIN pages p ON p.incident_id = i.id AND p.page = 0 "
+            "WHERE i.id > ? ORDER BY i.id",
+            (self._last_id,),
+        ).fetchall()
+        if not rows:
+            return
+        needed = self._size + len(rows)
+        if needed > len(self._ids):
+            capacity = max(needed, 2 * len(self._ids), 256)
+            for name in ("_ids", "_pages", "_phashes", "_dhashes"):
+                old = getattr(self, name)
+                grown = np.zeros(capacity, dtype=old.dtype)
+                grown[: self._size] = old[: self._size]
+                setattr(self, name, grown)
+        end = self._size + len(rows)
+        self._ids[self._size:end] = [row[0] for row in rows]
+        self._pages[self._size:end] = [row[1] for row in rows]
+        self._phashes[self._size:end] = [int(row[2], 16) for row in rows]
+        self._dhashes[self._size:end] = [int(row[3], 16) for row in rows]
+        self._size = end
+        self._last_id = rows[-1][0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._size
+
+    def _page_hashes(self, incident_id: int) -> list:
+        return self._db.execute(
+            "SELECT phash, dhash FROM pages WHERE incident_id = ? ORDER BY page", (incident_id,)
+        ).fetchall()
+
+    def _incident(self, incident_id: int) -> Optional[Incident]:
+        row = self._db.execute(
+            "SELECT id, pages, result, reports, created_at, updated_at FROM incidents WHERE id = ?", (incident_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Incident(row[0], row[1], json.loads(row[2]), row[3], row[4], row[5])
+
+    def _candidates(self, hashes: list, phash_threshold: int, dhash_threshold: int) -> Iterator[Incident]:
+        # Incidents whose pages all match, closest first page first; the caller holds the lock
+        self._refresh()
+        size = self._size
+        phash_distance = hamming(self._phashes[:size], hashes[0][0])
+        dhash_distance = hamming(self._dhashes[:size], hashes[0][1])
+        candidates = np.flatnonzero(
+            (self._pages[:size] == len(hashes))
+            & (phash_distance <= phash_threshold)
+            & (dhash_distance <= dhash_threshold)
+        )
+        for index in candidates[np.argsort(phash_distance[candidates], kind="stable")]:
+            incident_id = int(self._ids[index])
+            stored = self._page_hashes(incident_id)
+            if all(
+                bin(p ^ int(sp, 16)).count("1") <= phash_threshold
+                and bin(d ^ int(sd, 16)).count("1") <= dhash_threshold
+                for (p, d), (sp, sd) in zip(hashes[1:], stored[1:])
+            ):
+                yield self._incident(incident_id)
+
+    def find(self, hashes: list, text: str) -> Optional[Incident]:
+        """
+        Find the stored incident whose pages all match the given page hashes and whose text is the same.
+
+        Args:
+            hashes (list): ``(phash, dhash)`` per page, in page order.
+            text (str): Text extracted from those pages.
+
+        Returns:
+            Incident | None: The closest match, or None.
+        """
+        if not hashes:
+            return None
+        with self._lock:
+            for incident in self._candidates(hashes, self.phash_threshold, self.dhash_threshold):
+                if same_text(text, incident.result.get("extracted_text", "")):
+                    return incident
+        return None
+
+    def find_extraction(self, hashes: list) -> Optional[str]:
+        """
+        Text of an earlier incident that can stand in for OCR of these pages.
+
+        Args:
+            hashes (list): ``(phash, dhash)`` per page, in page order.
+
+        Returns:
+            str | None: The extraction of a near-exact match whose text passes
+            ``reusable_text``, or None.
+        """
+        if not hashes:
+            return None
+        with self._lock:
+            for incident in self._candidates(hashes, REUSE_PHASH_THRESHOLD, REUSE_DHASH_THRESHOLD):
+                text = incident.result.get("extracted_text", "")
+                if reusable_text(text):
+                    return text
+        return None
+
+    def record(self, hashes: list, result: dict) -> tuple:
+        """
+        Count a processed report against a matching incident, or store it as a new one.
+
+        The lookup and the write are one transaction, so workers filing the
+        same pictures at once end up with one incident.
+
+        Args:
+            hashes (list): ``(phash, dhash)`` per page, in page order.
+            result (dict): Stage texts of the report, including ``"extracted_text"``.
+
+        Returns:
+            tuple: ``(incident, matched)`` with the incident as updated.
+        """
+        text = result.get("extracted_text", "")
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                match = next(
+                    (
+                        incident
+                        for incident in self._candidates(hashes, self.phash_threshold, self.dhash_threshold)
+                        if same_text(text, incident.result.get("extracted_text", ""))
+                    ),
+                    None,
+                )
+                if match is not None:
+                    self._db.execute(
+                        "UPDATE incidents SET reports = reports + 1, updated_at = ? WHERE id = ?", (now, match.id)
+                    )
+                    incident_id = match.id
+                else:
+                    cursor = self._db.execute(
+                        "INSERT INTO incidents (pages, result, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                        (len(hashes), json.dumps(result, ensure_ascii=False), now, now),
+                    )
+                    incident_id = cursor.lastrowid
+                    self._db.executemany(
+                        "INSERT INTO pages (incident_id, page, phash, dhash) VALUES (?, ?, ?, ?)",
+                        [(incident_id, page, f"{p:016x}", f"{d:016x}") for page, (p, d) in enumerate(hashes)],
+                    )
+                incident = self._incident(incident_id)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return incident, match is not None
+
+    def top(self, limit=20) -> list:
+        """Incidents with the most submissions, most reported first."""
+        with self._lock:
+            ids = self._db.execute(
+                "SELECT id FROM incidents WHERE reports > 1 ORDER BY reports DESC, updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return [self._incident(row[0]) for row in ids]
+
+    def stats(self) -> dict:
+        """Incident and submission counts."""
+        with self._lock:
+            incidents, reports = self._db.execute("SELECT COUNT(*), COALESCE(SUM(reports), 0) FROM incidents").fetchone()
+        return {"incidents": incidents, "reports": reports, "duplicates": reports - incidents}
+
+
+_index: Optional[ImageIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_image_index() -> ImageIndex:
+    """Return the process-wide image index, opening it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ImageIndex()
+        return _index
+
+
+def hash_report(images: list) -> Optional[list]:
+    """
+    Perceptual hashes of a report's pages.
+
+    Args:
+        images (list): Base64 encoded images, one per page.
+
+    Returns:
+        list | None: ``(phash, dhash)`` per page, or None without Pillow.
+    """
+    if load_pil() is None:
+        return None
+    with timed("image_hash"):
+        return [hash_image(image) for image in images]
+
+
+def reuse_extraction(hashes: Optional[list]) -> Optional[str]:
+    """
+    Look up an extraction that makes OCR of a photo report unnecessary (see ``ImageIndex.find_extraction``).
+
+    Args:
+        hashes (list | None): Page hashes from ``hash_report``.
+
+    Returns:
+        str | None: Text to use instead of calling the vision model, or None.
+    """
+    if not hashes:
+        return None
+    with timed("image_lookup"):
+        text = get_image_index().find_extraction(hashes)
+        if text is not None:
+            annotate(cache_hit=True)
+        return text
+
+
+def record_report(hashes: list, result: dict) -> Incident:
+    """
+    File a processed photo report under an earlier incident of the same pictures and text, or as a new one.
+
+    Only the incident's submission count changes on a match; the stored
+    results are never returned for display in place of ``result``.
+
+    Args:
+        hashes (list): Page hashes from ``hash_report``.
+        result (dict): Stage texts of this report, including ``"extracted_text"``.
+
+    Returns:
+        Incident: The matched incident, counted once more, or the new one.
+    """
+    with timed("image_match"):
+        incident, matched = get_image_index().record(hashes, result)
+        if matched:
+            annotate(cache_hit=True)
+        return incident
+
+
+def incident_info(incident: Incident) -> dict:
+    """Summary of an incident suitable for a job result or the UI."""
+    return {"id": incident.id, "reports": incident.reports, "first_seen": incident.created_at}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the report image index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    top = commands.add_parser("top", help="List the most duplicated incidents.")
+    top.add_argument("--limit", type=int, default=20)
+    commands.add_parser("stats", help="Print incident and duplicate counts.")
+    args = parser.parse_args(argv)
+
+    index = get_image_index()
+    if args.command == "top":
+        for incident in index.top(args.limit):
+            first_seen = time.strftime("%Y-%m-%d %H:%M", time.localtime(incident.created_at))
+            summary = " ".join((incident.result.get("summary") or incident.result.get("extracted_text") or "").split())
+            print(f"#{incident.id}\t{incident.reports} reports\tsince {first_seen}\t{summary[:80]}")
+    else:
+        print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,265 @@
 import base64
+import functools
+import importlib.util
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional, Union
 
+from helpers.metrics import instrumented
+
+# Largest side worth sending to the vision model; bigger images only cost bandwidth
+MAX_IMAGE_DIMENSION = int(os.getenv("ENGAGEGOV_IMAGE_MAX_DIMENSION", 1568))
+JPEG_QUALITY = int(os.getenv("ENGAGEGOV_IMAGE_QUALITY", 85))
+
+# PDF pages are rendered at this resolution, and only this many are read
+PDF_RENDER_DPI = int(os.getenv("ENGAGEGOV_PDF_DPI", 150))
+MAX_PDF_PAGES = int(os.getenv("ENGAGEGOV_PDF_MAX_PAGES", 20))
+
+# Uploads prepared at once; decoding and resizing release the GIL
+ENCODE_WORKERS = int(os.getenv("ENGAGEGOV_ENCODE_WORKERS", 4))
+
+# Multiple of 3 so each chunk encodes to base64 without padding
+_CHUNK_SIZE = 3 * 256 * 1024
+
+# File signatures of the image formats the vision model accepts, by media type
+_IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+ImageSource = Union[str, bytes, bytearray, memoryview, BinaryIO]
+
+
+@functools.lru_cache(maxsize=None)
+def load_pil() -> Optional[tuple]:
+    """Pillow's ``(Image, ImageOps)``, imported on first use, or None if it is not installed."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # Pillow is optional; without it images are sent as uploaded
+        return None
+    return Image, ImageOps
+
+
+def pdf_supported() -> bool:
+    """True if PDF reports can be rasterized, which needs pypdfium2 and Pillow."""
+    return importlib.util.find_spec("pypdfium2") is not None and load_pil() is not None
+
+
+def is_pdf(source: ImageSource) -> bool:
+    """True if the path, bytes or file holds a PDF, judged by its signature."""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            header = f.read(5)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        header = bytes(source[:5])
+    else:
+        source.seek(0)
+        header = source.read(5)
+        source.seek(0)
+    return header == b'%PDF-'
+
+
+def image_media_type(image_base64: str) -> str:
+    """
+    Media type of a Base64 encoded image, judged by its signature.
+
+    Prepared images are JPEGs, but without Pillow uploads are sent as they
+    are, so their data URL must name their own format.
+
+    Args:
+        image_base64 (str): Base64 encoded image.
+
+    Returns:
+        str: e.g. ``"image/png"``; ``"image/jpeg"`` if the format is not recognized.
+    """
+    header = base64.b64decode(image_base64[:16])
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    for signature, media_type in _IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return media_type
+    return 'image/jpeg'
+
+
+@instrumented("encode")
 def encode_image_to_base64(image_path: str) -> str:
     """
     Encode an image to a Base64 string.
 
+    The file is read and encoded in chunks, so only the encoded output is
+    held in memory in full.
+
     Args:
         image_path (str): Path to the image file.
 
     Returns:
         str: Base64 encoded string of the image.
     """
+    parts = []
     with open(image_path, 'rb') as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        while chunk := image_file.read(_CHUNK_SIZE):
+            parts.append(base64.b64encode(chunk).decode('ascii'))
+    return ''.join(parts)
+
+def encode_bytes_to_base64(buffer: Union[bytes, bytearray, memoryview]) -> str:
+    """
+    Encode an in-memory buffer to a Base64 string without copying it first.
+
+    Args:
+        buffer (bytes | bytearray | memoryview): Raw image bytes, e.g.
+            ``uploaded_file.getbuffer()``.
+
+    Returns:
+        str: Base64 encoded string of the buffer.
+    """
+    return base64.b64encode(buffer).decode('ascii')
+
+def prepare_image(source: ImageSource, max_dimension: Optional[int] = MAX_IMAGE_DIMENSION, quality=JPEG_QUALITY) -> bytes:
+    """
+    Downscale and recompress an image for the vision model.
+
+    JPEGs are decoded at reduced scale where possible, so a large photo is
+    never fully decoded. Images that are already small JPEGs are returned
+    untouched. Without Pillow the original bytes are returned in their own
+    format; ``image_media_type`` tells which.
+
+    Args:
+        source (str | bytes | file): Path, raw bytes or a readable binary file.
+        max_dimension (int | None): Longest side of the output; None keeps the size.
+        quality (int): JPEG quality of the recompressed image.
+
+    Returns:
+        bytes: JPEG image bytes, or the original bytes without Pillow.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    elif not isinstance(source, str):
+        source.seek(0)
+
+    pil = load_pil()
+    if pil is None:
+        if isinstance(source, str):
+            with open(source, 'rb') as image_file:
+                return image_file.read()
+        return source.read()
+
+    Image, ImageOps = pil
+    with Image.open(source) as image:
+        # Judged on the stored size: draft() may shrink a large JPEG to within the limit
+        fits = not max_dimension or max(image.size) <= max_dimension
+        if image.format == 'JPEG' and fits and not image.getexif().get(0x0112):
+            if isinstance(source, str):
+                with open(source, 'rb') as image_file:
+                    return image_file.read()
+            source.seek(0)
+            return source.read()
+
+        if max_dimension:
+            image.draft('RGB', (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if max_dimension:
+            image.thumbnail((max_dimension, max_dimension))
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+
+@instrumented("encode")
+def encode_image(source: ImageSource, max_dimension: Optional[int] = MAX_IMAGE_DIMENSION, quality=JPEG_QUALITY) -> str:
+    """
+    Downscale an image and encode it to a Base64 JPEG string.
+
+    Args:
+        source (str | bytes | file): Path, raw bytes or a readable binary file
+            such as a Streamlit ``UploadedFile``.
+        max_dimension (int | None): Longest side of the output; None keeps the size.
+        quality (int): JPEG quality of the recompressed image.
+
+    Returns:
+        str: Base64 encoded string of the prepared image.
+    """
+    return encode_bytes_to_base64(prepare_image(source, max_dimension, quality))
+
+@instrumented("render_pdf")
+def render_pdf_pages(source: ImageSource, dpi=PDF_RENDER_DPI, max_pages=MAX_PDF_PAGES,
+                     max_dimension: Optional[int] = MAX_IMAGE_DIMENSION, quality=JPEG_QUALITY) -> list:
+    """
+    Rasterize the pages of a PDF to JPEGs ready for the vision model.
+
+    Args:
+        source (str | bytes | file): Path, raw bytes or a readable binary file.
+        dpi (int): Render resolution.
+        max_pages (int): Pages read at most; later pages are ignored.
+        max_dimension (int | None): Longest side of each page image.
+        quality (int): JPEG quality.
+
+    Returns:
+        list: JPEG bytes of each page, in page order.
+
+    Raises:
+        RuntimeError: If pypdfium2 or Pillow is not installed.
+    """
+    if not pdf_supported():
+        raise RuntimeError("PDF reports need the pypdfium2 and Pillow packages.")
+    import pypdfium2
+
+    if not isinstance(source, (str, bytes, bytearray, memoryview)):
+        source.seek(0)
+        source = source.read()
+    pdf = pypdfium2.PdfDocument(bytes(source) if isinstance(source, (bytearray, memoryview)) else source)
+    try:
+        pages = []
+        for index in range(min(len(pdf), max_pages)):
+            page = pdf[index]
+            try:
+                image = page.render(scale=dpi / 72).to_pil()
+            finally:
+                page.close()
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            if max_dimension:
+                image.thumbnail((max_dimension, max_dimension))
+            output = io.BytesIO()
+            image.save(output, format='JPEG', quality=quality, optimize=True)
+            pages.append(output.getvalue())
+        return pages
+    finally:
+        pdf.close()
+
+def encode_document(source: ImageSource, max_dimension: Optional[int] = MAX_IMAGE_DIMENSION, quality=JPEG_QUALITY) -> list:
+    """
+    Encode an uploaded image or PDF to one Base64 JPEG string per page.
+
+    Args:
+        source (str | bytes | file): Path, raw bytes or a readable binary file.
+        max_dimension (int | None): Longest side of each page image.
+        quality (int): JPEG quality.
+
+    Returns:
+        list: Base64 encoded pages; a single image gives a one-item list.
+    """
+    if is_pdf(source):
+        return [encode_bytes_to_base64(page) for page in render_pdf_pages(source, max_dimension=max_dimension, quality=quality)]
+    return [encode_image(source, max_dimension, quality)]
+
+def encode_documents(sources: list, max_dimension: Optional[int] = MAX_IMAGE_DIMENSION, quality=JPEG_QUALITY) -> list:
+    """
+    Encode several uploads of one report concurrently.
+
+    Args:
+        sources (list): Paths, raw bytes or readable binary files, images or PDFs.
+        max_dimension (int | None): Longest side of each page image.
+        quality (int): JPEG quality.
+
+    Returns:
+        list: Base64 encoded pages of every upload, in upload and page order.
+    """
+    if len(sources) == 1:
+        return encode_document(sources[0], max_dimension, quality)
+    with ThreadPoolExecutor(min(len(sources), ENCODE_WORKERS)) as executor:
+        documents = executor.map(lambda source: encode_document(source, max_dimension, quality), sources)
+        return [page for pages in documents for page in pages]
@@ -0,0 +1,544 @@
+"""
+Local background job queue for report analysis and inquiries.
+
+Jobs live in SQLite, so a job keeps running when the Streamlit script that
+submitted it reruns, and its result is still there after a page refresh.
+Worker threads in the app process claim queued jobs; more workers can run
+as separate processes against the same database:
+
+    python -m helpers.jobs worker [--threads 4]
+    python -m helpers.jobs status JOB_ID
+    python -m helpers.jobs stats
+
+Submitting a job identical to one that is queued, running or recently
+finished returns the existing job instead of doing the work twice. Jobs
+submitted with an ``owner`` (the app uses an unguessable per-session token)
+can then only be read by owners that submitted them, so a coalesced job
+does not hand one citizen's results to anyone holding its ID.
+Set ``ENGAGEGOV_JOB_WORKERS=0`` to leave all work to external workers.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, NamedTuple, Optional
+
+from helpers.metrics import get_metrics, timed
+
+JOBS_PATH = os.getenv("ENGAGEGOV_JOBS_PATH", os.path.join(".cache", "jobs.sqlite3"))
+
+# Worker threads started in the app process
+JOB_WORKERS = int(os.getenv("ENGAGEGOV_JOB_WORKERS", 4))
+
+# Seconds a finished job answers identical submissions, and is kept at all
+JOB_RESULT_TTL = float(os.getenv("ENGAGEGOV_JOB_RESULT_TTL", 3600))
+JOB_RETENTION = float(os.getenv("ENGAGEGOV_JOB_RETENTION", 24 * 3600))
+
+# A running job not heard from for this long is assumed lost with its worker
+JOB_STALE_AFTER = float(os.getenv("ENGAGEGOV_JOB_STALE_AFTER", 120))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# Minimum seconds between progress writes for one job
+_PROGRESS_INTERVAL = 0.1
+
+
+class Job(NamedTuple):
+    """Snapshot of a job's state."""
+
+    id: str
+    kind: str
+    status: str
+    payload: dict
+    progress: dict
+    result: Optional[dict]
+    error: Optional[str]
+    error_type: Optional[str]
+    created_at: float
+    updated_at: float
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+_COLUMNS = "id, kind, status, payload, progress, result, error, error_type, created_at, updated_at"
+
+
+def _job(row) -> Job:
+    id_, kind, status, payload, progress, result, error, error_type, created_at, updated_at = row
+    return Job(
+        id_,
+        kind,
+        status,
+        json.loads(payload),
+        json.loads(progress),
+        json.loads(result) if result is not None else None,
+        error,
+        error_type,
+        created_at,
+        updated_at,
+    )
+
+
+def job_key(kind: str, payload: dict) -> str:
+    """Identity of a job's work, used to coalesce duplicate submissions."""
+    canonical = json.dumps([kind, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    """
+    SQLite table of jobs, safe to share between threads and processes.
+
+    State changes that must not race (submitting with coalescing, claiming)
+    run under ``BEGIN IMMEDIATE`` so only one writer decides at a time.
+    """
+
+    def __init__(self, path=JOBS_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, progress TEXT NOT NULL DEFAULT '{}', result TEXT, "
+            "error TEXT, error_type TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        # Who may read a job; ``active`` until the owner has shown its outcome
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_owners ("
+            "job_id TEXT NOT NULL, owner TEXT NOT NULL, kind TEXT NOT NULL, active INTEGER NOT NULL DEFAULT 1, "
+            "created_at REAL NOT NULL, PRIMARY KEY (job_id, owner))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS job_owners_owner ON job_owners (owner, kind, created_at)")
+
+    def _transaction(self, fn: Callable):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def submit(self, kind: str, payload: dict, reuse_for=JOB_RESULT_TTL, owner: Optional[str] = None) -> tuple:
+        """
+        Queue a job unless an identical one is pending or finished recently.
+
+        Args:
+            kind (str): Registered job kind.
+            payload (dict): JSON-serializable job input.
+            reuse_for (float): Seconds a finished job still answers new submissions.
+            owner (str | None): Submitter granted access to the job, new or existing.
+
+        Returns:
+            tuple: ``(job_id, created)``, where ``created`` is False if an
+            existing job was returned.
+        """
+        key = job_key(kind, payload)
+
+        def insert():
+            now = time.time()
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE key = ? AND "
+                "(status IN (?, ?) OR (status = ? AND updated_at >= ?)) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, QUEUED, RUNNING, DONE, now - reuse_for),
+            ).fetchone()
+            if row:
+                job_id, created = row[0], False
+            else:
+                job_id, created = uuid.uuid4().hex, True
+                self._db.execute(
+                    "INSERT INTO jobs (id, kind, key, status, payload, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, key, QUEUED, json.dumps(payload, ensure_ascii=False), now, now),
+                )
+            if owner is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO job_owners (job_id, owner, kind, active, created_at) VALUES (?, ?, ?, 1, ?)",
+                    (job_id, owner, kind, now),
+                )
+            return job_id, created
+
+        return self._transaction(insert)
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        """
+        Current state of a job.
+
+        Args:
+            job_id (str): Job to read.
+            owner (str | None): Reader; if given, only a job it submitted is returned.
+
+        Returns:
+            Job | None: The job, or None if it does not exist, was purged or
+            belongs to someone else.
+        """
+        with self._lock:
+            if owner is None:
+                row = self._db.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            else:
+                row = self._db.execute(
+                    f"SELECT {_COLUMNS} FROM jobs WHERE id = ? AND id IN "
+                    "(SELECT job_id FROM job_owners WHERE owner = ?)",
+                    (job_id, owner),
+                ).fetchone()
+        return _job(row) if row else None
+
+    def latest(self, owner: str, kind: str) -> Optional[str]:
+        """ID of the owner's most recent job of a kind whose outcome it has not yet released."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT job_id FROM job_owners WHERE owner = ? AND kind = ? AND active = 1 "
+                "ORDER BY created_at DESC LIMIT 1",
+                (owner, kind),
+            ).fetchone()
+        return row[0] if row else None
+
+    def release(self, job_id: str, owner: str) -> None:
+        """Stop offering a job to ``latest`` for an owner that has shown its outcome."""
+        with self._lock:
+            self._db.execute("UPDATE job_owners SET active = 0 WHERE job_id = ? AND owner = ?", (job_id, owner))
+
+    def claim(self, kinds: list, stale_after=JOB_STALE_AFTER) -> Optional[Job]:
+        """
+        Take the oldest queued job of the given kinds and mark it running.
+
+        Jobs left running by a worker that stopped heartbeating are taken
+        over as if they were queued.
+
+        Args:
+            kinds (list): Job kinds this worker can run.
+            stale_after (float): Seconds without a heartbeat before a running job is taken over.
+
+        Returns:
+            Job | None: The claimed job, or None if there is nothing to do.
+        """
+        placeholders = ", ".join("?" * len(kinds))
+
+        def take():
+            now = time.time()
+            row = self._db.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE kind IN ({placeholders}) AND "
+                "(status = ? OR (status = ? AND updated_at < ?)) ORDER BY created_at LIMIT 1",
+                (*kinds, QUEUED, RUNNING, now - stale_after),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (RUNNING, now, row[0]))
+            return _job(row)._replace(status=RUNNING, updated_at=now)
+
+        return self._transaction(take)
+
+    def heartbeat(self, job_ids: list) -> None:
+        """Mark running jobs as still alive."""
+        if not job_ids:
+            return
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE status = ? AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), RUNNING, *job_ids),
+            )
+
+    def set_progress(self, job_id: str, progress: dict) -> None:
+        """Replace a running job's progress snapshot."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (json.dumps(progress, ensure_ascii=False), time.time(), job_id, RUNNING),
+            )
+
+    def finish(self, job_id: str, result: dict) -> None:
+        """Record a job's result."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                (DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: Exception) -> None:
+        """Record the exception a job failed with."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, error_type = ?, updated_at = ? WHERE id = ?",
+                (FAILED, str(error), type(error).__name__, time.time(), job_id),
+            )
+
+    def purge(self, older_than=JOB_RETENTION) -> int:
+        """
+        Delete finished jobs last updated more than ``older_than`` seconds ago.
+
+        Returns:
+            int: Number of jobs deleted.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - older_than),
+            )
+            self._db.execute("DELETE FROM job_owners WHERE job_id NOT IN (SELECT id FROM jobs)")
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        """Number of jobs in each status."""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)} | dict(rows)
+
+
+# Job kind -> function(payload, report_progress) returning the result dict
+_handlers: dict = {}
+
+
+def register(kind: str):
+    """
+    Decorator registering the function that runs jobs of a kind.
+
+    The function is called as ``fn(payload, report_progress)`` in a worker
+    thread, may call ``report_progress(dict)`` with partial results as often
+    as it likes (writes are throttled), and returns a JSON-serializable dict.
+    Exceptions it raises mark the job failed.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        _handlers[kind] = fn
+        return fn
+
+    return decorator
+
+
+class JobQueue:
+    """
+    Worker threads running jobs from a JobStore.
+
+    Idle workers wake up when this process submits a job and otherwise poll
+    the store every ``poll_interval`` seconds, picking up jobs submitted by
+    other processes or abandoned by dead workers.
+    """
+
+    def __init__(self, store: JobStore, workers=JOB_WORKERS, poll_interval=1.0):
+        self.store = store
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._running: set = set()
+        self._running_lock = threading.Lock()
+        self._threads: list = []
+        self._submissions = 0
+
+    def start(self) -> "JobQueue":
+        """Start the worker threads and the heartbeat thread."""
+        if self._threads or not self.workers:
+            return self
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"engagegov-jobs-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="engagegov-jobs-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the workers to exit after their current job and wait for them."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, kind: str, payload: dict, owner: Optional[str] = None) -> str:
+        """
+        Queue a job, coalescing it with an identical pending or recent one.
+
+        Args:
+            kind (str): Registered job kind, e.g. "report" or "inquiry".
+            payload (dict): JSON-serializable job input.
+            owner (str | None): Submitter to grant access to the job.
+
+        Returns:
+            str: Job ID to poll with ``get``.
+        """
+        if kind not in _handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id, created = self.store.submit(kind, payload, owner=owner)
+        if created:
+            self._wakeup.set()
+            self._submissions += 1
+            if self._submissions % 100 == 0:
+                self.store.purge()
+        return job_id
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        """Current state of a job, if ``owner`` (when given) submitted it."""
+        return self.store.get(job_id, owner)
+
+    def latest(self, owner: str, kind: str) -> Optional[str]:
+        """The owner's most recent unreleased job of a kind (see ``JobStore.latest``)."""
+        return self.store.latest(owner, kind)
+
+    def release(self, job_id: str, owner: str) -> None:
+        """Mark a job's outcome as shown to its owner."""
+        self.store.release(job_id, owner)
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            job = self.store.claim(list(_handlers))
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.run(job)
+
+    def run(self, job: Job) -> None:
+        """Run a claimed job to completion and record its outcome."""
+        last_write = 0.0
+
+        def report_progress(progress: dict) -> None:
+            nonlocal last_write
+            now = time.monotonic()
+            if now - last_write >= _PROGRESS_INTERVAL:
+                last_write = now
+                self.store.set_progress(job.id, progress)
+
+        with self._running_lock:
+            self._running.add(job.id)
+        get_metrics().observe(f"job_{job.kind}_wait", max(0.0, job.updated_at - job.created_at))
+        try:
+            with timed(f"job_{job.kind}"):
+                result = _handlers[job.kind](job.payload, report_progress)
+        except Exception as e:
+            self.store.fail(job.id, e)
+        else:
+            self.store.finish(job.id, result)
+        finally:
+            with self._running_lock:
+                self._running.discard(job.id)
+
+    def _heartbeat(self) -> None:
+        while not self._stopping.wait(JOB_STALE_AFTER / 4):
+            with self._running_lock:
+                running = list(self._running)
+            self.store.heartbeat(running)
+
+
+@register("report")
+def run_report(payload: dict, report_progress: Callable) -> dict:
+    """
+    Extract, summarize and analyse one image report.
+
+    A photo report that is a near-exact copy of an earlier one with only a
+    few words and no numbers in it reuses that extraction instead of calling
+    the vision model; every other report is read afresh. Summary and
+    insights always run. A photo report is then filed in
+    ``helpers.image_index``, either under an earlier incident with the same
+    pictures and text, whose count goes up, or as a new incident.
+
+    Args:
+        payload (dict): ``{"images": [base64 JPEG, ...], "photos": bool}``
+            with one image per photo or PDF page, in order, and whether they
+            are all photos; ``{"image": base64 JPEG}`` for one.
+        report_progress (Callable): Receives ``{"stage", "text", "results"}``
+            snapshots as stage text streams in.
+
+    Returns:
+        dict: Text of each stage in ``pipeline.STAGES``, plus ``"incident"``
+        (``{"id", "reports", "first_seen"}``) for photo reports that could be indexed.
+    """
+    from helpers.image_index import hash_report, incident_info, record_report, reuse_extraction
+    from helpers.pipeline import iter_report_stages
+
+    images = payload["images"] if "images" in payload else [payload["image"]]
+    # Documents and scans are never matched: different people's filled-in forms look alike
+    hashes = hash_report(images) if payload.get("photos") else None
+    results = {}
+    for event in iter_report_stages(images, stream=True, extracted_text=reuse_extraction(hashes)):
+        if event.done:
+            results[event.stage] = event.text
+        report_progress({"stage": event.stage, "text": event.text, "results": results})
+    if hashes is not None:
+        results["incident"] = incident_info(record_report(hashes, results))
+    return results
+
+
+@register("inquiry")
+def run_inquiry(payload: dict, report_progress: Callable) -> dict:
+    """
+    Answer one inquiry with the Langflow flow.
+
+    Args:
+        payload (dict): ``{"query": text}``.
+        report_progress (Callable): Receives ``{"text"}`` with the reply so far.
+
+    Returns:
+        dict: ``{"response", "messages"}`` with the display text of the
+        reply and the raw message texts it was made from.
+    """
+    from helpers.flow_utils import APPLICATION_TOKEN, ENDPOINT, FlowStream, flow_messages, parse_flow_response
+
+    stream = FlowStream(payload["query"], ENDPOINT, APPLICATION_TOKEN)
+    text = ""
+    for chunk in stream:
+        text += chunk
+        report_progress({"text": text})
+    return {"response": parse_flow_response(stream.result), "messages": flow_messages(stream.result)}
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    """Return the process-wide job queue, starting its workers on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(JobStore()).start()
+        return _queue
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run or inspect background jobs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker_parser = commands.add_parser("worker", help="Run jobs until interrupted")
+    worker_parser.add_argument("--threads", type=int, default=max(JOB_WORKERS, 1))
+    status_parser = commands.add_parser("status", help="Show one job")
+    status_parser.add_argument("job_id")
+    commands.add_parser("stats", help="Count jobs by status")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        queue = JobQueue(JobStore(), workers=args.threads).start()
+        print(f"Running {args.threads} job workers on {JOBS_PATH}; press Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            queue.stop(timeout=30)
+    elif args.command == "status":
+        job = JobStore().get(args.job_id)
+        if job is None:
+            raise SystemExit(f"No job {args.job_id}")
+        print(json.dumps(job._asdict(), indent=2, ensure_ascii=False))
+    else:
+        for status, count in JobStore().stats().items():
+            print(f"{status:8} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+Per-stage latency, token, cost, retry and cache instrumentation.
+
+Every instrumented call (image encoding, each Grok stage, content
+generation, Langflow runs, background jobs) produces one ``StageRecord``
+that is aggregated in a process-wide registry:
+
+    with timed("summarize") as record:
+        ...                           # annotate(cache_hit=True), add_usage(model, usage)
+
+Aggregates are exported as Prometheus text (``prometheus_text()``, or
+served on ``ENGAGEGOV_METRICS_PORT`` at ``/metrics``), and each record is
+appended as a JSON line to ``ENGAGEGOV_METRICS_LOG`` when it is set. The
+admin metrics page in ``pages/`` shows the same numbers.
+"""
+import bisect
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+METRICS_LOG = os.getenv("ENGAGEGOV_METRICS_LOG")
+METRICS_PORT = os.getenv("ENGAGEGOV_METRICS_PORT")
+
+# USD per million prompt and completion tokens, overridable with a JSON object
+# in ENGAGEGOV_MODEL_PRICES, e.g. '{"grok-beta": [5, 15]}'
+MODEL_PRICES = {
+    "grok-beta": (5.0, 15.0),
+    "grok-vision-beta": (5.0, 15.0),
+    **{model: tuple(prices) for model, prices in json.loads(os.getenv("ENGAGEGOV_MODEL_PRICES", "{}")).items()},
+}
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Recent durations kept per stage for percentiles, and recent records for export
+_RECENT_DURATIONS = 1024
+_RECENT_RECORDS = 1000
+
+
+@dataclass
+class StageRecord:
+    """Outcome of one instrumented call."""
+
+    stage: str
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    ok: bool = True
+    error: Optional[str] = None
+    cache_hit: bool = False
+    coalesced: bool = False
+    retries: int = 0
+    first_chunk: Optional[float] = None
+    model: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+
+    def add_usage(self, model: str, usage) -> None:
+        """
+        Add the token counts of an API response and their cost.
+
+        Args:
+            model (str): Model that served the request.
+            usage: The response's ``usage`` object, or None if it had none.
+        """
+        self.model = model
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        self.cost_usd += (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class _StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.duration_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.recent: deque = deque(maxlen=_RECENT_DURATIONS)
+        self.first_chunks: deque = deque(maxlen=_RECENT_DURATIONS)
+        self.tokens: dict = {}  # (model, "prompt" | "completion") -> count
+        self.cost: dict = {}  # model -> USD
+
+    def add(self, record: StageRecord) -> None:
+        self.calls += 1
+        self.errors += not record.ok
+        self.cache_hits += record.cache_hit
+        self.coalesced += record.coalesced
+        self.retries += record.retries
+        self.duration_sum += record.duration
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, record.duration)] += 1
+        self.recent.append(record.duration)
+        if record.first_chunk is not None:
+            self.first_chunks.append(record.first_chunk)
+        if record.model and (record.prompt_tokens or record.completion_tokens):
+            for kind, count in (("prompt", record.prompt_tokens), ("completion", record.completion_tokens)):
+                self.tokens[record.model, kind] = self.tokens.get((record.model, kind), 0) + count
+            self.cost[record.model] = self.cost.get(record.model, 0.0) + record.cost_usd
+
+
+def _percentile(values: list, q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round((len(values) - 1) * q / 100)))]
+
+
+class Metrics:
+    """Thread-safe registry aggregating StageRecords."""
+
+    def __init__(self, log_path: Optional[str] = METRICS_LOG):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._stages: dict = {}
+        self._retries: dict = {}  # (service, reason) -> count
+        self._recent: deque = deque(maxlen=_RECENT_RECORDS)
+        self.started_at = time.time()
+
+    def record(self, record: StageRecord) -> None:
+        """Aggregate a finished record and append it to the JSONL log, if any."""
+        line = json.dumps(asdict(record), ensure_ascii=False)
+        with self._lock:
+            self._stages.setdefault(record.stage, _StageStats()).add(record)
+            self._recent.append(line)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Record a duration measured elsewhere, e.g. time spent queued."""
+        self.record(StageRecord(stage, started_at=time.time() - seconds, duration=seconds))
+
+    def count_retry(self, service: str, rate_limited: bool) -> None:
+        """Count one retried upstream request."""
+        key = (service, "rate_limited" if rate_limited else "error")
+        with self._lock:
+            self._retries[key] = self._retries.get(key, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._retries.clear()
+            self._recent.clear()
+            self.started_at = time.time()
+
+    def snapshot(self) -> dict:
+        """
+        Current aggregates.
+
+        Returns:
+            dict: ``{"stages": {stage: summary}, "retries": {...}, "since": timestamp}``
+            where each summary holds call, error, cache-hit, coalesced and retry
+            counts, mean/p50/p95/p99 latency in milliseconds, tokens and cost.
+        """
+        with self._lock:
+            stages = {}
+            for name, stats in sorted(self._stages.items()):
+                recent = list(stats.recent)
+                summary = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "cache_hits": stats.cache_hits,
+                    "coalesced": stats.coalesced,
+                    "retries": stats.retries,
+                    "mean_ms": 1000 * stats.duration_sum / stats.calls if stats.calls else None,
+                    "prompt_tokens": sum(n for (_, kind), n in stats.tokens.items() if kind == "prompt"),
+                    "completion_tokens": sum(n for (_, kind), n in stats.tokens.items() if kind == "completion"),
+                    "cost_usd": sum(stats.cost.values()),
+                }
+                for q in (50, 95, 99):
+                    value = _percentile(recent, q)
+                    summary[f"p{q}_ms"] = 1000 * value if value is not None else None
+                value = _percentile(list(stats.first_chunks), 50)
+                summary["first_chunk_p50_ms"] = 1000 * value if value is not None else None
+                stages[name] = summary
+            retries = {f"{service}/{reason}": count for (service, reason), count in sorted(self._retries.items())}
+            return {"stages": stages, "retries": retries, "since": self.started_at}
+
+    def recent_jsonl(self) -> str:
+        """The most recent records as JSON lines."""
+        with self._lock:
+            return "".join(line + "\n" for line in self._recent)
+
+    def prometheus_text(self) -> str:
+        """Aggregates in the Prometheus text exposition format."""
+        lines = [
+            "# HELP engagegov_stage_duration_seconds Latency of instrumented calls.",
+            "# TYPE engagegov_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, stats in stages:
+                cumulative = 0
+                for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), stats.buckets):
+                    cumulative += count
+                    lines.append(f'engagegov_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'engagegov_stage_duration_seconds_sum{{stage="{name}"}} {stats.duration_sum:.6f}')
+                lines.append(f'engagegov_stage_duration_seconds_count{{stage="{name}"}} {stats.calls}')
+            counters = (
+                ("calls", "Instrumented calls.", lambda s: s.calls),
+                ("errors", "Instrumented calls that failed.", lambda s: s.errors),
+                ("cache_hits", "Calls answered from the response cache or FAQ index.", lambda s: s.cache_hits),
+                ("coalesced", "Calls that waited on an identical in-flight call.", lambda s: s.coalesced),
+                ("retries", "Upstream retries made by instrumented calls.", lambda s: s.retries),
+            )
+            for metric, help_text, value in counters:
+                lines.append(f"# HELP engagegov_stage_{metric}_total {help_text}")
+                lines.append(f"# TYPE engagegov_stage_{metric}_total counter")
+                lines.extend(f'engagegov_stage_{metric}_total{{stage="{name}"}} {value(stats)}' for name, stats in stages)
+            lines.append("# HELP engagegov_tokens_total Tokens reported by the API.")
+            lines.append("# TYPE engagegov_tokens_total counter")
+            for name, stats in stages:
+                for (model, kind), count in sorted(stats.tokens.items()):
+                    lines.append(f'engagegov_tokens_total{{stage="{name}",model="{model}",kind="{kind}"}} {count}')
+            lines.append("# HELP engagegov_cost_usd_total Estimated API cost.")
+            lines.append("# TYPE engagegov_cost_usd_total counter")
+            for name, stats in stages:
+                for model, cost in sorted(stats.cost.items()):
+                    lines.append(f'engagegov_cost_usd_total{{stage="{name}",model="{model}"}} {cost:.6f}')
+            lines.append("# HELP engagegov_upstream_retries_total Retried upstream requests by service and reason.")
+            lines.append("# TYPE engagegov_upstream_retries_total counter")
+            for (service, reason), count in sorted(self._retries.items()):
+                lines.append(f'engagegov_upstream_retries_total{{service="{service}",reason="{reason}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+_current: contextvars.ContextVar = contextvars.ContextVar("engagegov_stage_record", default=None)
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide metrics registry."""
+    return _metrics
+
+
+@contextmanager
+def bind(record: Optional[StageRecord]):
+    """Make ``record`` the target of ``annotate``, ``add_usage`` and retry counts inside the block."""
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(stage: str):
+    """
+    Time a block as one call of ``stage`` and record it when the block exits.
+
+    An exception marks the record failed and propagates.
+
+    Yields:
+        StageRecord: The record, also reachable through ``annotate``.
+    """
+    record = StageRecord(stage)
+    start = time.perf_counter()
+    try:
+        with bind(record):
+            yield record
+    except BaseException as e:
+        record.ok, record.error = False, type(e).__name__
+        raise
+    finally:
+        record.duration = time.perf_counter() - start
+        _metrics.record(record)
+
+
+def instrumented(stage: str) -> Callable:
+    """Decorator timing every call of a function as ``stage``."""
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def timed_stream(stage: str, open_stream: Callable[[StageRecord], Iterator]) -> Iterator:
+    """
+    Time a stream from its first request to its last chunk as one call of ``stage``.
+
+    Args:
+        stage (str): Stage name.
+        open_stream (Callable): Called with the record, returns the chunk iterator.
+            Use ``bind(record)`` around non-yielding work that should be
+            annotated, such as the request itself.
+
+    Yields:
+        The stream's chunks. A stream closed early is recorded as ``GeneratorExit``.
+    """
+    record = StageRecord(stage)
+    start = time.perf_counter()
+    try:
+        for chunk in open_stream(record):
+            if record.first_chunk is None:
+                record.first_chunk = time.perf_counter() - start
+            yield chunk
+    except BaseException as e:
+        record.ok, record.error = False, type(e).__name__
+        raise
+    finally:
+        record.duration = time.perf_counter() - start
+        _metrics.record(record)
+
+
+async def atimed_stream(stage: str, open_stream: Callable[[StageRecord], AsyncIterator]) -> AsyncIterator:
+    """Async counterpart of ``timed_stream``."""
+    record = StageRecord(stage)
+    start = time.perf_counter()
+    try:
+        async for chunk in open_stream(record):
+            if record.first_chunk is None:
+                record.first_chunk = time.perf_counter() - start
+            yield chunk
+    except BaseException as e:
+        record.ok, record.error = False, type(e).__name__
+        raise
+    finally:
+        record.duration = time.perf_counter() - start
+        _metrics.record(record)
+
+
+def annotate(**fields) -> None:
+    """Set fields such as ``cache_hit=True`` on the current record, if there is one."""
+    record = _current.get()
+    if record is not None:
+        for name, value in fields.items():
+            setattr(record, name, value)
+
+
+def add_usage(model: str, usage) -> None:
+    """Add an API response's token usage to the current record, if there is one."""
+    record = _current.get()
+    if record is not None:
+        record.add_usage(model, usage)
+
+
+def note_retry(service: str, rate_limited: bool) -> None:
+    """Count a retry against the service and the current record."""
+    _metrics.count_retry(service, rate_limited)
+    record = _current.get()
+    if record is not None:
+        record.retries += 1
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(port: Optional[str] = METRICS_PORT, host="0.0.0.0") -> bool:
+    """
+    Serve ``prometheus_text()`` at ``/metrics`` on ``port`` from a daemon thread.
+
+    Does nothing without a port or if the exporter is already running, so
+    it is safe to call on every Streamlit rerun.
+
+    Returns:
+        bool: True if the exporter is running.
+    """
+    global _exporter_started
+    if not port:
+        return False
+    with _exporter_lock:
+        if _exporter_started:
+            return True
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = _metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, int(port)), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="engagegov-metrics", daemon=True).start()
+        _exporter_started = True
+        return True
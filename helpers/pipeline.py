@@ -0,0 +1,433 @@
+import asyncio
+import os
+import queue
+import threading
+from typing import AsyncIterator, Iterator, NamedTuple, Optional, Union
+
+from helpers.api_utils import (
+    CHUNK_PROMPT,
+    OCR_PROMPT,
+    REDUCE_PROMPT,
+    SUMMARY_PROMPT,
+    TEXT_MODEL,
+    VISION_MODEL,
+    cache_key,
+    flights,
+    image_messages,
+    insights_request,
+    length_prompt,
+    text_messages,
+)
+from helpers.cache import get_cache
+from helpers.clients import classify_grok_error, get_async_grok_client
+from helpers.metrics import StageRecord, add_usage, annotate, atimed_stream, bind, timed
+from helpers.rate_limit import acall_with_retry
+from helpers.singleflight import FlightAbandoned
+from helpers.text_budget import (
+    MAX_REDUCE_PASSES,
+    PAGE_BREAK,
+    chunk_budget,
+    plan_reduce,
+    plan_summary,
+)
+
+# Upper bound on Grok requests in flight at once across the whole process
+MAX_CONCURRENCY = int(os.getenv("ENGAGEGOV_MAX_CONCURRENCY", 8))
+
+# Stage names double as the session-state keys the UI stores results under
+STAGES = ("extracted_text", "summary", "insights")
+
+# Separator between the text of consecutive pages of one report; summaries strip headers and footers at it
+PAGE_SEPARATOR = f"\n{PAGE_BREAK}\n"
+
+
+class StageEvent(NamedTuple):
+    """Result of one pipeline stage for one report."""
+
+    stage: str
+    text: str
+    done: bool = True
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_semaphore: Optional[asyncio.Semaphore] = None
+_max_concurrency = MAX_CONCURRENCY
+_DONE = object()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the process-wide event loop, starting its thread on first use.
+
+    All async Grok traffic runs on this one loop so that the connection pool
+    and the concurrency cap are shared by every Streamlit session.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="engagegov-pipeline", daemon=True).start()
+    return _loop
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(_max_concurrency)
+    return _semaphore
+
+
+def set_max_concurrency(limit: int) -> None:
+    """
+    Change the cap on concurrent Grok requests.
+
+    Requests already waiting on the old cap keep it; new ones use the new one.
+
+    Args:
+        limit (int): Maximum number of requests in flight.
+    """
+    global _semaphore, _max_concurrency
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    _max_concurrency = limit
+    _semaphore = None
+
+
+def submit(coro):
+    """
+    Schedule a coroutine on the shared event loop.
+
+    Args:
+        coro: Coroutine to run.
+
+    Returns:
+        concurrent.futures.Future: Future resolving to the coroutine's result.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared event loop and block until it finishes."""
+    return submit(coro).result()
+
+
+async def _acomplete(model: str, prompt: str, payload: str, messages: list, temperature=0.7, max_tokens=500) -> str:
+    cache = get_cache()
+    key = cache_key(model, prompt, payload, temperature, max_tokens)
+    cached = cache.get(key)
+    if cached is not None:
+        annotate(cache_hit=True)
+        return cached
+    led = False
+
+    async def attempt():
+        # Hold a slot only while a request is in flight, not while backing off
+        async with _get_semaphore():
+            return await get_async_grok_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                n=1
+            )
+
+    async def fetch() -> str:
+        nonlocal led
+        led = True
+        cached = cache.get(key)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
+        response = await acall_with_retry(attempt, "xai", classify=classify_grok_error)
+        add_usage(model, response.usage)
+        choice = response.choices[0]
+        content = choice.message.content.strip()
+        if choice.finish_reason != "length":  # A truncated reply is returned but not reused
+            cache.set(key, content)
+        return content
+
+    # Coalesced with identical requests from other reports and from sync callers
+    content = await flights.do_async(key, fetch)
+    annotate(coalesced=not led)
+    return content
+
+
+async def _astream_complete(
+    model: str, prompt: str, payload: str, messages: list, temperature=0.7, max_tokens=500, record: Optional[StageRecord] = None
+) -> AsyncIterator[str]:
+    record = record or StageRecord("stream")
+    cache = get_cache()
+    key = cache_key(model, prompt, payload, temperature, max_tokens)
+    while True:
+        cached = cache.get(key)
+        if cached is not None:
+            record.cache_hit = True
+            yield cached
+            return
+        flight = flights.join(key)
+        if flight.leader:
+            break
+        try:
+            text = await flight.wait_async()
+        except FlightAbandoned:
+            continue
+        record.coalesced = True
+        yield text
+        return
+
+    semaphore = _get_semaphore()
+    held = False
+
+    async def attempt():
+        # Hold a slot while a request is in flight, not while backing off between attempts;
+        # once the stream opens, the slot stays held until it has been read
+        nonlocal held
+        await semaphore.acquire()
+        try:
+            stream = await get_async_grok_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                n=1,
+                stream=True
+            )
+        except BaseException:
+            semaphore.release()
+            raise
+        held = True
+        return stream
+
+    try:
+        try:
+            with bind(record):
+                stream = await acall_with_retry(attempt, "xai", classify=classify_grok_error)
+            record.model = model
+            parts, finish_reason = [], None
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if not parts:
+                    delta = delta.lstrip()
+                parts.append(delta)
+                yield delta
+        finally:
+            if held:
+                semaphore.release()
+        text = "".join(parts).strip()
+        if finish_reason != "length":
+            cache.set(key, text)
+        flight.resolve(text)
+    except Exception as e:
+        flight.fail(e)
+        raise
+    finally:
+        flight.fail(FlightAbandoned(key))
+
+
+async def _astream_stage(stage: str, chunks: AsyncIterator[str]) -> AsyncIterator[StageEvent]:
+    text = ""
+    async for chunk in chunks:
+        text += chunk
+        yield StageEvent(stage, text, done=False)
+    yield StageEvent(stage, text.strip())
+
+
+async def aextract_text_from_image(image_base64: str) -> str:
+    """Async counterpart of ``api_utils.extract_text_from_image``."""
+    with timed("extract"):
+        return await _acomplete(VISION_MODEL, OCR_PROMPT, image_base64, image_messages(image_base64), max_tokens=1000)
+
+
+async def _asummarize_chunk(chunk: str) -> str:
+    max_tokens = chunk_budget(chunk)
+    prompt = length_prompt(CHUNK_PROMPT, max_tokens)
+    with timed("summarize_chunk"):
+        return await _acomplete(TEXT_MODEL, prompt, chunk, text_messages(prompt, chunk), max_tokens=max_tokens)
+
+
+async def asummary_request(text: str) -> tuple:
+    """Async counterpart of ``api_utils.summary_request``; chunks share the loop's request cap."""
+    plan = plan_summary(text)
+    prompt, payload, chunks = SUMMARY_PROMPT, plan.text, plan.chunks
+    for _ in range(MAX_REDUCE_PASSES):
+        if not chunks:
+            break
+        partials = await asyncio.gather(*(_asummarize_chunk(chunk) for chunk in chunks))
+        prompt = REDUCE_PROMPT
+        payload, chunks = plan_reduce(partials)
+    return length_prompt(prompt, plan.max_tokens), payload, plan.max_tokens
+
+
+async def asummarize_text(text: str) -> str:
+    """Async counterpart of ``api_utils.summarize_text``."""
+    with timed("summarize"):
+        prompt, payload, max_tokens = await asummary_request(text)
+        return await _acomplete(TEXT_MODEL, prompt, payload, text_messages(prompt, payload), max_tokens=max_tokens)
+
+
+async def agenerate_insights(summary: str) -> str:
+    """Async counterpart of ``api_utils.generate_insights``."""
+    prompt, max_tokens = insights_request(summary)
+    with timed("insights"):
+        return await _acomplete(TEXT_MODEL, prompt, summary, text_messages(prompt, summary), max_tokens=max_tokens)
+
+
+async def _aextract_pages(pages: list) -> AsyncIterator[StageEvent]:
+    # Pages are read concurrently under the request cap; the text so far is
+    # reported in page order as pages land, skipping pages still in flight
+    texts = [None] * len(pages)
+
+    async def extract(index: int):
+        texts[index] = await aextract_text_from_image(pages[index])
+
+    tasks = [asyncio.ensure_future(extract(index)) for index in range(len(pages))]
+    try:
+        for done in asyncio.as_completed(tasks):
+            await done
+            if None in texts:
+                yield StageEvent("extracted_text", PAGE_SEPARATOR.join(t for t in texts if t), done=False)
+    finally:
+        for task in tasks:
+            task.cancel()
+    yield StageEvent("extracted_text", PAGE_SEPARATOR.join(t for t in texts if t))
+
+
+async def aprocess_report(
+    images: Union[str, list], stream=False, extracted_text: Optional[str] = None
+) -> AsyncIterator[StageEvent]:
+    """
+    Run OCR, summary and insights for one report, yielding each stage as it lands.
+
+    A report may span several images (photos or PDF pages). Their OCR runs
+    concurrently and the text is merged in page order, so a multi-page
+    report costs about the latency of its slowest page before one summary
+    and insights pass over the whole. The stages depend on each other; the
+    rest of the concurrency comes from many reports sharing the loop and
+    the request cap.
+
+    Args:
+        images (str | list): Base64 encoded image string, or one per page.
+        stream (bool): Also yield partial text as pages are read and tokens arrive.
+        extracted_text (str | None): Text already known for these images; OCR is skipped.
+
+    Yields:
+        StageEvent: One ``done`` event per completed stage, preceded by
+        ``done=False`` events carrying the text so far when streaming. Stops
+        after OCR if no text was found.
+    """
+    pages = [images] if isinstance(images, str) else list(images)
+    if extracted_text is not None:
+        text = extracted_text
+        yield StageEvent("extracted_text", text)
+    elif len(pages) == 1:
+        text = await aextract_text_from_image(pages[0])
+        yield StageEvent("extracted_text", text)
+    else:
+        async for event in _aextract_pages(pages):
+            if event.done or stream:
+                yield event
+        text = event.text
+    if not text:
+        return
+
+    if not stream:
+        summary = await asummarize_text(text)
+        yield StageEvent("summary", summary)
+        insights = await agenerate_insights(summary)
+        yield StageEvent("insights", insights)
+        return
+
+    async def summary_stream(record: StageRecord) -> AsyncIterator[str]:
+        # Chunks of a long text are summarized in full; only the final summary streams
+        prompt, payload, max_tokens = await asummary_request(text)
+        async for chunk in _astream_complete(
+            TEXT_MODEL, prompt, payload, text_messages(prompt, payload), max_tokens=max_tokens, record=record
+        ):
+            yield chunk
+
+    async for event in _astream_stage("summary", atimed_stream("summarize_stream", summary_stream)):
+        yield event
+    summary = event.text
+    insights_prompt, insights_tokens = insights_request(summary)
+    insights_chunks = atimed_stream(
+        "insights_stream",
+        lambda record: _astream_complete(
+            TEXT_MODEL,
+            insights_prompt,
+            summary,
+            text_messages(insights_prompt, summary),
+            max_tokens=insights_tokens,
+            record=record,
+        ),
+    )
+    async for event in _astream_stage("insights", insights_chunks):
+        yield event
+
+
+async def _collect_report(images: Union[str, list]) -> dict:
+    result = {}
+    async for event in aprocess_report(images):
+        result[event.stage] = event.text
+    return result
+
+
+async def aprocess_reports(images: list) -> list:
+    """
+    Process several reports concurrently.
+
+    Args:
+        images (list): One report per item: a Base64 encoded image string, or a list of them for a multi-page report.
+
+    Returns:
+        list: One dict per report mapping stage names to their text, in input order.
+    """
+    return await asyncio.gather(*(_collect_report(image) for image in images))
+
+
+def process_reports(images: list) -> list:
+    """Blocking wrapper around ``aprocess_reports``."""
+    return run_sync(aprocess_reports(images))
+
+
+def iter_report_stages(
+    images: Union[str, list], stream=False, extracted_text: Optional[str] = None
+) -> Iterator[StageEvent]:
+    """
+    Process one report on the shared loop and yield stage events to the caller's thread.
+
+    If the caller stops iterating early (e.g. a Streamlit rerun), the report
+    still finishes in the background and its results land in the cache.
+
+    Args:
+        images (str | list): Base64 encoded image string, or one per page.
+        stream (bool): Also yield partial stage text as tokens arrive.
+        extracted_text (str | None): Text already known for these images; OCR is skipped.
+
+    Yields:
+        StageEvent: Stage events as described in ``aprocess_report``.
+    """
+    events: "queue.Queue" = queue.Queue()
+
+    async def pump():
+        try:
+            async for event in aprocess_report(images, stream, extracted_text):
+                events.put(event)
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(_DONE)
+
+    submit(pump())
+    while True:
+        item = events.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
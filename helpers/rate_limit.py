@@ -0,0 +1,405 @@
+"""
+Process-wide rate limiting, retries and circuit breaking for upstream APIs.
+
+Every caller of a service shares one token bucket and one circuit breaker, so
+concurrent sessions draw from the same quota and back off together instead of
+each retrying on its own. Setting ``ENGAGEGOV_RATE_LIMIT_PATH`` stores bucket
+state in SQLite so several worker processes share the quota as well.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from helpers.metrics import note_retry
+
+RATE_LIMIT_PATH = os.getenv("ENGAGEGOV_RATE_LIMIT_PATH")
+
+# Default requests per second and burst size per service, overridable with
+# ENGAGEGOV_<SERVICE>_RPS and ENGAGEGOV_<SERVICE>_BURST
+DEFAULT_LIMITS = {
+    "xai": (8.0, 16),
+    "langflow": (4.0, 8),
+}
+
+# Failures in a row that open a breaker, and seconds it stays open
+BREAKER_THRESHOLD = int(os.getenv("ENGAGEGOV_BREAKER_THRESHOLD", 5))
+BREAKER_RESET = float(os.getenv("ENGAGEGOV_BREAKER_RESET", 30))
+
+
+class RetryableError(Exception):
+    """
+    Transient upstream failure worth retrying.
+
+    Attributes:
+        retry_after (float | None): Seconds the server asked us to wait, if any.
+        rate_limited (bool): True for 429s, which pause the whole bucket
+            instead of counting against the circuit breaker.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None, rate_limited=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.rate_limited = rate_limited
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while a service's circuit breaker is open."""
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at ``rate`` tokens per second up to ``capacity``.
+
+    With a ``path`` the bucket lives in a SQLite row that every process
+    updates under an immediate transaction; otherwise it is in memory.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float, path: Optional[str] = None):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                "updated REAL NOT NULL, paused_until REAL NOT NULL)"
+            )
+
+    def try_acquire(self, tokens=1.0) -> float:
+        """
+        Take tokens if available.
+
+        Args:
+            tokens (float): Tokens to take.
+
+        Returns:
+            float: 0 if the tokens were taken, else seconds until they may be.
+        """
+        with self._lock:
+            if self._db is not None:
+                return self._try_acquire_shared(tokens)
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def _try_acquire_shared(self, tokens: float) -> float:
+        # Wall-clock time, since monotonic clocks are not comparable across processes
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT tokens, updated, paused_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            available, updated, paused_until = row if row else (self.capacity, now, 0.0)
+            available = min(self.capacity, available + max(0.0, now - updated) * self.rate)
+            wait = 0.0
+            if now < paused_until:
+                wait = paused_until - now
+            elif available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / self.rate
+            self._db.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated, paused_until) VALUES (?, ?, ?, ?)",
+                (self.name, available, now, paused_until),
+            )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stop handing out tokens for ``seconds``, e.g. after a 429 with Retry-After.
+
+        Args:
+            seconds (float): Pause length.
+        """
+        with self._lock:
+            if self._db is not None:
+                until = time.time() + seconds
+                self._db.execute(
+                    "INSERT INTO buckets (name, tokens, updated, paused_until) VALUES (?, 0, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET paused_until = MAX(paused_until, excluded.paused_until)",
+                    (self.name, time.time(), until),
+                )
+            else:
+                self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self, tokens=1.0) -> None:
+        """Block until tokens are available, sleeping with jitter between checks."""
+        while (wait := self.try_acquire(tokens)) > 0:
+            time.sleep(wait + random.uniform(0, wait * 0.1))
+
+    async def acquire_async(self, tokens=1.0) -> None:
+        """Async counterpart of ``acquire``."""
+        while (wait := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait + random.uniform(0, wait * 0.1))
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service for ``reset_timeout`` seconds after
+    ``threshold`` consecutive failures, then lets one trial call through.
+    """
+
+    def __init__(self, name: str, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        """One of "closed", "open" or "half-open"."""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def before_call(self) -> bool:
+        """
+        Check that a call may go ahead.
+
+        Returns:
+            bool: True if the call is the half-open trial, which the caller
+            must finish with ``record_success``, ``record_failure`` or
+            ``end_trial`` whatever happens to it.
+
+        Raises:
+            CircuitOpenError: While the breaker is open, or while another
+                caller's half-open trial is still running.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial_running:
+                self._trial_running = True
+                return True
+            raise CircuitOpenError(f"{self.name} is unavailable; retrying shortly.")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+    def end_trial(self) -> None:
+        """Let another caller run the half-open trial after one ended without a verdict, e.g. cancelled."""
+        with self._lock:
+            self._trial_running = False
+
+
+_limiters: dict = {}
+_breakers: dict = {}
+_registry_lock = threading.Lock()
+
+
+def get_limiter(service: str) -> TokenBucket:
+    """
+    Return the shared token bucket for a service.
+
+    Args:
+        service (str): Service name, e.g. "xai" or "langflow".
+
+    Returns:
+        TokenBucket: Bucket configured from the environment.
+    """
+    with _registry_lock:
+        if service not in _limiters:
+            rate, burst = DEFAULT_LIMITS.get(service, (5.0, 10))
+            rate = float(os.getenv(f"ENGAGEGOV_{service.upper()}_RPS", rate))
+            burst = float(os.getenv(f"ENGAGEGOV_{service.upper()}_BURST", burst))
+            _limiters[service] = TokenBucket(service, rate, burst, RATE_LIMIT_PATH)
+        return _limiters[service]
+
+
+def get_breaker(service: str) -> CircuitBreaker:
+    """
+    Return the shared circuit breaker for a service.
+
+    Args:
+        service (str): Service name, e.g. "xai" or "langflow".
+
+    Returns:
+        CircuitBreaker: Breaker for the service.
+    """
+    with _registry_lock:
+        if service not in _breakers:
+            _breakers[service] = CircuitBreaker(service)
+        return _breakers[service]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header given either in seconds or as an HTTP date.
+
+    Args:
+        value (str | None): Header value.
+
+    Returns:
+        float | None: Seconds to wait, or None if absent or unparseable.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base=0.5, cap=30.0) -> float:
+    """Exponential backoff with full jitter for the given zero-based attempt."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _after_failure(service: str, error: RetryableError, attempt: int, trial=False) -> float:
+    if error.rate_limited:
+        delay = error.retry_after if error.retry_after is not None else backoff_delay(attempt)
+        get_limiter(service).pause(delay)
+        if trial:
+            # A throttled trial shows no recovery; it ends and the breaker reopens
+            get_breaker(service).record_failure()
+    else:
+        get_breaker(service).record_failure()
+        delay = error.retry_after if error.retry_after is not None else backoff_delay(attempt)
+    # Spread callers out so they do not all return at the same instant
+    return delay + random.uniform(0, 0.25 * delay + 0.1)
+
+
+def call_with_retry(
+    fn: Callable,
+    service: str,
+    retries=5,
+    classify: Optional[Callable[[Exception], Optional[RetryableError]]] = None,
+):
+    """
+    Call ``fn`` under the service's rate limiter and circuit breaker, retrying transient failures.
+
+    Args:
+        fn (Callable): Zero-argument function performing one upstream request.
+        service (str): Service name used to look up the limiter and breaker.
+        retries (int): Maximum number of attempts.
+        classify (Callable | None): Maps an exception raised by ``fn`` to a
+            RetryableError, or None if it should propagate unchanged.
+
+    Returns:
+        Whatever ``fn`` returns.
+
+    Raises:
+        CircuitOpenError: If the service's breaker is open.
+        RetryableError: If every attempt failed transiently.
+    """
+    limiter, breaker = get_limiter(service), get_breaker(service)
+    for attempt in range(retries):
+        trial = breaker.before_call()
+        try:
+            limiter.acquire()
+            try:
+                result = fn()
+            except Exception as e:
+                error = e if isinstance(e, RetryableError) else (classify(e) if classify else None)
+                if error is None:
+                    breaker.record_success()  # The service answered; the request itself was bad
+                    raise
+                delay = _after_failure(service, error, attempt, trial)
+                if attempt == retries - 1:
+                    if error is e:
+                        raise
+                    raise error from e
+            else:
+                breaker.record_success()
+                return result
+        finally:
+            if trial:
+                breaker.end_trial()  # Also after interrupts, so the breaker is never stuck half-open
+        note_retry(service, error.rate_limited)
+        time.sleep(delay)
+
+
+async def acall_with_retry(
+    fn: Callable,
+    service: str,
+    retries=5,
+    classify: Optional[Callable[[Exception], Optional[RetryableError]]] = None,
+):
+    """Async counterpart of ``call_with_retry``; ``fn`` returns an awaitable."""
+    limiter, breaker = get_limiter(service), get_breaker(service)
+    for attempt in range(retries):
+        trial = breaker.before_call()
+        try:
+            await limiter.acquire_async()
+            try:
+                result = await fn()
+            except Exception as e:
+                error = e if isinstance(e, RetryableError) else (classify(e) if classify else None)
+                if error is None:
+                    breaker.record_success()
+                    raise
+                delay = _after_failure(service, error, attempt, trial)
+                if attempt == retries - 1:
+                    if error is e:
+                        raise
+                    raise error from e
+            else:
+                breaker.record_success()
+                return result
+        finally:
+            if trial:
+                breaker.end_trial()
+        note_retry(service, error.rate_limited)
+        await asyncio.sleep(delay)
+
+
+def classify_status(status_code: int, headers) -> Optional[RetryableError]:
+    """
+    Decide whether an HTTP status is worth retrying.
+
+    Args:
+        status_code (int): Response status.
+        headers (Mapping): Response headers, checked for Retry-After.
+
+    Returns:
+        RetryableError | None: Error to retry with, or None for success and
+        non-transient client errors.
+    """
+    retry_after = parse_retry_after(headers.get("Retry-After"))
+    if status_code == 429:
+        return RetryableError("rate limited", retry_after, rate_limited=True)
+    if status_code in (408, 409) or status_code >= 500:
+        return RetryableError(f"server error {status_code}", retry_after)
+    return None
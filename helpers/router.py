@@ -0,0 +1,263 @@
+"""
+On-box ministry classifier for citizen inquiries.
+
+Queries are turned into hashed word unigram/bigram features and scored with a
+multinomial naive Bayes model, all in NumPy, so routing a query takes well
+under a millisecond and needs no API call.
+
+Train it on labelled (query, ministry) pairs such as the output of
+data_generation/generate_synthetic_dataset.py:
+
+    python -m helpers.router train data/synthetic_dataset.jsonl [-o models/ministry_router.npz]
+    python -m helpers.router predict "How do I renew my passport?"
+"""
+import argparse
+import functools
+import json
+import os
+import re
+import zlib
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+
+MODEL_PATH = os.getenv("ENGAGEGOV_ROUTER_PATH", os.path.join("models", "ministry_router.npz"))
+N_FEATURES = 2 ** 16
+
+# Below this posterior probability a query is treated as unroutable
+ROUTE_THRESHOLD = float(os.getenv("ENGAGEGOV_ROUTE_THRESHOLD", 0.6))
+
+_TOKEN_RE = re.compile(r"[\w']+")
+
+
+class Route(NamedTuple):
+    """Predicted ministry for a query and the model's confidence in it."""
+
+    ministry: str
+    confidence: float
+
+
+def tokenize(text: str) -> list:
+    """Lowercase word unigrams and bigrams of a text."""
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def vectorize(texts: Iterable[str], n_features=N_FEATURES) -> tuple:
+    """
+    Hash texts into a sparse CSR matrix of sublinear, L2-normalized term frequencies.
+
+    Args:
+        texts (Iterable[str]): Texts to vectorize.
+        n_features (int): Number of hash buckets.
+
+    Returns:
+        tuple: ``(indptr, indices, data)`` arrays of the CSR matrix.
+    """
+    indptr = [0]
+    indices = []
+    data = []
+    for text in texts:
+        counts = {}
+        for token in tokenize(text):
+            bucket = zlib.crc32(token.encode("utf-8")) % n_features
+            counts[bucket] = counts.get(bucket, 0) + 1
+        values = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        norm = np.linalg.norm(values)
+        indices.extend(counts)
+        data.append(values / norm if norm else values)
+        indptr.append(len(indices))
+    return (
+        np.asarray(indptr, dtype=np.int64),
+        np.asarray(indices, dtype=np.int64),
+        np.concatenate(data) if data else np.zeros(0, dtype=np.float32),
+    )
+
+
+class MinistryRouter:
+    """Multinomial naive Bayes classifier over hashed query features."""
+
+    def __init__(self, labels: list, feature_log_prob: np.ndarray, class_log_prior: np.ndarray, n_features=N_FEATURES):
+        self.labels = list(labels)
+        self.feature_log_prob = feature_log_prob
+        self.class_log_prior = class_log_prior
+        self.n_features = n_features
+
+    @classmethod
+    def fit(cls, queries: list, ministries: list, n_features=N_FEATURES, alpha=0.1) -> "MinistryRouter":
+        """
+        Train a router on labelled queries.
+
+        Args:
+            queries (list): Query texts.
+            ministries (list): Ministry label for each query.
+            n_features (int): Number of hash buckets.
+            alpha (float): Additive smoothing.
+
+        Returns:
+            MinistryRouter: Trained router.
+        """
+        labels = sorted(set(ministries))
+        label_ids = {label: i for i, label in enumerate(labels)}
+        y = np.array([label_ids[m] for m in ministries], dtype=np.int64)
+        indptr, indices, data = vectorize(queries, n_features)
+
+        counts = np.zeros((len(labels), n_features), dtype=np.float64)
+        rows = np.repeat(y, np.diff(indptr))
+        np.add.at(counts, (rows, indices), data)
+        counts += alpha
+        feature_log_prob = np.log(counts / counts.sum(axis=1, keepdims=True)).astype(np.float32)
+        class_log_prior = np.log(np.bincount(y, minlength=len(labels)) / len(y)).astype(np.float32)
+        return cls(labels, feature_log_prob, class_log_prior, n_features)
+
+    def predict_proba(self, queries: list) -> np.ndarray:
+        """
+        Posterior probability of each ministry for each query.
+
+        Args:
+            queries (list): Query texts.
+
+        Returns:
+            np.ndarray: ``(len(queries), len(labels))`` probabilities.
+        """
+        indptr, indices, data = vectorize(queries, self.n_features)
+        scores = np.tile(self.class_log_prior, (len(queries), 1))
+        rows = np.repeat(np.arange(len(queries)), np.diff(indptr))
+        np.add.at(scores, rows, (self.feature_log_prob[:, indices] * data).T)
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    def predict(self, queries: list) -> list:
+        """
+        Most likely ministry for each query.
+
+        Args:
+            queries (list): Query texts.
+
+        Returns:
+            list: One Route per query.
+        """
+        probabilities = self.predict_proba(queries)
+        best = probabilities.argmax(axis=1)
+        return [Route(self.labels[i], float(p[i])) for i, p in zip(best, probabilities)]
+
+    def save(self, path: str) -> None:
+        """Write the model to a compressed ``.npz`` file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            path,
+            labels=np.array(self.labels),
+            feature_log_prob=self.feature_log_prob,
+            class_log_prior=self.class_log_prior,
+            n_features=np.array(self.n_features),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "MinistryRouter":
+        """Read a model written by ``save``."""
+        with np.load(path) as artifact:
+            return cls(
+                artifact["labels"].tolist(),
+                artifact["feature_log_prob"],
+                artifact["class_log_prior"],
+                int(artifact["n_features"]),
+            )
+
+
+@functools.lru_cache(maxsize=None)
+def load_router(path: str = MODEL_PATH) -> Optional[MinistryRouter]:
+    """
+    Return the trained router, loading it once per process.
+
+    Args:
+        path (str): Model artifact path.
+
+    Returns:
+        MinistryRouter | None: The router, or None if no model has been trained.
+    """
+    if not os.path.exists(path):
+        return None
+    return MinistryRouter.load(path)
+
+
+def route(query: str, min_confidence=ROUTE_THRESHOLD) -> Optional[Route]:
+    """
+    Pick the ministry responsible for a query.
+
+    Args:
+        query (str): Citizen's report or inquiry.
+        min_confidence (float): Minimum probability to accept the prediction.
+
+    Returns:
+        Route | None: The ministry and confidence, or None if no model is
+        available or the model is unsure.
+    """
+    router = load_router()
+    if router is None:
+        return None
+    result = router.predict([query])[0]
+    return result if result.confidence >= min_confidence else None
+
+
+def route_batch(queries: list, min_confidence=ROUTE_THRESHOLD) -> list:
+    """Batch counterpart of ``route``; returns one Route or None per query."""
+    router = load_router()
+    if router is None:
+        return [None] * len(queries)
+    return [r if r.confidence >= min_confidence else None for r in router.predict(queries)]
+
+
+def load_dataset(path: str) -> tuple:
+    """
+    Read labelled queries from a JSONL file of ``{"query", "ministry"}`` records.
+
+    Returns:
+        tuple: ``(queries, ministries)`` lists.
+    """
+    queries, ministries = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                queries.append(record["query"])
+                ministries.append(record["ministry"])
+    return queries, ministries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or query the ministry router.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train_parser = commands.add_parser("train", help="Train a router from a labelled JSONL dataset")
+    train_parser.add_argument("dataset")
+    train_parser.add_argument("-o", "--output", default=MODEL_PATH)
+    train_parser.add_argument("--holdout", type=float, default=0.1, help="Fraction held out for evaluation")
+    predict_parser = commands.add_parser("predict", help="Route one or more queries")
+    predict_parser.add_argument("queries", nargs="+")
+    predict_parser.add_argument("-m", "--model", default=MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        queries, ministries = load_dataset(args.dataset)
+        order = np.random.default_rng(0).permutation(len(queries))
+        n_holdout = int(len(queries) * args.holdout)
+        if n_holdout:
+            held_out, train_ids = order[:n_holdout], order[n_holdout:]
+            router = MinistryRouter.fit([queries[i] for i in train_ids], [ministries[i] for i in train_ids])
+            predictions = router.predict([queries[i] for i in held_out])
+            accuracy = np.mean([p.ministry == ministries[i] for p, i in zip(predictions, held_out)])
+            print(f"Held-out accuracy: {accuracy:.3f} on {n_holdout} queries")
+        router = MinistryRouter.fit(queries, ministries)
+        router.save(args.output)
+        print(f"Router trained on {len(queries)} queries, saved to {args.output}")
+    else:
+        router = MinistryRouter.load(args.model)
+        for query, result in zip(args.queries, router.predict(args.queries)):
+            print(f"{result.ministry} ({result.confidence:.2f}): {query}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Single-flight coalescing of identical in-flight upstream calls.
+
+When many sessions ask for the same thing at once (a popular notice photo,
+a trending question), the first caller for a key becomes the leader and
+makes the request; callers arriving while it is in flight wait for it and
+receive the same result, or the same exception. Nothing is remembered once
+the leader finishes; repeat requests after that are the response cache's job.
+
+Sync callers (threads) and async callers (the pipeline's event loop) share
+one registry, so a Streamlit thread and a pipeline coroutine asking for the
+same completion still cost a single upstream call.
+"""
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable
+
+
+class FlightAbandoned(Exception):
+    """The leader stopped before finishing, e.g. its stream was closed; followers retry."""
+
+
+class Flight:
+    """
+    One caller's handle on an in-flight call.
+
+    The leader (``leader`` is True) must end the flight with ``resolve`` or
+    ``fail``; followers wait for the outcome with ``wait`` or ``wait_async``.
+    """
+
+    def __init__(self, flights: "SingleFlight", key: Hashable, future: Future, leader: bool):
+        self._flights = flights
+        self._key = key
+        self._future = future
+        self.leader = leader
+
+    def wait(self, timeout=None):
+        """Block until the leader finishes and return its result or raise its exception."""
+        try:
+            return self._future.result(timeout)
+        except Exception as e:
+            raise _detach(e) from e.__cause__
+
+    async def wait_async(self):
+        """Async counterpart of ``wait``."""
+        try:
+            return await asyncio.wrap_future(self._future)
+        except Exception as e:
+            raise _detach(e) from e.__cause__
+
+    def resolve(self, value) -> None:
+        """Hand the leader's result to every follower."""
+        self._land(lambda: self._future.set_result(value))
+
+    def fail(self, error: BaseException) -> None:
+        """Hand the leader's exception to every follower."""
+        self._land(lambda: self._future.set_exception(error))
+
+    def _land(self, settle: Callable) -> None:
+        self._flights._forget(self._key, self._future)
+        if not self._future.done():
+            settle()
+
+
+def _detach(error: Exception) -> Exception:
+    # Each follower raises its own copy, so the leader's exception does not
+    # collect every follower's traceback; errors that cannot be copied are shared
+    try:
+        return copy.copy(error).with_traceback(None)
+    except Exception:
+        return error
+
+
+class SingleFlight:
+    """Registry of in-flight calls keyed by their normalized input."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: dict = {}
+
+    def join(self, key: Hashable) -> Flight:
+        """
+        Join the flight for a key, starting it if there is none.
+
+        Args:
+            key (Hashable): Normalized identity of the call.
+
+        Returns:
+            Flight: Handle whose ``leader`` says whether this caller makes the call.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return Flight(self, key, future, leader=False)
+            future = self._flights[key] = Future()
+            return Flight(self, key, future, leader=True)
+
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def __len__(self) -> int:
+        """Number of calls currently in flight."""
+        with self._lock:
+            return len(self._flights)
+
+    def do(self, key: Hashable, fn: Callable):
+        """
+        Call ``fn`` unless an identical call is in flight, then share its outcome.
+
+        Args:
+            key (Hashable): Normalized identity of the call.
+            fn (Callable): Zero-argument function making the call.
+
+        Returns:
+            Whatever ``fn`` returns, for the leader and every follower alike.
+        """
+        while True:
+            flight = self.join(key)
+            if not flight.leader:
+                try:
+                    return flight.wait()
+                except FlightAbandoned:
+                    continue
+            try:
+                result = fn()
+            except BaseException as e:
+                flight.fail(e if isinstance(e, Exception) else FlightAbandoned(str(key)))
+                raise
+            flight.resolve(result)
+            return result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Async counterpart of ``do``; ``fn`` returns an awaitable."""
+        while True:
+            flight = self.join(key)
+            if not flight.leader:
+                try:
+                    return await flight.wait_async()
+                except FlightAbandoned:
+                    continue
+            try:
+                result = await fn()
+            except BaseException as e:  # Includes cancellation of the leader's task
+                flight.fail(e if isinstance(e, Exception) else FlightAbandoned(str(key)))
+                raise
+            flight.resolve(result)
+            return result
@@ -0,0 +1,138 @@
+"""
+Import-time profile of the Streamlit app's cold start.
+
+Heavy libraries (openai, httpx, requests, NumPy, Pillow) are imported by the
+functions that need them, so a fresh process only pays for Streamlit and the
+app's own modules before the first page renders. This check keeps it that way:
+
+    python -m helpers.startup [--budget-ms 300] [--top 15]
+
+imports the modules ``main.py`` imports at module level in a fresh
+interpreter under ``python -X importtime``, prints the slowest imports and
+exits non-zero if the app's own modules (everything except Streamlit, which
+is loaded before the script runs) take longer than the budget.
+"""
+import argparse
+import ast
+import os
+import subprocess
+import sys
+from typing import NamedTuple
+
+APP_PATH = "main.py"
+
+# Milliseconds the app's own imports may add on top of Streamlit
+STARTUP_BUDGET_MS = float(os.getenv("ENGAGEGOV_STARTUP_BUDGET_MS", 300))
+
+# Imported by the Streamlit runtime before main.py, so not counted against the budget
+PRELOADED = ("streamlit",)
+
+
+class ImportTiming(NamedTuple):
+    """One line of ``-X importtime`` output, in milliseconds."""
+
+    module: str
+    self_ms: float
+    cumulative_ms: float
+    depth: int
+
+
+def app_imports(path: str = APP_PATH) -> list:
+    """
+    Top-level modules imported at module level by a script.
+
+    Imports inside functions are skipped, since they do not run at startup.
+
+    Args:
+        path (str): Script to inspect.
+
+    Returns:
+        list: Module names in import order, without duplicates.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def parse_importtime(output: str) -> list:
+    """
+    Parse ``python -X importtime`` stderr.
+
+    Args:
+        output (str): Captured stderr.
+
+    Returns:
+        list: ImportTiming entries in the order the imports finished.
+    """
+    timings = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings.append(ImportTiming(name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000, depth))
+    return timings
+
+
+def profile(modules: list, preloaded=PRELOADED) -> list:
+    """
+    Import modules in a fresh interpreter and time every import.
+
+    Args:
+        modules (list): Modules to import, in order.
+        preloaded (tuple): Modules imported first, as the app's runtime would.
+
+    Returns:
+        list: ImportTiming entries.
+    """
+    statements = "; ".join(f"import {module}" for module in [*preloaded, *modules])
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statements],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode:
+        raise RuntimeError(f"Importing the app's modules failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the app's cold-start import time against a budget.")
+    parser.add_argument("--app", default=APP_PATH, help="Streamlit script to inspect")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    args = parser.parse_args(argv)
+
+    modules = [m for m in app_imports(args.app) if m.split(".")[0] not in PRELOADED]
+    timings = profile(modules)
+    roots = [t for t in timings if t.depth == 0]
+    preloaded_ms = sum(t.cumulative_ms for t in roots if t.module.split(".")[0] in PRELOADED)
+    app_ms = sum(t.cumulative_ms for t in roots if t.module.split(".")[0] not in PRELOADED and t.module != "site")
+
+    print(f"Streamlit: {preloaded_ms:.0f} ms")
+    print(f"App imports: {app_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"\nSlowest imports of {', '.join(modules)}:")
+    app_timings = []
+    in_app = False
+    for timing in reversed(timings):  # Children are listed before their parent
+        if timing.depth == 0:
+            in_app = timing.module.split(".")[0] not in PRELOADED and timing.module != "site"
+        if in_app:
+            app_timings.append(timing)
+    for timing in sorted(app_timings, key=lambda t: t.self_ms, reverse=True)[: args.top]:
+        print(f"  {timing.self_ms:8.1f} ms  {timing.cumulative_ms:8.1f} ms cumulative  {timing.module}")
+
+    if app_ms > args.budget_ms:
+        print(f"\nOver budget by {app_ms - args.budget_ms:.0f} ms; import heavy libraries where they are used.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Token budgeting for the summary and insights prompts.
+
+OCR output of multi-page scans is noisy and long: hyphenated line breaks,
+ragged whitespace, and headers, footers and page numbers repeated on every
+page. Pages are joined with ``PAGE_BREAK`` so ``normalize_ocr_text`` can
+tell page furniture from content and strip it, ``count_tokens`` estimates what
+is left without calling the API, and ``plan_summary`` splits text that does
+not fit one prompt into chunks for a map-reduce summary: every chunk is
+summarized concurrently, then the partial summaries are summarized together.
+
+Output limits grow with the square root of the input (``output_budget``),
+so a document ten times longer gets roughly three times the summary, not
+ten times the cost. Prompts ask for a length (``target_words``) that fits
+comfortably within the limit, so replies end on their own instead of being
+cut off by it.
+"""
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import NamedTuple
+
+# Largest input sent to the model in one summary prompt; longer input is chunked
+SUMMARY_CHUNK_TOKENS = int(os.getenv("ENGAGEGOV_SUMMARY_CHUNK_TOKENS", 2500))
+
+# Output limits: floor, ceiling and growth per square root of input tokens
+SUMMARY_MAX_TOKENS = int(os.getenv("ENGAGEGOV_SUMMARY_MAX_TOKENS", 500))
+CHUNK_SUMMARY_MAX_TOKENS = int(os.getenv("ENGAGEGOV_CHUNK_SUMMARY_MAX_TOKENS", 300))
+INSIGHTS_MAX_TOKENS = int(os.getenv("ENGAGEGOV_INSIGHTS_MAX_TOKENS", 500))
+MIN_OUTPUT_TOKENS = 200
+MIN_INSIGHTS_TOKENS = 300
+
+# Rough English words per token, used to turn a token limit into a requested length
+WORDS_PER_TOKEN = 0.75
+
+# Reduce passes before the partial summaries are sent as they are, however long
+MAX_REDUCE_PASSES = 3
+
+# Form feed between the OCR text of consecutive pages, as pdftotext writes it
+PAGE_BREAK = "\f"
+
+# Lines at the top and bottom of a page where headers, footers and page numbers are looked for
+_PAGE_EDGE_LINES = 3
+_PAGE_NUMBER_KEY = "\0page number"
+
+_TOKEN_PATTERN = re.compile(r"\d+|\w+|[^\w\s]")
+_HYPHEN_BREAK = re.compile(r"(\w)-\n(\w)")
+_INLINE_SPACE = re.compile(r"[^\S\n]+")
+_PAGE_NUMBER = re.compile(r"^(page\s*)?\d+(\s*(of|/)\s*\d+)?$", re.IGNORECASE)
+_NOISE_LINE = re.compile(r"^[\W_]+$")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Estimate how many tokens a text costs, erring slightly high.
+
+    Words cost one token plus one per four characters beyond six, numbers
+    one per three digits and every punctuation mark one, which tracks BPE
+    tokenizers closely enough for budgeting.
+
+    Args:
+        text (str): Any text.
+
+    Returns:
+        int: Estimated token count.
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        if piece.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif len(piece) > 6:
+            tokens += 1 + math.ceil((len(piece) - 6) / 4)
+        else:
+            tokens += 1
+    return tokens
+
+
+def normalize_ocr_text(text: str) -> str:
+    """
+    Clean OCR output before it is sent to the model.
+
+    Rejoins words hyphenated across line breaks, collapses runs of spaces
+    and blank lines, and drops lines of stray symbols. In a document of
+    several pages, a line found at the same distance from the top or bottom
+    of at least two pages is page furniture: running headers and footers
+    keep only their first copy, and page numbers (any number there, such as
+    "3" or "Page 3 of 9") are dropped. Everything else, including repeated
+    lines and lone numbers in the body or on a single page, is content and
+    is kept.
+
+    Args:
+        text (str): Raw OCR output, pages separated by ``PAGE_BREAK``.
+
+    Returns:
+        str: Normalized text with paragraphs separated by blank lines.
+    """
+    text = unicodedata.normalize("NFKC", text).replace("\r\n", "\n").replace("\r", "\n")
+    text = _HYPHEN_BREAK.sub(r"\1\2", text)
+
+    pages = []
+    for page in text.split(PAGE_BREAK):
+        lines = [_INLINE_SPACE.sub(" ", line).strip() for line in page.split("\n")]
+        lines = [line for line in lines if not _NOISE_LINE.match(line)]
+        pages.append(lines)
+
+    # Edge lines keyed by their distance from the top or bottom, where furniture repeats. Page
+    # numbers share one key per position since their text changes; a single page, or one too
+    # short to have a body between its edges, has no furniture.
+    positions = []
+    for lines in pages:
+        filled = [i for i, line in enumerate(lines) if line]
+        if len(pages) < 2 or len(filled) <= 2 * _PAGE_EDGE_LINES:
+            filled = []
+        keys = {}
+        for side, edge in (("top", filled[:_PAGE_EDGE_LINES]), ("bottom", filled[::-1][:_PAGE_EDGE_LINES])):
+            for offset, i in enumerate(edge):
+                text_key = _PAGE_NUMBER_KEY if _PAGE_NUMBER.match(lines[i]) else lines[i].casefold()
+                keys.setdefault(i, set()).add((side, offset, text_key))
+        positions.append(keys)
+    position_counts = Counter(key for keys in positions for line_keys in keys.values() for key in line_keys)
+
+    paragraphs, kept = [], set()
+    for lines, keys in zip(pages, positions):
+        paragraph = []
+        for i, line in enumerate(lines):
+            repeated = {key[2] for key in keys.get(i, ()) if position_counts[key] > 1}
+            if _PAGE_NUMBER_KEY in repeated:
+                continue
+            if repeated:
+                if line.casefold() in kept:
+                    continue
+                kept.add(line.casefold())
+            if line:
+                paragraph.append(line)
+            elif paragraph:
+                paragraphs.append("\n".join(paragraph))
+                paragraph = []
+        if paragraph:
+            paragraphs.append("\n".join(paragraph))
+    return "\n\n".join(paragraphs)
+
+
+def split_into_chunks(text: str, max_tokens=SUMMARY_CHUNK_TOKENS) -> list:
+    """
+    Split text into chunks of at most ``max_tokens`` estimated tokens.
+
+    Chunks break between paragraphs where possible, then between
+    sentences, and only split inside a sentence when it alone is too long.
+
+    Args:
+        text (str): Text to split, paragraphs separated by blank lines.
+        max_tokens (int): Budget per chunk.
+
+    Returns:
+        list: Chunks in document order.
+    """
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_END.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+                continue
+            part, part_tokens = [], 0
+            for word in sentence.split(" "):
+                tokens = count_tokens(word)
+                if part and part_tokens + tokens > max_tokens:
+                    pieces.append(" ".join(part))
+                    part, part_tokens = [], 0
+                part.append(word)
+                part_tokens += tokens
+            if part:
+                pieces.append(" ".join(part))
+
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        tokens = count_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def output_budget(input_tokens: int, scale=6.0, cap=SUMMARY_MAX_TOKENS, floor=MIN_OUTPUT_TOKENS) -> int:
+    """
+    ``max_tokens`` for a completion over ``input_tokens`` of input.
+
+    Grows with the square root of the input between ``floor`` and ``cap``.
+
+    Args:
+        input_tokens (int): Estimated tokens of the input.
+        scale (float): Output tokens per square root of input tokens.
+        cap (int): Upper limit.
+        floor (int): Lower limit.
+
+    Returns:
+        int: Output token limit.
+    """
+    return int(max(floor, min(cap, scale * math.sqrt(max(0, input_tokens)))))
+
+
+def insights_budget(summary: str) -> int:
+    """``max_tokens`` for insights drawn from a summary."""
+    return output_budget(count_tokens(summary), scale=15.0, cap=INSIGHTS_MAX_TOKENS, floor=MIN_INSIGHTS_TOKENS)
+
+
+def target_words(max_tokens: int) -> int:
+    """Length in words to ask for so a reply fits within ``max_tokens``, with a fifth to spare."""
+    return max(10, int(max_tokens * WORDS_PER_TOKEN * 0.8) // 10 * 10)
+
+
+class SummaryPlan(NamedTuple):
+    """
+    How to summarize one text.
+
+    Attributes:
+        text (str): Normalized text.
+        tokens (int): Its estimated size.
+        chunks (list): Chunks to summarize first, or empty if ``text`` fits one prompt.
+        max_tokens (int): Output limit of the final summary.
+    """
+
+    text: str
+    tokens: int
+    chunks: list
+    max_tokens: int
+
+
+def plan_summary(text: str, chunk_tokens=SUMMARY_CHUNK_TOKENS) -> SummaryPlan:
+    """
+    Normalize text and decide whether it needs a map-reduce summary.
+
+    Args:
+        text (str): Raw text to summarize.
+        chunk_tokens (int): Largest input for one summary prompt.
+
+    Returns:
+        SummaryPlan: The plan; the final summary's limit reflects the whole
+        document even when it is produced from partial summaries.
+    """
+    text = normalize_ocr_text(text)
+    tokens = count_tokens(text)
+    chunks = split_into_chunks(text, chunk_tokens) if tokens > chunk_tokens else []
+    return SummaryPlan(text, tokens, chunks, output_budget(tokens))
+
+
+def chunk_budget(chunk: str) -> int:
+    """``max_tokens`` for the partial summary of one chunk."""
+    return output_budget(count_tokens(chunk), cap=CHUNK_SUMMARY_MAX_TOKENS)
+
+
+def plan_reduce(partials: list, chunk_tokens=SUMMARY_CHUNK_TOKENS) -> tuple:
+    """
+    Combine partial summaries, in document order, into the input of the reduce step.
+
+    Args:
+        partials (list): Partial summaries of consecutive chunks.
+        chunk_tokens (int): Largest input for one summary prompt.
+
+    Returns:
+        tuple: ``(text, chunks)`` where ``chunks`` is non-empty if the
+        combined summaries are themselves too long and need another pass.
+    """
+    text = "\n\n".join(f"Part {number}:\n{partial}" for number, partial in enumerate(partials, 1))
+    chunks = split_into_chunks(text, chunk_tokens) if count_tokens(text) > chunk_tokens else []
+    return text, chunks
@@ -1,17 +1,18 @@
 # helpers/utils.py
-def save_to_file(content, filename="generated_content.txt"):
+def save_to_file(content, filename="generated_content.txt", append=False):
     """
     Save content to a text file.
 
     Parameters:
         content (str): The content to save.
         filename (str): The name of the file.
+        append (bool): Add the content to the end of the file instead of replacing it.
 
     Returns:
         str: Confirmation message with the file path.
     """
     try:
-        with open(filename, "w") as file:
+        with open(filename, "a" if append else "w", encoding="utf-8") as file:
             file.write(content)
         return f"Content successfully saved to {filename}"
     except Exception as e:
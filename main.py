@@ -1,55 +1,70 @@
-import streamlit as st
-import os
-import requests
+import html
+import secrets
 import time
-from dotenv import load_dotenv
-from typing import Optional
-from requests.exceptions import RequestException, ConnectionError
-from helpers.image_utils import encode_image_to_base64
-from helpers.api_utils import extract_text_from_image, summarize_text, generate_insights
-
-# Load environment variables
-load_dotenv()
-
-# Constants
-BASE_API_URL = "https://api.langflow.astra.datastax.com"
-LANGFLOW_ID = "a76d6046-9bc2-4704-b2d5-67d042b61b8d"
-FLOW_ID = "f9bf7aa5-05a2-432e-ae2f-2bb4dfd0fc4a"
-APPLICATION_TOKEN = os.getenv("APP_TOKEN")
-ENDPOINT = "engagegov"
+import uuid
+from collections import deque
+
+import streamlit as st
+from helpers.history import HISTORY_WINDOW, get_store
+from helpers.image_utils import encode_documents, is_pdf, pdf_supported
+from helpers.jobs import DONE, get_queue
+from helpers.metrics import start_exporter
+from helpers.pipeline import STAGES
+from ministry_pages import REGISTRY, config_for_name, display_page
+
+HISTORY_PAGE_SIZE = 10
+
+# Largest upload accepted, in MB, across all files of one report
+MAX_UPLOAD_MB = 200
+
+# Seconds between checks on a running background job; short, since replies are shown as they stream
+JOB_POLL_INTERVAL = 0.2
+
+STAGE_LABELS = {"extracted_text": "Extracting text", "summary": "Summarizing", "insights": "Generating insights"}
+
+# Serves /metrics on ENGAGEGOV_METRICS_PORT, if set; a no-op on reruns
+start_exporter()
 
 # Initialize session state variables
-state_keys = ["response_history", "extracted_text", "summary", "insights"]
-for key in state_keys:
+for key in STAGES:
     if key not in st.session_state:
-        st.session_state[key] = [] if key == "response_history" else ""
-
-# Utility function for API calls with retry and rate limiting
-def run_flow_with_backoff(message: str, endpoint: str, application_token: Optional[str], retries=5) -> dict:
-    api_url = f"{BASE_API_URL}/lf/{LANGFLOW_ID}/api/v1/run/{endpoint}"
-    payload = {"input_value": message, "output_type": "chat", "input_type": "chat"}
-    headers = {
-        "Authorization": f"Bearer {application_token}",
-        "Content-Type": "application/json",
-    }
-
-    for attempt in range(retries):
-        try:
-            response = requests.post(api_url, json=payload, headers=headers)
-            if response.status_code == 429:  # Handle rate limit
-                retry_after = int(response.headers.get("Retry-After", 1))
-                time.sleep(retry_after)
-                continue
-            response.raise_for_status()
-            return response.json()
-        except ConnectionError:
-            st.error("Network error: Unable to reach the API. Please check your connection.")
-        except RequestException as e:
-            if attempt < retries - 1:
-                time.sleep(2 ** attempt)  # Exponential backoff
-            else:
-                st.error(f"API error: {e}")
-                return None
+        st.session_state[key] = ""
+# Only an unguessable session token goes in the URL; a refreshed page uses it to pick
+# its running jobs back up, and nobody can read a job by ID without it
+if "job_owner" not in st.session_state:
+    st.session_state.job_owner = st.query_params.get("session") or secrets.token_urlsafe(32)
+    st.query_params["session"] = st.session_state.job_owner
+for key, kind in (("report_job", "report"), ("inquiry_job", "inquiry")):
+    if key not in st.session_state:
+        st.session_state[key] = get_queue().latest(st.session_state.job_owner, kind)
+if "report_upload" not in st.session_state:
+    st.session_state.report_upload = None
+if "report_incident" not in st.session_state:
+    st.session_state.report_incident = None
+if "inquiry" not in st.session_state:
+    st.session_state.inquiry = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+# Most recent records only; older pages are read back from the history store
+if "response_history" not in st.session_state:
+    st.session_state.response_history = deque(maxlen=HISTORY_WINDOW)
+if "history_count" not in st.session_state:
+    st.session_state.history_count = 0
+
+
+def render_history_entry(record) -> str:
+    """Markdown/HTML for one history record, with user text escaped."""
+    ministry = f"<small>🏛️ {html.escape(record.ministry)}</small>\n\n" if record.ministry else ""
+    response = html.escape(record.response).replace("\n", "<br>")
+    return (
+        "#### 👤 User:\n\n"
+        '<div style="background-color:rgb(240, 227, 254); padding: 10px; border-radius: 10px; width: fit-content; max-width: 90%; word-wrap: break-word;">'
+        f"{html.escape(record.query)}</div>\n\n"
+        f"{ministry}"
+        "#### 💬 AI Response:\n\n"
+        '<div style="background-color:rgb(223, 250, 229); padding: 10px; border-radius: 10px; width: fit-content; max-width: 90%; word-wrap: break-word;">'
+        f"{response}</div>\n\n"
+    )
 
 # Streamlit Configuration
 st.set_page_config(
@@ -57,39 +72,126 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded",
 )
+
+def render_footer():
+    st.markdown(
+        "<br><hr><center><b>Developed with ❤️ by Chukwudifu Uzoma Okoroafor</b> | Contact: engr.okoroafor@gmail.com</center><hr>",
+        unsafe_allow_html=True,
+    )
+
+
+def open_ministry_page(slug: str):
+    st.session_state.ministry_page = slug
+
+
+def submit_job(slot: str, kind: str, payload: dict):
+    st.session_state[slot] = get_queue().submit(kind, payload, owner=st.session_state.job_owner)
+
+
+def get_job(job_id: str):
+    return get_queue().get(job_id, owner=st.session_state.job_owner)
+
+
+def untrack_job(slot: str):
+    if st.session_state[slot]:
+        get_queue().release(st.session_state[slot], st.session_state.job_owner)
+    st.session_state[slot] = None
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def report_progress(job_id: str):
+    """Partial output of a running report job; reruns the page once it finishes."""
+    job = get_job(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    stage = job.progress.get("stage")
+    st.info(f"{STAGE_LABELS[stage]}..." if stage else "Processing image...")
+    st.markdown(job.progress.get("text", ""))
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def inquiry_progress(job_id: str):
+    """Reply so far of a running inquiry job; reruns the page once it finishes."""
+    job = get_job(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.markdown(job.progress.get("text") or "Waiting for a response...")
+
+
+# Ministry pages
+GENERAL_PAGE = "general"
+selected_page = st.sidebar.selectbox(
+    "🏛️ Ministry",
+    [GENERAL_PAGE, *REGISTRY],
+    format_func=lambda slug: "All ministries" if slug == GENERAL_PAGE else REGISTRY[slug].title,
+    key="ministry_page",
+)
+if selected_page != GENERAL_PAGE:
+    display_page(selected_page)
+    render_footer()
+    st.stop()
+
 st.title("Citizen Engagement and Reporting Platform")
 
 # Image Upload Section
 st.header("📷 Upload Image Report")
-uploaded_file = st.file_uploader("Upload a photo report (optional)", type=["png", "jpg", "jpeg"])
+upload_types = ["png", "jpg", "jpeg", *(["pdf"] if pdf_supported() else [])]
+uploaded_files = st.file_uploader(
+    "Upload photos or a scanned document of one report (optional)", type=upload_types, accept_multiple_files=True
+)
 
-if uploaded_file:
-    file_size = uploaded_file.size / (1024 * 1024)  # File size in MB
-    if file_size > 200:
-        st.error("❌ File size exceeds 200MB. Please upload a smaller file.")
+if uploaded_files:
+    total_size = sum(uploaded_file.size for uploaded_file in uploaded_files) / (1024 * 1024)  # Size in MB
+    if total_size > MAX_UPLOAD_MB:
+        st.error(f"❌ Files exceed {MAX_UPLOAD_MB}MB in total. Please upload smaller files.")
     else:
-        st.image(uploaded_file, caption="Uploaded Image", use_container_width=True)
-        try:
-            temp_image_path = "temp_image.jpg"
-            with open(temp_image_path, "wb") as f:
-                f.write(uploaded_file.read())
+        photos = [uploaded_file for uploaded_file in uploaded_files if not is_pdf(uploaded_file)]
+        if photos:
+            st.image(photos, caption=[photo.name for photo in photos], width=300 if len(photos) > 1 else "stretch")
+        for document in uploaded_files:
+            if document not in photos:
+                st.caption(f"📄 {document.name}")
+        # Reruns keep the same uploads; only a changed selection starts a new job
+        upload_id = "|".join(uploaded_file.file_id for uploaded_file in uploaded_files)
+        if upload_id != st.session_state.report_upload:
+            try:
+                images = encode_documents(uploaded_files)
+                # Only photo reports are checked against earlier incidents
+                payload = {"images": images, "photos": len(photos) == len(uploaded_files)}
+                submit_job("report_job", "report", payload)
+                st.session_state.report_upload = upload_id
+                for stage in STAGES:
+                    st.session_state[stage] = ""
+                st.session_state.report_incident = None
+            except Exception as e:
+                st.error(f"Error processing the upload: {e}")
 
-            processing_placeholder = st.empty()
-            processing_placeholder.info("Processing image...")
-
-            image_base64 = encode_image_to_base64(temp_image_path)
-            st.session_state.extracted_text = extract_text_from_image(image_base64)
-
-            if st.session_state.extracted_text:
-                st.session_state.summary = summarize_text(st.session_state.extracted_text)
-                st.session_state.insights = generate_insights(st.session_state.summary)
-                processing_placeholder.success("✅ Analysis completed successfully!")
+if st.session_state.report_job:
+    report_job = get_job(st.session_state.report_job)
+    if report_job is None:
+        untrack_job("report_job")
+    elif not report_job.finished:
+        report_progress(report_job.id)
+    else:
+        untrack_job("report_job")
+        if report_job.status == DONE:
+            for stage in STAGES:
+                st.session_state[stage] = report_job.result.get(stage, "")
+            st.session_state.report_incident = report_job.result.get("incident")
+            if st.session_state.insights:
+                st.success("✅ Analysis completed successfully!")
             else:
-                processing_placeholder.error("No text extracted from the image.")
-        except Exception as e:
-            st.error(f"Error processing the image: {e}")
+                st.error("No text extracted from the upload.")
+        else:
+            st.error(f"Error processing the image: {report_job.error}")
 
 # Display Results for Image Reporting
+incident = st.session_state.report_incident
+if incident and incident["reports"] > 1:
+    first_seen = time.strftime("%d %b %Y", time.localtime(incident["first_seen"]))
+    st.info(f"🔁 Matches report #{incident['id']}, first received {first_seen}; reported {incident['reports']} times so far.")
+elif incident:
+    st.caption(f"Filed as report #{incident['id']}")
 if st.session_state.extracted_text:
     st.subheader("📄 Extracted Text:")
     st.text_area("Extracted Text", st.session_state.extracted_text, height=200)
@@ -111,51 +213,70 @@ if st.button("Submit 🚀", key="submit_button"):
         st.error("Please provide text input.")
     else:
         try:
-            with st.spinner("Processing your request..."):
-                response = run_flow_with_backoff(query, ENDPOINT, APPLICATION_TOKEN)
-                ai_response = ""
-                if response:
-                    outputs = response.get("outputs", [])
-                    ai_response = (
-                        "\n\n".join(
-                            f"- {output.get('results', {}).get('message', {}).get('text', '')}"
-                            for item in outputs
-                            for output in item.get("outputs", [])
-                        )
-                        or "No outputs received from the API."
-                    )
-                else:
-                    ai_response = "No valid response received."
-
-                st.session_state.response_history.insert(0, {"query": query, "response": ai_response})
+            # Imported here so NumPy loads on the first submission, not at startup
+            from helpers.router import route
+
+            routed = route(query)
+            # The ministry rides along in the payload so a refreshed page can still label the answer
+            payload = {"query": query, "ministry": routed.ministry if routed else None}
+            submit_job("inquiry_job", "inquiry", payload)
+            st.session_state.inquiry = payload
         except Exception as e:
             st.error(f"Unexpected error: {e}")
 
+inquiry_job = get_job(st.session_state.inquiry_job) if st.session_state.inquiry_job else None
+if inquiry_job is not None:
+    st.session_state.inquiry = inquiry_job.payload
+elif st.session_state.inquiry_job:
+    untrack_job("inquiry_job")
+
+# Routing of the latest inquiry
+ministry = st.session_state.inquiry and st.session_state.inquiry["ministry"]
+routed_page = config_for_name(ministry) if ministry else None
+if ministry:
+    st.caption(f"🏛️ Routed to the {ministry}")
+if routed_page:
+    st.button(
+        f"Open the {routed_page.title} page",
+        on_click=open_ministry_page,
+        args=(routed_page.slug,),
+    )
+
+if inquiry_job is not None:
+    if not inquiry_job.finished:
+        inquiry_progress(inquiry_job.id)
+    else:
+        untrack_job("inquiry_job")
+        if inquiry_job.status == DONE:
+            # The answer appears at the top of the history below
+            record = get_store().add(
+                st.session_state.session_id,
+                inquiry_job.payload["query"],
+                inquiry_job.result["response"],
+                inquiry_job.payload["ministry"],
+                inquiry_job.result.get("messages"),
+            )
+            st.session_state.response_history.appendleft(record)
+            st.session_state.history_count += 1
+        elif inquiry_job.error_type == "FlowError":
+            st.error(inquiry_job.error)
+        else:
+            st.error(f"Unexpected error: {inquiry_job.error}")
+
 # Display Query-Response History
-if st.session_state.response_history:
+if st.session_state.history_count:
     st.subheader("🗂️ Query-Response History")
-    for i, entry in enumerate(st.session_state.response_history):
-        st.markdown("#### 👤 User:")
-        st.markdown(
-            f"""
-            <div style="background-color:rgb(240, 227, 254); padding: 10px; border-radius: 10px; width: fit-content; max-width: 90%; word-wrap: break-word;">
-                {entry['query']}
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
-        st.markdown("#### 💬 AI Response:")
-        st.markdown(
-            f"""
-            <div style="background-color:rgb(223, 250, 229); padding: 10px; border-radius: 10px; width: fit-content; max-width: 90%; word-wrap: break-word;">
-                {entry['response'].replace('\n', '<br>')}
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+    total = st.session_state.history_count
+    pages = -(-total // HISTORY_PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+    start = (page - 1) * HISTORY_PAGE_SIZE
+    if start + HISTORY_PAGE_SIZE <= len(st.session_state.response_history) or total <= len(st.session_state.response_history):
+        records = list(st.session_state.response_history)[start:start + HISTORY_PAGE_SIZE]
+    else:
+        records = get_store().page(st.session_state.session_id, page - 1, HISTORY_PAGE_SIZE)
+    st.markdown("".join(render_history_entry(record) for record in records), unsafe_allow_html=True)
 
 # Footer
-st.markdown(
-    "<br><hr><center><b>Developed with ❤️ by Chukwudifu Uzoma Okoroafor</b> | Contact: engr.okoroafor@gmail.com</center><hr>",
-    unsafe_allow_html=True,
-)
\ No newline at end of file
+render_footer()
\ No newline at end of file
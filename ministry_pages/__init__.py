@@ -0,0 +1,13 @@
+"""
+Ministry pages, all rendered by one engine from the table in ``registry``.
+
+The engine (and Streamlit with it) is only imported when a page is shown.
+"""
+from ministry_pages.registry import MINISTRIES, REGISTRY, config_for_name, get_config
+
+
+def display_page(slug: str) -> None:
+    """Render the page for a ministry slug, e.g. ``display_page("health")``."""
+    from ministry_pages.engine import display_page as render
+
+    render(slug)
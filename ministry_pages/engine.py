@@ -0,0 +1,78 @@
+"""
+Renders any ministry page from its entry in ``ministry_pages.registry``.
+"""
+import functools
+from typing import Callable
+
+import streamlit as st
+
+from ministry_pages.registry import get_config
+
+
+def summarize_inquiry(text: str, uploaded_file=None) -> str:
+    """
+    Summarize an inquiry, including any text found in an attached image.
+
+    Goes through the cached api_utils helpers, so a repeated inquiry from any
+    ministry page costs no API calls.
+
+    Args:
+        text (str): Inquiry text.
+        uploaded_file: Optional uploaded image.
+
+    Returns:
+        str: Summary of the inquiry.
+    """
+    from helpers.api_utils import extract_text_from_image, summarize_text
+    from helpers.image_utils import encode_image
+
+    parts = [text.strip()]
+    if uploaded_file is not None:
+        parts.append(extract_text_from_image(encode_image(uploaded_file)))
+    return summarize_text("\n\n".join(part for part in parts if part))
+
+
+@functools.lru_cache(maxsize=None)
+def get_page(slug: str) -> Callable[[], None]:
+    """
+    Build the render function for a ministry page once per process.
+
+    Args:
+        slug (str): Ministry slug or legacy page alias.
+
+    Returns:
+        Callable[[], None]: Function rendering the page.
+
+    Raises:
+        KeyError: If no ministry matches the slug.
+    """
+    config = get_config(slug)
+    upload_key, text_key, submit_key = (f"{config.slug}_{name}" for name in ("upload", "text", "submit"))
+
+    def display_page():
+        from helpers.api_utils import stream_generate_insights
+
+        st.title(config.title)
+        st.caption(config.description)
+        st.subheader("Report or Make an Inquiry")
+
+        uploaded_file = st.file_uploader("Upload an image (optional)", type=["png", "jpg", "jpeg"], key=upload_key)
+        text_input = st.text_area(config.input_label, key=text_key)
+
+        if st.button("Submit", key=submit_key):
+            if not text_input.strip() and uploaded_file is None:
+                st.error("Please provide text input or an image.")
+                return
+            st.info("Processing your report...")
+            # AI Logic
+            summary = summarize_inquiry(text_input, uploaded_file)
+            st.success("Your inquiry has been processed!")
+            st.write("AI Suggestions:")
+            st.write_stream(stream_generate_insights(summary))
+
+    return display_page
+
+
+def display_page(slug: str) -> None:
+    """Render the page for a ministry slug."""
+    get_page(slug)()
@@ -0,0 +1,95 @@
+"""
+Configuration table for the ministry pages.
+
+``MINISTRIES`` maps each ministry's name (the labels used by the synthetic
+dataset and the router) to a description of its remit; everything a page
+needs is derived from it once, at import.
+"""
+import re
+from typing import NamedTuple, Optional
+
+# Define ministries and their functions
+MINISTRIES = {
+    "Ministry of Finance": "Manages public finances, national budget, taxation, fiscal policy, and economic growth initiatives. Oversees state revenues and expenditures.",
+    "Ministry of Health": "Oversees public health services, hospitals, health education, disease prevention, and health policy implementation.",
+    "Ministry of Education": "Responsible for developing and managing the education system, including schools, universities, curriculum standards, and educational policies.",
+    "Ministry of Defense": "Manages national defense, armed forces, military policy, and often disaster response capabilities.",
+    "Ministry of Foreign Affairs": "Handles international relations, diplomacy, treaties, and representation in foreign countries and international organizations.",
+    "Ministry of Interior (or Home Affairs)": "Responsible for internal security, law enforcement, immigration, civil defense, and local governance.",
+    "Ministry of Justice": "Oversees the judicial system, legal policies, correctional facilities, and law reform initiatives.",
+    "Ministry of Agriculture": "Focuses on agricultural development, food security, rural development, and support for farmers.",
+    "Ministry of Environment": "Manages environmental conservation, climate change policy, wildlife protection, and sustainable development.",
+    "Ministry of Transport": "Oversees transportation infrastructure (roads, railways, airports, ports) and transportation safety regulations.",
+    "Ministry of Labor (or Employment)": "Focuses on employment policies, labor rights, workplace safety, and skill development.",
+    "Ministry of Energy": "Manages energy resources, policies, and sustainability efforts, including renewable energy initiatives.",
+    "Ministry of Industry and Trade": "Promotes industrial growth, international trade, export/import regulations, and support for businesses.",
+    "Ministry of Housing (or Urban Development)": "Addresses urban planning, housing development, and public infrastructure in cities and rural areas.",
+    "Ministry of Culture": "Promotes cultural heritage, arts, and national identity. Manages museums, cultural festivals, and historical preservation.",
+    "Ministry of Tourism": "Develops tourism policies, promotes the country as a travel destination, and oversees tourism infrastructure.",
+    "Ministry of Social Welfare": "Provides social services, welfare programs, poverty alleviation, and support for marginalized groups.",
+    "Ministry of Science and Technology": "Promotes scientific research, technological development, and innovation in various sectors.",
+    "Ministry of Telecommunications/IT": "Manages communication infrastructure, internet policies, and IT development strategies.",
+    "Ministry of Youth and Sports": "Focuses on youth development programs and the promotion of sports and physical activities.",
+    "Ministry of Public Works": "Manages public infrastructure projects such as roads, bridges, and government buildings.",
+    "Ministry of Immigration (or Citizenship)": "Oversees immigration, citizenship, and residency policies.",
+    "Ministry of Defense Production": "Oversees the production and procurement of military equipment and supplies (where relevant).",
+    "Ministry of Water Resources": "Manages water resources, irrigation systems, and water conservation efforts.",
+}
+
+# Slugs of the original hand-written pages that do not match a ministry name
+ALIASES = {
+    "infrastructure": "public_works",
+    "lands": "housing",
+    "technology": "science_and_technology",
+}
+
+
+class MinistryConfig(NamedTuple):
+    """Everything a ministry page needs, precomputed from the table above."""
+
+    slug: str
+    name: str
+    title: str
+    description: str
+    input_label: str
+
+
+def _short_name(name: str) -> str:
+    """"Ministry of Interior (or Home Affairs)" -> "Interior"."""
+    return re.sub(r"\s*\(.*?\)", "", name).replace("Ministry of ", "", 1).strip()
+
+
+def _lower_words(text: str) -> str:
+    """Lowercase words except acronyms such as "IT"."""
+    return "".join(part if part.isupper() else part.lower() for part in re.split(r"([ /])", text))
+
+
+def _config(name: str, description: str) -> MinistryConfig:
+    short = _short_name(name)
+    slug = re.sub(r"[^a-z0-9]+", "_", short.lower()).strip("_")
+    return MinistryConfig(
+        slug=slug,
+        name=name,
+        title=f"{short} Ministry",
+        description=description,
+        input_label=f"Describe your {_lower_words(short)}-related issue or inquiry",
+    )
+
+
+REGISTRY = {config.slug: config for config in (_config(n, d) for n, d in MINISTRIES.items())}
+_BY_NAME = {config.name: config for config in REGISTRY.values()}
+
+
+def get_config(slug: str) -> MinistryConfig:
+    """
+    Look up a ministry by slug (or one of the legacy page aliases).
+
+    Raises:
+        KeyError: If no ministry matches.
+    """
+    return REGISTRY[ALIASES.get(slug, slug)]
+
+
+def config_for_name(name: Optional[str]) -> Optional[MinistryConfig]:
+    """Look up a ministry by its full name, e.g. a router prediction."""
+    return _BY_NAME.get(name) if name else None
@@ -0,0 +1,130 @@
+"""
+Admin page with per-stage latency, cache, retry, token and cost metrics.
+
+The page shows nothing until ``ENGAGEGOV_ADMIN_TOKEN`` is set and entered;
+without it configured, access is denied. The numbers cover this app process since it started (or since
+the last reset); external job workers keep their own.
+"""
+import hmac
+import os
+import time
+
+import streamlit as st
+from helpers.image_index import get_image_index
+from helpers.metrics import get_metrics
+
+ADMIN_TOKEN = os.getenv("ENGAGEGOV_ADMIN_TOKEN")
+
+# Seconds between refreshes of the live tables
+REFRESH_INTERVAL = 5.0
+
+st.set_page_config(page_title="Metrics", layout="wide")
+st.title("📈 Service metrics")
+
+if not ADMIN_TOKEN:
+    st.error("Metrics are disabled: set ENGAGEGOV_ADMIN_TOKEN to enable this page.")
+    st.stop()
+token = st.text_input("Admin token", type="password")
+if not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+    if token:
+        st.error("Invalid token.")
+    st.stop()
+
+
+def format_ms(value) -> str:
+    return "–" if value is None else f"{value:,.0f} ms"
+
+
+@st.fragment(run_every=REFRESH_INTERVAL)
+def live_metrics():
+    snapshot = get_metrics().snapshot()
+    stages = snapshot["stages"]
+    st.caption(f"Since {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot['since']))}")
+    if not stages:
+        st.info("No calls recorded yet.")
+        return
+
+    calls = sum(s["calls"] for s in stages.values())
+    columns = st.columns(5)
+    columns[0].metric("Calls", f"{calls:,}")
+    columns[1].metric("Error rate", f"{sum(s['errors'] for s in stages.values()) / calls:.1%}")
+    columns[2].metric("Cache hit rate", f"{sum(s['cache_hits'] for s in stages.values()) / calls:.1%}")
+    columns[3].metric("Tokens", f"{sum(s['prompt_tokens'] + s['completion_tokens'] for s in stages.values()):,}")
+    columns[4].metric("Estimated cost", f"${sum(s['cost_usd'] for s in stages.values()):,.4f}")
+
+    st.subheader("Stages")
+    st.dataframe(
+        [
+            {
+                "stage": name,
+                "calls": s["calls"],
+                "errors": s["errors"],
+                "cache hits": s["cache_hits"],
+                "coalesced": s["coalesced"],
+                "retries": s["retries"],
+                "p50": format_ms(s["p50_ms"]),
+                "p95": format_ms(s["p95_ms"]),
+                "p99": format_ms(s["p99_ms"]),
+                "first chunk p50": format_ms(s["first_chunk_p50_ms"]),
+                "prompt tokens": s["prompt_tokens"],
+                "completion tokens": s["completion_tokens"],
+                "cost (USD)": round(s["cost_usd"], 6),
+            }
+            for name, s in stages.items()
+        ],
+        hide_index=True,
+        width="stretch",
+    )
+
+    st.subheader("Latency by stage")
+    st.bar_chart(
+        {
+            "p50 (ms)": {name: s["p50_ms"] for name, s in stages.items()},
+            "p95 (ms)": {name: s["p95_ms"] for name, s in stages.items()},
+        },
+        stack=False,
+    )
+
+    if snapshot["retries"]:
+        st.subheader("Upstream retries")
+        st.dataframe(
+            [{"service / reason": name, "retries": count} for name, count in snapshot["retries"].items()],
+            hide_index=True,
+        )
+
+
+live_metrics()
+
+st.subheader("Duplicate incidents")
+image_index = get_image_index()
+stats = image_index.stats()
+st.caption(f"{stats['duplicates']:,} repeat submissions across {stats['incidents']:,} image reports.")
+incidents = image_index.top(20)
+if incidents:
+    st.dataframe(
+        [
+            {
+                "report": f"#{incident.id}",
+                "submissions": incident.reports,
+                "first received": time.strftime("%Y-%m-%d %H:%M", time.localtime(incident.created_at)),
+                "last received": time.strftime("%Y-%m-%d %H:%M", time.localtime(incident.updated_at)),
+                "summary": incident.result.get("summary", "")[:200],
+            }
+            for incident in incidents
+        ],
+        hide_index=True,
+        width="stretch",
+    )
+
+metrics = get_metrics()
+st.subheader("Export")
+columns = st.columns(3)
+columns[0].download_button(
+    "Prometheus text", metrics.prometheus_text(), file_name="engagegov_metrics.prom", mime="text/plain"
+)
+columns[1].download_button(
+    "Recent calls (JSONL)", metrics.recent_jsonl(), file_name="engagegov_calls.jsonl", mime="application/x-ndjson"
+)
+if columns[2].button("Reset metrics"):
+    metrics.reset()
+    st.rerun()
@@ -0,0 +1,96 @@
+import pytest
+
+from helpers import cache as cache_module
+from helpers.cache import ResponseCache
+
+
+class Clock:
+    """Stands in for the ``time`` module with a clock the test moves."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def test_make_key_depends_on_every_part_of_the_request():
+    key = ResponseCache.make_key("model", "prompt", {"temperature": 0.7}, "payload")
+    assert key == ResponseCache.make_key("model", "prompt", {"temperature": 0.7}, b"payload")
+    assert key != ResponseCache.make_key("other", "prompt", {"temperature": 0.7}, "payload")
+    assert key != ResponseCache.make_key("model", "prompt", {"temperature": 0.2}, "payload")
+    assert key != ResponseCache.make_key("model", "prompt", {"temperature": 0.7}, "other")
+
+
+def test_memory_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(path=None, ttl=60)
+    cache.set("key", "value")
+    clock.now += 60
+    assert cache.get("key") == "value"
+    clock.now += 1
+    assert cache.get("key") is None
+    assert cache.stats()["memory_items"] == 0
+
+
+def test_disk_entries_expire_after_the_ttl(clock, tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    ResponseCache(path, ttl=60).set("key", "value")
+    clock.now += 30
+    assert ResponseCache(path, ttl=60).get("key") == "value"
+    clock.now += 31
+    cache = ResponseCache(path, ttl=60)
+    assert cache.get("key") is None
+    assert cache.stats()["disk_items"] == 0
+
+
+def test_memory_tier_evicts_the_least_recently_used(clock):
+    cache = ResponseCache(path=None, max_memory_items=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_disk_hit_refills_the_memory_tier(clock, tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_memory_items=1)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    assert cache.get("a") == "1"
+    stats = cache.stats()
+    assert (stats["hits"], stats["memory_hits"], stats["misses"]) == (2, 1, 0)
+
+
+def test_disk_tier_is_trimmed_to_its_size_least_recently_used_first(clock, tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"), max_memory_items=1, max_disk_items=10)
+    for i in range(63):
+        clock.now += 1
+        cache.set(f"key{i}", str(i))
+    clock.now += 1
+    assert cache.get("key0") == "0"
+    clock.now += 1
+    cache.set("key63", "63")  # The 64th write trims the table
+    assert cache.stats()["disk_items"] == 10
+    assert cache.get("key0") == "0"
+    assert cache.get("key1") is None
+    assert cache.get("key63") == "63"
+
+
+def test_clear_empties_both_tiers(clock, tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    cache.set("key", "value")
+    cache.get("key")
+    cache.clear()
+    stats = cache.stats()
+    assert (stats["hits"], stats["memory_items"], stats["disk_items"]) == (0, 0, 0)
+    assert cache.get("key") is None
@@ -0,0 +1,121 @@
+import pytest
+
+from helpers import rate_limit
+from helpers.rate_limit import CircuitBreaker, CircuitOpenError, TokenBucket
+
+
+class Clock:
+    """Stands in for the ``time`` module: both clocks read the same value, and sleeping advances it."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+def test_bucket_hands_out_its_burst_then_reports_the_wait(clock):
+    bucket = TokenBucket("test", rate=2.0, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity(clock):
+    bucket = TokenBucket("test", rate=2.0, capacity=3)
+    for _ in range(3):
+        bucket.try_acquire()
+    clock.now += 0.25
+    assert bucket.try_acquire() == pytest.approx(0.25)
+    clock.now += 0.25
+    assert bucket.try_acquire() == 0.0
+    clock.now += 60
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() > 0
+
+
+def test_bucket_pause_holds_every_token(clock):
+    bucket = TokenBucket("test", rate=2.0, capacity=3)
+    bucket.pause(5)
+    assert bucket.try_acquire() == pytest.approx(5)
+    clock.now += 5
+    assert bucket.try_acquire() == 0.0
+
+
+def test_acquire_sleeps_until_a_token_is_available(clock):
+    bucket = TokenBucket("test", rate=1.0, capacity=1)
+    bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept and sum(clock.slept) >= 1.0
+    assert sum(clock.slept) <= 1.1 * len(clock.slept)
+
+
+def test_shared_bucket_splits_one_quota_between_instances(clock, tmp_path):
+    path = str(tmp_path / "buckets.sqlite3")
+    first = TokenBucket("xai", rate=1.0, capacity=2, path=path)
+    second = TokenBucket("xai", rate=1.0, capacity=2, path=path)
+    assert first.try_acquire() == 0.0
+    assert second.try_acquire() == 0.0
+    assert first.try_acquire() == pytest.approx(1.0)
+    second.pause(4)
+    assert first.try_acquire() == pytest.approx(4)
+
+
+def test_breaker_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker("test", threshold=2, reset_timeout=10)
+    assert breaker.before_call() is False
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_lets_one_trial_through_when_half_open(clock):
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.state == "half-open"
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_trial_success_closes_and_failure_reopens(clock):
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.before_call() is True
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 10
+    assert breaker.before_call() is True
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.before_call() is False
+
+
+def test_breaker_end_trial_releases_it_for_another_caller(clock):
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.before_call() is True
+    breaker.end_trial()
+    assert breaker.state == "half-open"
+    assert breaker.before_call() is True
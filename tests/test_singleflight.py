@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import pytest
+
+from helpers.singleflight import FlightAbandoned, SingleFlight
+
+
+def joined_flights():
+    """A SingleFlight plus an event set each time a caller joins a flight."""
+    flights = SingleFlight()
+    joined = threading.Event()
+    join = flights.join
+
+    def join_and_signal(key):
+        flight = join(key)
+        joined.set()
+        return flight
+
+    flights.join = join_and_signal
+    return flights, joined
+
+
+def run_in_thread(fn) -> tuple:
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = fn()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, outcome
+
+
+def test_first_caller_leads_and_later_callers_follow():
+    flights = SingleFlight()
+    leader = flights.join("key")
+    follower = flights.join("key")
+    assert leader.leader and not follower.leader
+    assert len(flights) == 1
+    leader.resolve("answer")
+    assert follower.wait(1) == "answer"
+    assert len(flights) == 0
+    assert flights.join("key").leader
+
+
+def test_followers_share_the_leaders_result_from_one_call():
+    flights, joined = joined_flights()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    leader, leader_outcome = run_in_thread(lambda: flights.do("key", fetch))
+    assert joined.wait(5)
+    joined.clear()
+    follower, follower_outcome = run_in_thread(lambda: flights.do("key", fetch))
+    assert joined.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert leader_outcome == follower_outcome == {"result": "answer"}
+    assert len(calls) == 1
+
+
+def test_followers_receive_their_own_copy_of_the_leaders_exception():
+    flights = SingleFlight()
+    leader = flights.join("key")
+    follower = flights.join("key")
+    error = ValueError("upstream said no")
+    leader.fail(error)
+    with pytest.raises(ValueError, match="upstream said no") as raised:
+        follower.wait(1)
+    assert raised.value is not error
+
+
+def test_follower_of_an_abandoned_flight_makes_the_call_itself():
+    flights, joined = joined_flights()
+    leader = flights.join("key")
+    joined.clear()
+    follower, outcome = run_in_thread(lambda: flights.do("key", lambda: "own answer"))
+    assert joined.wait(5)
+    leader.fail(FlightAbandoned("key"))
+    follower.join(5)
+    assert outcome == {"result": "own answer"}
+    assert len(flights) == 0
+
+
+def test_cancelled_async_leader_abandons_the_flight():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def stalled():
+            started.set()
+            await asyncio.sleep(60)
+
+        async def answer():
+            return "follower answer"
+
+        leader = asyncio.create_task(flights.do_async("key", stalled))
+        await started.wait()
+        follower = asyncio.create_task(flights.do_async("key", answer))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.wait_for(follower, 5), len(flights)
+
+    assert asyncio.run(scenario()) == ("follower answer", 0)
@@ -0,0 +1,92 @@
+from helpers.text_budget import (
+    PAGE_BREAK,
+    count_tokens,
+    insights_budget,
+    normalize_ocr_text,
+    output_budget,
+    plan_reduce,
+    plan_summary,
+    split_into_chunks,
+    target_words,
+)
+
+
+def page(number: int, header="CITY COUNCIL", footer="Confidential") -> str:
+    body = "\n".join(f"Record {number}-{line}: Amount 500" for line in range(5))
+    return f"{header}\n{body}\n{footer}\nPage {number} of 3"
+
+
+def test_normalize_keeps_lone_numbers_on_a_single_page():
+    assert normalize_ocr_text("Total due\n15000\nPay by Friday") == "Total due\n15000\nPay by Friday"
+    assert normalize_ocr_text("Pothole outside\n42\nAllen Avenue") == "Pothole outside\n42\nAllen Avenue"
+
+
+def test_normalize_keeps_repeated_body_lines():
+    text = "Record 1\nAmount: 500\n\nRecord 2\nAmount: 500"
+    assert normalize_ocr_text(text) == "Record 1\nAmount: 500\n\nRecord 2\nAmount: 500"
+
+
+def test_normalize_strips_running_headers_footers_and_page_numbers():
+    text = PAGE_BREAK.join(page(number) for number in (1, 2, 3))
+    normalized = normalize_ocr_text(text)
+    assert normalized.count("CITY COUNCIL") == 1
+    assert normalized.count("Confidential") == 1
+    assert "Page" not in normalized
+    assert normalized.count("Amount 500") == 15
+
+
+def test_normalize_keeps_numbers_not_repeated_at_the_same_edge():
+    first = "Intro\n" + "\n".join(f"Line {i}" for i in range(6)) + "\n15000"
+    second = "Intro\n" + "\n".join(f"Line {i}" for i in range(6)) + "\nSigned"
+    assert "15000" in normalize_ocr_text(first + PAGE_BREAK + second)
+
+
+def test_normalize_cleans_ocr_noise():
+    assert normalize_ocr_text("The road is bro-\nken   here\n~~~~\n\n\n\nNext") == "The road is broken here\n\nNext"
+
+
+def test_count_tokens():
+    assert count_tokens("") == 0
+    assert count_tokens("a road.") == 3
+    assert count_tokens("123456") == 2
+    assert count_tokens("infrastructure") == 3
+
+
+def test_split_into_chunks_respects_the_budget_and_order():
+    paragraphs = [f"Paragraph {i} " + "word " * 40 for i in range(10)]
+    chunks = split_into_chunks("\n\n".join(paragraphs), max_tokens=100)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks).split() == "\n\n".join(paragraphs).split()
+
+
+def test_split_into_chunks_breaks_overlong_sentences():
+    chunks = split_into_chunks("word " * 500, max_tokens=50)
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+    assert sum(chunk.count("word") for chunk in chunks) == 500
+
+
+def test_output_budget_grows_with_the_square_root_between_floor_and_cap():
+    assert output_budget(0, floor=200, cap=500) == 200
+    assert output_budget(10_000, scale=3.0, floor=100, cap=500) == 300
+    assert output_budget(10**9, floor=200, cap=500) == 500
+    assert insights_budget("") == 300
+
+
+def test_target_words_fits_within_the_token_limit():
+    for max_tokens in (50, 200, 500, 1000):
+        assert 10 <= target_words(max_tokens) < max_tokens
+
+
+def test_plan_summary_chunks_only_long_text():
+    short = plan_summary("A short report.")
+    assert short.chunks == [] and short.text == "A short report."
+    long = plan_summary("\n\n".join("sentence " * 50 for _ in range(20)), chunk_tokens=200)
+    assert len(long.chunks) > 1
+    assert long.max_tokens >= short.max_tokens
+
+
+def test_plan_reduce_numbers_parts_in_order():
+    text, chunks = plan_reduce(["first", "second"])
+    assert text == "Part 1:\nfirst\n\nPart 2:\nsecond"
+    assert chunks == []